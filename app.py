@@ -10,10 +10,10 @@ import numpy as np
 import numpy.random as rng
 
 from sea3d.math import Vector3, Quaternion, Matrix4
-from sea3d.core import Scene, SceneObject, Mesh, Material, Behaviour, Time, Texture, TextureWrapMode, TextureFilter, Layers, KeyFrames, Animation
+from sea3d.core import Scene, SceneObject, Mesh, Material, Behaviour, Time, Texture, TextureWrapMode, TextureFilter, Layers, KeyFrames, Animation, AssetLoader, ResidencyPolicy
 from sea3d.core.components import Camera, Renderer, Animator
 
-from sea3d.opengl import GLWindow
+from sea3d.opengl import GLWindow, GLTextureAtlas
 
 # Sample a texture at pixel coordinate and return the red value normalized (height)
 def GetHeightAt(heightMap:Texture, x:float, y:float):
@@ -41,8 +41,13 @@ def AddTerrain(scene: Scene, plane: Mesh):
 
     terrainMaterial = Material("TerrainMaterial", "terrain", "terrain")
     terrainMaterial.AddTessellation("terrain", "terrain")
+    # The heightmap raises the terrain up to 30 units
+    terrainMaterial.maxDisplacement = 30
     renderer = Renderer(plane, terrainMaterial)
-    renderer.properties.SetTexture("_HeightMap", Texture.LoadFromFile("terrain/heightmap.png"))
+    heightMap = Texture.LoadFromFile("terrain/heightmap.png")
+    # Sampled on the CPU by GetHeightAt
+    heightMap.Pin()
+    renderer.properties.SetTexture("_HeightMap", heightMap)
     renderer.properties.SetTexture("_Albedo", Texture.LoadFromFile("pbr/water_stone/albedo.png"))
     renderer.properties.SetTexture("_Normal", Texture.LoadFromFile("pbr/water_stone/normal.png"))
     renderer.properties.SetTexture("_Roughness", Texture.LoadFromFile("pbr/water_stone/roughness.png"))
@@ -57,31 +62,33 @@ def GenerateVegetationMesh(referenceMesh:Mesh, size = (40, 40), count = (10, 10)
     # MESH CREATION
     # Instead of having a big number of sceneobjects, that slows down a lot the CPU,
     # we merge all similar vegetation to 1 mesh
-    # First, create an empty mesh
-    vegeMesh = Mesh(
-        vertices = np.empty((0, 3), 'f'),
-        normals = np.empty((0, 3), 'f'),
-        uvs = [np.empty((0, 2), 'f')],
-        indexes = np.empty((0, 3), 'u4'),
-        tangents = np.empty((0, 3), 'f')
-    )
-
-    # Merge meshes
-    X = np.linspace(-size[0] / 2, size[0] / 2, num = count[0])
-    Z = np.linspace(-size[1] / 2, size[1] / 2, num = count[1])
-    for x in X:
-        for z in Z:
-            # The terrain height is 30, and its size is 500 x 500
-            # We sample the height
-            y = 30 * GetHeightAt(Texture.Atlas["terrain/heightmap.png"], (0.5 + z / 500) * 1024, (0.5 + x / 500) * 1024)
-            # We translate & rotate the vegetation
-            T = Matrix4.Translate(Vector3(x, y, z))
-            R = Matrix4.Quaternion(Quaternion.Eulerf(0, rng.random() * 360, 0))
-            S = Matrix4.Scale(Vector3(rng.random() + 1.0, rng.random() + 1.0, rng.random() + 1.0) * 0.5)
-            transformMatrix = T @ R @ S
-            mesh = Mesh.Transform(referenceMesh, transformMatrix)
-            vegeMesh = Mesh.Combine(vegeMesh, mesh)
-    return vegeMesh
+    X, Z = np.meshgrid(np.linspace(-size[0] / 2, size[0] / 2, num = count[0]),
+                       np.linspace(-size[1] / 2, size[1] / 2, num = count[1]), indexing = 'ij')
+    X = X.ravel()
+    Z = Z.ravel()
+    # The terrain height is 30, and its size is 500 x 500
+    # We sample the height
+    heightMap = Texture.Atlas["terrain/heightmap.png"]
+    Y = np.array([30 * GetHeightAt(heightMap, (0.5 + z / 500) * 1024, (0.5 + x / 500) * 1024) for x, z in zip(X, Z)])
+
+    # We translate & rotate the vegetation, T @ R @ S with a random rotation around the Y axis
+    n = len(X)
+    angles = np.radians(rng.random(n) * 360)
+    scales = (rng.random((n, 3)) + 1.0) * 0.5
+    cos, sin = np.cos(angles), np.sin(angles)
+    matrices = np.zeros((n, 4, 4))
+    matrices[:, 0, 0] = cos * scales[:, 0]
+    matrices[:, 0, 2] = sin * scales[:, 2]
+    matrices[:, 1, 1] = scales[:, 1]
+    matrices[:, 2, 0] = -sin * scales[:, 0]
+    matrices[:, 2, 2] = cos * scales[:, 2]
+    matrices[:, :3, 3] = np.stack((X, Y, Z), axis = 1)
+    matrices[:, 3, 3] = 1
+
+    # Merge meshes, all the copies are written at once
+    mesh = Mesh.Replicate(referenceMesh, matrices)
+    mesh.BuildClusters()
+    return mesh
 
 
 def AddVegetation(scene: Scene, terrain:SceneObject):
@@ -134,6 +141,8 @@ def AddWater(scene: Scene, plane: Mesh):
 
     waterMaterial = Material("WaterMaterial", "water", "water")
     waterMaterial.AddTessellation("water", "water")
+    # Sum of the gerstner wave amplitudes, with some margin
+    waterMaterial.maxDisplacement = 1
     waterMaterial.renderBothFaces = True
     renderer = Renderer(plane, waterMaterial)
     renderer.properties.SetTexture("_Normal", Texture.LoadFromFile("pbr/water/normal.jpg"))
@@ -142,9 +151,32 @@ def AddWater(scene: Scene, plane: Mesh):
 
     scene.AddObject(water)
 
-def AddFishes(scene: Scene, fishes):
+def PreloadAssets(loader: AssetLoader, fishNames):
+    """ Start decoding all the assets of the scene, returns the fish meshes futures """
+    loader.LoadTexture("cubemaps/skybox", loadAsCubemap=True, fileExtension=".png")
+    loader.LoadTextures([
+        "pbr/default/ao.png", "pbr/default/normal.png", "pbr/default/roughness.png", "pbr/default/metalness.png",
+        "terrain/heightmap.png",
+        "pbr/water_stone/albedo.png", "pbr/water_stone/normal.png", "pbr/water_stone/roughness.png",
+        "pbr/water_stone/metalness.png", "pbr/water_stone/ao.png",
+        "pbr/algae/REDALGAE1.png", "pbr/algae/REDALGAE6.png",
+        "pbr/water/normal.jpg"
+    ])
+    fishMeshes = dict()
+    for fish in fishNames:
+        # Fish schools are mostly seen from far away, build a LOD chain
+        # Assimp doesn't join identical vertices, weld them before the simplification
+        fishMeshes[fish] = loader.LoadMesh("fish/" + fish + "/" + fish + ".fbx", lods = (0.5, 0.25, 0.1), weld = 0.0)
+        loader.LoadTextures(["pbr/fish/" + fish + "/albedo.png", "pbr/fish/" + fish + "/normal.png"])
+    return fishMeshes
+
+def AddFishes(scene: Scene, fishes, fishMeshes):
     for fish, descriptors in fishes.items():
-        mesh = Mesh.LoadFromFile("fish/" + fish + "/" + fish + ".fbx")[0]
+        mesh = fishMeshes[fish].result()[0]
+        # Packed normals & tangents, half float uvs
+        mesh.compactVertexFormat = True
+        # Only the GPU reads the fishes, they are mapped from Mesh.Cache again if needed
+        mesh.residencyPolicy = ResidencyPolicy.DROP_AFTER_UPLOAD
         albedo = Texture.LoadFromFile("pbr/fish/" + fish + "/albedo.png")
         normal = Texture.LoadFromFile("pbr/fish/" + fish + "/normal.png")
 
@@ -319,6 +351,22 @@ def main():
     window = GLWindow(width=1600, height=900)
     window.Init()
 
+    # TEXTURE BUDGETS
+    # Past them, the least recently drawn textures are evicted and loaded again when they are drawn
+    Texture.Residency.budget = 256 * 2**20
+    GLTextureAtlas.Budget = 512 * 2**20
+    # Same size textures share texture arrays, the renderers only switch layers
+    GLTextureAtlas.PackArrays = True
+    # BC1, BC3 & BC5 textures, encoded once and kept in Texture.Cache
+    Texture.Compress = True
+    # The texels are freed once uploaded, pinned textures excepted
+    Texture.DefaultPolicy = ResidencyPolicy.DROP_AFTER_UPLOAD
+
+    # ASSETS
+    # Everything is decoded in parallel, LoadFromFile calls below wait for the pending textures
+    loader = AssetLoader()
+    fishMeshes = PreloadAssets(loader, ("clownfish", "barracuda", "shark", "seahorse", "dorie", "yellowfish"))
+
     # SCENE
     scene = Scene("Main Scene")
     window.AttachScene(scene)
@@ -346,7 +394,9 @@ def main():
     Texture.LoadFromFile("pbr/default/ao.png")
 
     # WATER & TERRAIN
-    plane = Mesh.Plane((500, 500), (250, 250))
+    plane = Mesh.Plane((500, 500), (250, 250), dtype = np.float32)
+    # Only the visible parts of the terrain & water are drawn
+    plane.BuildClusters(256)
     AddTerrain(scene, plane)
     AddWater(scene, plane)
 
@@ -430,7 +480,8 @@ def main():
         ]
     }
                 
-    AddFishes(scene, fishes)
+    AddFishes(scene, fishes, fishMeshes)
+    loader.Shutdown()
     
     parentFish1 = scene.Find("clownfish 1")
     childFish = SceneObject("clownfish 1 child", parentFish1.transform)
@@ -512,6 +563,12 @@ def main():
 #     #pbrTest1.AddComponent(Rotator(Vector3(0, 1, 0), 30))
 #     #scene.AddObject(pbrTest1)
 
+    Mesh.Cache.Report()
+    Texture.Cache.Report()
+    Texture.ReportLoading()
+    Texture.ReportCompression()
+    Mesh.ReportWeld()
+
     print("=== SCENE ===")
     print(scene)
 
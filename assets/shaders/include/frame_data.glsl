@@ -0,0 +1,14 @@
+#ifndef FRAME_DATA_GLSL
+#define FRAME_DATA_GLSL
+
+// Per frame data, written once per frame by GLRenderPipeline.
+// The std140 layout must match GLRenderPipeline.UpdateFrameData
+layout (std140) uniform FrameData {
+    mat4 _ViewMatrix;
+    mat4 _ProjectionMatrix;
+    vec3 _ViewPos;
+    float _Time;
+    vec3 _LightPos;
+};
+
+#endif
@@ -0,0 +1,22 @@
+#ifndef TEXTURES_GLSL
+#define TEXTURES_GLSL
+
+// 2D material textures, see GLTextureAtlas.
+// The TEXTURE_ARRAYS variant reads them from texture arrays, each texture
+// is a layer of its array, given by the float uniform declared next to it.
+#ifdef TEXTURE_ARRAYS
+#define TEXTURE_2D sampler2DArray
+#define SAMPLE_2D(tex, layer, uv) texture(tex, vec3(uv, layer))
+#else
+#define TEXTURE_2D sampler2D
+#define SAMPLE_2D(tex, layer, uv) texture(tex, uv)
+#endif
+
+// Tangent space normal of a normal map texel. z is rebuilt from x & y,
+// BC5 compressed normal maps only store these two channels
+vec3 UnpackNormal(vec4 texel) {
+    vec2 xy = texel.rg * 2.0 - 1.0;
+    return vec3(xy, sqrt(max(1.0 - dot(xy, xy), 0.0)));
+}
+
+#endif
@@ -0,0 +1,41 @@
+#ifndef VERTEX_INPUT_GLSL
+#define VERTEX_INPUT_GLSL
+
+// Standard vertex attributes, see GLStdVBO.AttributeLocations
+// With COMPACT_VERTEX, the mesh is interleaved : normals and tangents are octahedral
+// encoded in 2 normalized shorts, and uvs are half floats (converted by GL)
+in vec3 InPosition;
+#ifdef COMPACT_VERTEX
+in vec2 InNormal;
+in vec2 InTangent;
+#else
+in vec3 InNormal;
+in vec3 InTangent;
+#endif
+in vec2 InTexCoord0;
+
+vec3 OctDecode(vec2 e) {
+    vec3 n = vec3(e.xy, 1.0 - abs(e.x) - abs(e.y));
+    float t = max(-n.z, 0.0);
+    n.x += n.x >= 0.0 ? -t : t;
+    n.y += n.y >= 0.0 ? -t : t;
+    return normalize(n);
+}
+
+vec3 GetNormal() {
+#ifdef COMPACT_VERTEX
+    return OctDecode(InNormal);
+#else
+    return InNormal;
+#endif
+}
+
+vec3 GetTangent() {
+#ifdef COMPACT_VERTEX
+    return OctDecode(InTangent);
+#else
+    return InTangent;
+#endif
+}
+
+#endif
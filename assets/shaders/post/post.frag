@@ -4,8 +4,7 @@ uniform sampler2D _MainTex;
 uniform sampler2D _DepthTex;
 
 uniform vec2 _ScreenSize;
-uniform float _Time;
-uniform vec3 _ViewPos;
+#include "include/frame_data.glsl"
 
 in vec2 _TexCoord;
 
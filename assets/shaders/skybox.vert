@@ -1,8 +1,7 @@
 #version 410 core
 
 uniform mat4 _ModelMatrix;
-uniform mat4 _ViewMatrix;
-uniform mat4 _ProjectionMatrix;
+#include "include/frame_data.glsl"
 
 in vec3 InPosition;
 
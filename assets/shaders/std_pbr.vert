@@ -1,15 +1,17 @@
 #version 410 core
 
-uniform mat4 _ProjectionMatrix;
-uniform mat4 _ViewMatrix;
+#include "include/frame_data.glsl"
+
+#ifdef INSTANCING
+// Per instance model matrix, streamed by GLRenderPipeline
+in mat4 InModelMatrix;
+#define _ModelMatrix InModelMatrix
+#else
 uniform mat4 _ModelMatrix;
-uniform vec3 _ViewPos;
+#endif
 
 
-in vec3 InPosition;
-in vec3 InNormal;
-in vec3 InTangent;
-in vec2 InTexCoord0;
+#include "include/vertex_input.glsl"
 
 out VertexOutput {
     vec3 Position;
@@ -21,8 +23,8 @@ out VertexOutput {
 
 void main() {
     vs_out.Position = (_ModelMatrix * vec4(InPosition, 1.0)).xyz;
-    vs_out.Normal = normalize((_ModelMatrix * vec4(InNormal, 0.0)).xyz);
-    vs_out.Tangent = normalize((_ModelMatrix * vec4(InTangent, 0.0)).xyz);
+    vs_out.Normal = normalize((_ModelMatrix * vec4(GetNormal(), 0.0)).xyz);
+    vs_out.Tangent = normalize((_ModelMatrix * vec4(GetTangent(), 0.0)).xyz);
     vs_out.TexCoord0 = InTexCoord0;
 
     gl_Position = _ProjectionMatrix * _ViewMatrix * vec4(vs_out.Position, 1.0);
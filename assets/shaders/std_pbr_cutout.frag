@@ -3,18 +3,25 @@
 out vec4 FragColor;
 
 // ==== Properties ====
-uniform sampler2D _Albedo;
-uniform sampler2D _Normal;
-uniform sampler2D _Roughness;
-uniform sampler2D _Metalness;
-uniform sampler2D _AmbientOcclusion;
+#include "include/textures.glsl"
+
+uniform TEXTURE_2D _Albedo;
+uniform float _AlbedoLayer;
+uniform TEXTURE_2D _Normal;
+uniform float _NormalLayer;
+uniform TEXTURE_2D _Roughness;
+uniform float _RoughnessLayer;
+uniform TEXTURE_2D _Metalness;
+uniform float _MetalnessLayer;
+uniform TEXTURE_2D _AmbientOcclusion;
+uniform float _AmbientOcclusionLayer;
 
 uniform samplerCube _ReflectionProbe;
 
 uniform float _AlphaCutoutThreshold = 0.5;
 
 
-uniform vec3 _ViewPos;
+#include "include/frame_data.glsl"
 
 const vec3 _WorldLightDir = normalize(vec3(-0.5, -1, -0.5));
 
@@ -71,23 +78,22 @@ vec3 GetNormal() {
 
     mat3 TBN = mat3(tangent, bitangent, normal);
 
-    vec3 sampledNormal = texture(_Normal, vs_out.TexCoord0).rgb;
-    sampledNormal = normalize(sampledNormal * 2.0 - 1.0); 
+    vec3 sampledNormal = UnpackNormal(SAMPLE_2D(_Normal, _NormalLayer, vs_out.TexCoord0));
     return TBN * sampledNormal;
 }
 
 void main() {
 
-    vec4 albedo = texture(_Albedo, vs_out.TexCoord0);
+    vec4 albedo = SAMPLE_2D(_Albedo, _AlbedoLayer, vs_out.TexCoord0);
     vec3 baseColor = albedo.rgb;
 
     if(albedo.a <= _AlphaCutoutThreshold) {
         discard;
     }
 
-    float roughness = texture(_Roughness, vs_out.TexCoord0).r;
-    float metalness = texture(_Metalness, vs_out.TexCoord0).r;
-    float ambienOcclusion = texture(_AmbientOcclusion, vs_out.TexCoord0).r;
+    float roughness = SAMPLE_2D(_Roughness, _RoughnessLayer, vs_out.TexCoord0).r;
+    float metalness = SAMPLE_2D(_Metalness, _MetalnessLayer, vs_out.TexCoord0).r;
+    float ambienOcclusion = SAMPLE_2D(_AmbientOcclusion, _AmbientOcclusionLayer, vs_out.TexCoord0).r;
 
     baseColor = GammaToLinear(baseColor);
     roughness = clamp(roughness, 0.01, 0.99);
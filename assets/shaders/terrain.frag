@@ -3,13 +3,20 @@
 out vec4 FragColor;
 
 // ==== Properties ====
-uniform sampler2D _Albedo;
-uniform sampler2D _Normal;
-uniform sampler2D _Roughness;
-uniform sampler2D _Metalness;
-uniform sampler2D _AmbientOcclusion;
+#include "include/textures.glsl"
 
-uniform vec3 _ViewPos;
+uniform TEXTURE_2D _Albedo;
+uniform float _AlbedoLayer;
+uniform TEXTURE_2D _Normal;
+uniform float _NormalLayer;
+uniform TEXTURE_2D _Roughness;
+uniform float _RoughnessLayer;
+uniform TEXTURE_2D _Metalness;
+uniform float _MetalnessLayer;
+uniform TEXTURE_2D _AmbientOcclusion;
+uniform float _AmbientOcclusionLayer;
+
+#include "include/frame_data.glsl"
 
 const vec3 _WorldLightDir = normalize(vec3(0.5, -1, 0.5));
 
@@ -68,8 +75,7 @@ vec3 GetNormal(vec2 uv) {
 
     mat3 TBN = mat3(tangent, bitangent, normal);
 
-    vec3 sampledNormal = texture(_Normal, uv).rgb;
-    sampledNormal = normalize(sampledNormal * 2.0 - 1.0); 
+    vec3 sampledNormal = UnpackNormal(SAMPLE_2D(_Normal, _NormalLayer, uv));
     return TBN * sampledNormal;
 }
 
@@ -77,10 +83,10 @@ void main() {
 
     vec2 uv = tes_out.TexCoord0 * 500.0;
 
-    vec3 baseColor = texture(_Albedo, uv).rgb;
-    float roughness = texture(_Roughness, uv).r;
-    float metalness = texture(_Metalness, uv).r;
-    float ambienOcclusion = texture(_AmbientOcclusion, uv).r;
+    vec3 baseColor = SAMPLE_2D(_Albedo, _AlbedoLayer, uv).rgb;
+    float roughness = SAMPLE_2D(_Roughness, _RoughnessLayer, uv).r;
+    float metalness = SAMPLE_2D(_Metalness, _MetalnessLayer, uv).r;
+    float ambienOcclusion = SAMPLE_2D(_AmbientOcclusion, _AmbientOcclusionLayer, uv).r;
 
     baseColor = GammaToLinear(baseColor);
     roughness = clamp(roughness, 0.01, 0.99);
@@ -1,13 +1,9 @@
 #version 410 core
 
 uniform mat4 _ModelMatrix;
-uniform mat4 _ViewMatrix;
-uniform mat4 _ProjectionMatrix;
+#include "include/frame_data.glsl"
 
-in vec3 InPosition;
-in vec3 InNormal;
-in vec3 InTangent;
-in vec2 InTexCoord0;
+#include "include/vertex_input.glsl"
 
 out VertexData {
     vec3 VertexPosition;
@@ -21,8 +17,8 @@ out VertexData {
 void main() {
     vs_out.VertexPosition = (_ModelMatrix * vec4(InPosition, 1.0)).xyz;
 
-    vs_out.VertexNormal = normalize((_ModelMatrix * vec4(InNormal, 0.0)).xyz);
-    vs_out.VertexTangeant = normalize((_ModelMatrix * vec4(InTangent, 0.0)).xyz);
+    vs_out.VertexNormal = normalize((_ModelMatrix * vec4(GetNormal(), 0.0)).xyz);
+    vs_out.VertexTangeant = normalize((_ModelMatrix * vec4(GetTangent(), 0.0)).xyz);
     vs_out.VertexBitangeant = cross(vs_out.VertexNormal, vs_out.VertexTangeant);
 
     vs_out.TexCoord0 = InTexCoord0;
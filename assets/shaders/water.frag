@@ -2,11 +2,13 @@
 
 out vec4 FragColor;
 
-uniform vec3 _ViewPos;
+#include "include/frame_data.glsl"
 
-uniform sampler2D _Normal;
+#include "include/textures.glsl"
+
+uniform TEXTURE_2D _Normal;
+uniform float _NormalLayer;
 uniform samplerCube _Skybox;
-uniform float _Time;
 
 #define WIND vec2(0.15, -0.2)
 
@@ -65,8 +67,7 @@ vec3 GetNormal() {
 
     mat3 TBN = mat3(tangent, bitangent, normal);
 
-    vec3 sampledNormal = texture(_Normal, tes_out.TexCoord0 * 125.0 - WIND * _Time).rgb;
-    sampledNormal = normalize(sampledNormal * 2.0 - 1.0); 
+    vec3 sampledNormal = UnpackNormal(SAMPLE_2D(_Normal, _NormalLayer, tes_out.TexCoord0 * 125.0 - WIND * _Time));
     return TBN * sampledNormal;
 }
 
@@ -0,0 +1,44 @@
+"""
+Mesh.ComputeTangents benchmark
+Run from the project root : python -m benchmarks.tangents
+@author: Eikins
+"""
+
+import time
+import numpy as np
+
+from sea3d.core import Mesh
+from sea3d.math import NumpyUtils
+
+def ComputeTangentsPerTriangle(mesh:Mesh, indexes):
+    """ Previous implementation, one linear system per triangle """
+    tangents = np.zeros(mesh.normals.shape)
+    for tri in indexes:
+        E = mesh.vertices[tri][1:] - mesh.vertices[tri][0]
+        dUV = mesh.uvs[0][tri][1:] - mesh.uvs[0][tri][0]
+        try:
+            T = np.linalg.solve(dUV, E)[0]
+        except np.linalg.LinAlgError:
+            T = np.array([1, 0, 0])
+        tangents[tri] += T
+    return NumpyUtils.Normalize(tangents)
+
+if __name__ == "__main__":
+    # 2 * 708 * 708 ~ 1M triangles
+    mesh = Mesh.Plane((100, 100), (708, 708))
+    triangles = len(mesh.indexes)
+
+    start = time.perf_counter()
+    mesh.ComputeTangents()
+    vectorized = time.perf_counter() - start
+
+    # The per triangle loop is far too slow for the whole mesh, extrapolate from a sample
+    sample = 20000
+    start = time.perf_counter()
+    ComputeTangentsPerTriangle(mesh, mesh.indexes[:sample])
+    loop = (time.perf_counter() - start) * triangles / sample
+
+    print("ComputeTangents on %d triangles" % triangles)
+    print("    per triangle loop : %.2f s (extrapolated from %d triangles)" % (loop, sample))
+    print("    vectorized        : %.2f s" % vectorized)
+    print("    speedup           : x%.0f" % (loop / vectorized))
@@ -1,5 +1,10 @@
 import sea3d.core.time as Time
+import sea3d.core.mesh_optimizer as MeshOptimizer
+import sea3d.core.block_compression as BlockCompression
 
+from sea3d.core.asset_cache import *
+from sea3d.core.residency import *
+from sea3d.core.bvh import *
 from sea3d.core.transform import *
 from sea3d.core.texture import *
 from sea3d.core.layer import *
@@ -7,4 +12,5 @@ from sea3d.core.scene import *
 from sea3d.core.mesh import *
 from sea3d.core.material import *
 from sea3d.core.animation import *
+from sea3d.core.asset_loader import *
 
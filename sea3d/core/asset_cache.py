@@ -0,0 +1,104 @@
+"""
+On disk asset cache
+@author: Eikins
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+class AssetCache:
+    """
+    Content addressed cache of imported assets.
+    An entry is a list of records (name -> numpy array), saved as .npy files so they can be memory mapped.
+    Keys hash the source file bytes and the import parameters, editing either invalidates the entry.
+
+    Attributes:
+        directory (str): entries are stored in directory/key/
+        hits (int)
+        misses (int)
+        lock (threading.Lock): guards the counters, entries are loaded & stored from the AssetLoader workers
+    """
+
+    Directory = ".cache/"
+    # Bump when the layout of the entries changes
+    Version = 1
+
+    def __init__(self, name:str):
+        self.name = name
+        self.directory = os.path.join(AssetCache.Directory, name)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def MakeKey(self, file:str, *parameters) -> str:
+        """ Hash of the file content and the import parameters """
+        sha = hashlib.sha1()
+        with open(file, "rb") as stream:
+            for chunk in iter(lambda: stream.read(1 << 20), b""):
+                sha.update(chunk)
+        sha.update(repr((AssetCache.Version,) + parameters).encode())
+        return sha.hexdigest()
+
+    def Load(self, key:str, mmap:bool = True):
+        """ Returns the records of an entry, or None on a cache miss """
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, "index.json"), "r") as stream:
+                index = json.load(stream)
+            records = []
+            for i, names in enumerate(index["records"]):
+                records += [{name: np.load(os.path.join(entry, "%d.%s.npy" % (i, name)), mmap_mode = "r" if mmap else None)
+                             for name in names}]
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return records
+
+    def Store(self, key:str, records:list):
+        """ Write an entry, records are dict of numpy arrays. None values are skipped """
+        entry = os.path.join(self.directory, key)
+        # Write in a temporary directory first, a crash never leaves a partial entry
+        # Each writer has its own, the same entry may be stored by several workers at once
+        temporary = None
+        try:
+            os.makedirs(self.directory, exist_ok = True)
+            temporary = tempfile.mkdtemp(prefix = key + ".", suffix = ".tmp", dir = self.directory)
+            index = []
+            for i, record in enumerate(records):
+                names = [name for name, array in record.items() if array is not None]
+                for name in names:
+                    np.save(os.path.join(temporary, "%d.%s.npy" % (i, name)), np.ascontiguousarray(record[name]))
+                index += [names]
+            with open(os.path.join(temporary, "index.json"), "w") as stream:
+                json.dump({"records": index}, stream)
+            # Move the previous entry aside first, a reader sees the old entry, the new one or a miss
+            previous = tempfile.mkdtemp(prefix = key + ".", suffix = ".old", dir = self.directory)
+            try:
+                os.replace(entry, previous)
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(previous, ignore_errors = True)
+            try:
+                os.replace(temporary, entry)
+            except OSError as exception:
+                if exception.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+                # Another writer stored the entry in between, its content is the same
+                shutil.rmtree(temporary, ignore_errors = True)
+        except OSError as exception:
+            print("Warning: could not write", entry, "in the asset cache:", exception)
+            if temporary is not None:
+                shutil.rmtree(temporary, ignore_errors = True)
+
+    def Report(self):
+        print("Asset cache (%s): %d hits, %d misses" % (self.name, self.hits, self.misses))
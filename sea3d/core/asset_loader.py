@@ -0,0 +1,103 @@
+"""
+Parallel asset loading
+@author: Eikins
+"""
+
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+from sea3d.core import Mesh, Texture
+
+class AssetLoader:
+    """
+    Decode meshes and textures on a pool of workers, every request returns a Future.
+    Requests run at the same time, loading a batch costs about as much as its slowest asset.
+    Textures being decoded are kept in Texture.Pending : a texture requested twice is decoded once,
+    and Texture.LoadFromFile waits for it instead of decoding it again.
+
+    PIL and assimp release the GIL while decoding, threads are enough in most cases.
+    With useProcesses, the Mesh.Cache hit & miss counts of the workers are not reported.
+    """
+
+    def __init__(self, workers:int = None, useProcesses:bool = False):
+        if useProcesses:
+            self.executor = ProcessPoolExecutor(max_workers = workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers = workers)
+
+    def LoadMesh(self, file:str, **kwargs) -> Future:
+        """ Future of the Mesh list, see Mesh.LoadFromFile """
+        return self.executor.submit(Mesh.LoadFromFile, file, **kwargs)
+
+    def LoadMeshes(self, files) -> list:
+        return [self.LoadMesh(file) for file in files]
+
+    def LoadTexture(self, location:str, loadAsCubemap=False, fileExtension=None) -> Future:
+        """ Future of the Texture, registered in Texture.Atlas once decoded """
+        if location in Texture.Atlas:
+            future = Future()
+            future.set_result(Texture.Atlas[location])
+            return future
+
+        if location in Texture.Pending:
+            return Texture.Pending[location]
+
+        future = Future()
+        Texture.Pending[location] = future
+        if loadAsCubemap:
+            # The cubemap faces are decoded in parallel too
+            decodes = [self.executor.submit(Texture.DecodeLevels, file, "RGB", False)
+                       for file in Texture.GetFiles(location, loadAsCubemap, fileExtension)]
+        else:
+            # Decoded and block compressed by the worker
+            decodes = [self.executor.submit(Texture.LoadLevels, location)]
+
+        def Register(levels):
+            if loadAsCubemap:
+                future.set_result(Texture.Register(location, [face[0] for face in levels], True, None, fileExtension))
+            else:
+                data, mips, compression, blocks = levels[0]
+                future.set_result(Texture.Register(location, data, False, mips, None, compression, blocks))
+
+        def Fail(exception):
+            future.set_exception(exception)
+
+        self.Gather(decodes, Register, Fail, lambda: Texture.Pending.pop(location, None))
+        return future
+
+    def LoadTextures(self, locations) -> list:
+        return [self.LoadTexture(location) for location in locations]
+
+    def Shutdown(self, wait:bool = True):
+        self.executor.shutdown(wait = wait)
+
+    @staticmethod
+    def Gather(futures:list, onSuccess, onError, onDone):
+        """
+        Once every future is done, call onSuccess with the results or onError with the first exception, then onDone.
+        An exception raised by onSuccess is passed to onError.
+        """
+        lock = threading.Lock()
+        remaining = [len(futures)]
+
+        def Done(_future):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            try:
+                if errors:
+                    onError(errors[0])
+                else:
+                    try:
+                        onSuccess([f.result() for f in futures])
+                    except Exception as exception:
+                        # Raised in a done callback, it would only be logged by concurrent.futures
+                        onError(exception)
+            finally:
+                onDone()
+
+        for future in futures:
+            future.add_done_callback(Done)
@@ -0,0 +1,217 @@
+"""
+Block compressed texture encoders : BC1 (DXT1), BC3 (DXT5) & BC5 (RGTC2)
+Formats : Khronos Data Format Specification, S3TC & RGTC sections
+Endpoints : principal axis fit refined by least squares, as in squish & stb_dxt
+@author: Eikins
+"""
+
+import numpy as np
+
+# Bytes of a 4x4 block
+BlockBytes = {"BC1": 8, "BC3": 16, "BC5": 16}
+# Channels a format keeps, the PSNR is measured on them
+Channels = {"BC1": 3, "BC3": 4, "BC5": 2}
+# Blocks encoded at once, bounds the temporary arrays
+ChunkSize = 16384
+
+def GetBlocks(data):
+    """ Split (H, W, C) texels in (H/4, W/4, 16, C) blocks, the last row & column are repeated up to a multiple of 4 """
+    data = np.asarray(data)
+    data = data.reshape(data.shape[0], data.shape[1], -1)
+    height, width = data.shape[0:2]
+    data = np.pad(data, ((0, -height % 4), (0, -width % 4), (0, 0)), mode = "edge")
+    blocksY, blocksX = data.shape[0] // 4, data.shape[1] // 4
+    blocks = data.reshape(blocksY, 4, blocksX, 4, -1).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(blocksY, blocksX, 16, -1)
+
+def SetBlocks(blocks, height:int, width:int):
+    """ Inverse of GetBlocks, returns (height, width, C) texels """
+    blocksY, blocksX = blocks.shape[0:2]
+    data = blocks.reshape(blocksY, blocksX, 4, 4, -1).transpose(0, 2, 1, 3, 4)
+    return data.reshape(blocksY * 4, blocksX * 4, -1)[:height, :width]
+
+def Encode(data, compression:str):
+    """
+    Encode uint8 (H, W, C) texels, returns the uint8 (H/4, W/4, BlockBytes) blocks, in GL upload order.
+    BC1 keeps RGB, BC3 RGBA, BC5 RG. Missing channels are read as opaque white.
+    """
+    blocks = GetBlocks(data)
+    blocksY, blocksX = blocks.shape[0:2]
+    blocks = blocks.reshape(-1, 16, blocks.shape[3])
+    if blocks.shape[2] < 4:
+        padding = np.full(blocks.shape[:2] + (4 - blocks.shape[2],), 255, blocks.dtype)
+        blocks = np.concatenate((blocks, padding), axis = 2)
+
+    encoded = np.empty((len(blocks), BlockBytes[compression]), np.uint8)
+    for first in range(0, len(blocks), ChunkSize):
+        chunk = blocks[first:first + ChunkSize].astype(np.float32)
+        if compression == "BC1":
+            encoded[first:first + ChunkSize] = EncodeColorBlocks(chunk[..., :3])
+        elif compression == "BC3":
+            encoded[first:first + ChunkSize, :8] = EncodeAlphaBlocks(chunk[..., 3])
+            encoded[first:first + ChunkSize, 8:] = EncodeColorBlocks(chunk[..., :3])
+        elif compression == "BC5":
+            encoded[first:first + ChunkSize, :8] = EncodeAlphaBlocks(chunk[..., 0])
+            encoded[first:first + ChunkSize, 8:] = EncodeAlphaBlocks(chunk[..., 1])
+        else:
+            raise ValueError("Unknown block compression " + str(compression))
+    return encoded.reshape(blocksY, blocksX, -1)
+
+def Decode(encoded, compression:str, height:int, width:int):
+    """ Decode (H/4, W/4, BlockBytes) blocks to uint8 (height, width, 4) texels, BC5 blue is 0 """
+    encoded = np.asarray(encoded, np.uint8)
+    blocksY, blocksX = encoded.shape[0:2]
+    encoded = encoded.reshape(-1, BlockBytes[compression])
+    texels = np.full((len(encoded), 16, 4), 255, np.uint8)
+    if compression == "BC1":
+        texels[...] = DecodeColorBlocks(encoded)
+    elif compression == "BC3":
+        texels[..., :3] = DecodeColorBlocks(encoded[:, 8:], alwaysOpaque = True)[..., :3]
+        texels[..., 3] = DecodeAlphaBlocks(encoded[:, :8])
+    elif compression == "BC5":
+        texels[..., 0] = DecodeAlphaBlocks(encoded[:, :8])
+        texels[..., 1] = DecodeAlphaBlocks(encoded[:, 8:])
+        texels[..., 2] = 0
+    else:
+        raise ValueError("Unknown block compression " + str(compression))
+    return SetBlocks(texels.reshape(blocksY, blocksX, 16, 4), height, width)
+
+def PSNR(original, decoded) -> float:
+    """ Peak signal to noise ratio in dB of uint8 data, inf if both are identical """
+    error = np.mean((np.asarray(original, np.float64) - np.asarray(decoded, np.float64)) ** 2)
+    return np.inf if error == 0 else float(10 * np.log10(255 ** 2 / error))
+
+def To565(colors):
+    """ Quantize float RGB to 5:6:5, returns the uint16 colors """
+    colors = np.clip(np.round(colors * (np.array([31, 63, 31], np.float32) / 255)), 0, [31, 63, 31]).astype(np.uint16)
+    return (colors[..., 0] << 11) | (colors[..., 1] << 5) | colors[..., 2]
+
+def From565(colors):
+    """ Expand uint16 5:6:5 colors to int32 RGB, replicating the high bits as GPUs do """
+    colors = np.asarray(colors, np.int32)
+    r, g, b = (colors >> 11) & 31, (colors >> 5) & 63, colors & 31
+    return np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis = -1)
+
+def ColorPalette(color0, color1):
+    """ (N, 4, 3) 4 color mode palette of 5:6:5 endpoints, indices 2 & 3 at 1/3 and 2/3 """
+    c0, c1 = From565(color0), From565(color1)
+    return np.stack((c0, c1, (2 * c0 + c1) // 3, (c0 + 2 * c1) // 3), axis = 1)
+
+def NearestIndices(values, palette):
+    """ Index of the closest palette entry of each texel, values (N, 16, C) & palette (N, P, C) """
+    best = np.zeros(values.shape[:2], np.int64)
+    bestError = np.full(values.shape[:2], np.inf, np.float32)
+    for index in range(palette.shape[1]):
+        error = np.sum((values - palette[:, None, index].astype(np.float32)) ** 2, axis = -1)
+        closer = error < bestError
+        best[closer] = index
+        bestError[closer] = error[closer]
+    return best, bestError.sum(axis = 1)
+
+def EncodeColorBlocks(colors, iterations:int = 2):
+    """
+    BC1 color blocks of float (N, 16, 3) colors, returns (N, 8) bytes in the 4 color mode.
+    The endpoints start at the extent of the colors along their principal axis, then each iteration
+    solves the least squares endpoints of the current indices and keeps them if the error is lower.
+    """
+    mean = colors.mean(axis = 1)
+    centered = colors - mean[:, None]
+    covariance = np.einsum('nki,nkj->nij', centered, centered)
+    axis = np.ones((len(colors), 3), np.float32)
+    for _ in range(8):
+        axis = np.einsum('nij,nj->ni', covariance, axis)
+        axis /= np.maximum(np.abs(axis).max(axis = 1, keepdims = True), 1e-20)
+    axis /= np.maximum(np.linalg.norm(axis, axis = 1, keepdims = True), 1e-20)
+    projections = np.einsum('nki,ni->nk', centered, axis)
+    start = mean + projections.max(axis = 1)[:, None] * axis
+    end = mean + projections.min(axis = 1)[:, None] * axis
+
+    color0, color1 = To565(start), To565(end)
+    indices, error = NearestIndices(colors, ColorPalette(color0, color1))
+
+    # Weights of the endpoints for each index
+    weights0 = np.array([1, 0, 2 / 3, 1 / 3], np.float32)
+    for _ in range(iterations):
+        w0 = weights0[indices]
+        w1 = 1 - w0
+        a, b, c = np.sum(w0 * w0, axis = 1), np.sum(w0 * w1, axis = 1), np.sum(w1 * w1, axis = 1)
+        x = np.einsum('nk,nki->ni', w0, colors)
+        y = np.einsum('nk,nki->ni', w1, colors)
+        determinant = a * c - b * b
+        solvable = np.abs(determinant) > 1e-6
+        determinant[~solvable] = 1
+        refined0 = (c[:, None] * x - b[:, None] * y) / determinant[:, None]
+        refined1 = (a[:, None] * y - b[:, None] * x) / determinant[:, None]
+        refined0, refined1 = To565(refined0), To565(refined1)
+        refinedIndices, refinedError = NearestIndices(colors, ColorPalette(refined0, refined1))
+        better = solvable & (refinedError < error)
+        color0[better], color1[better] = refined0[better], refined1[better]
+        indices[better], error[better] = refinedIndices[better], refinedError[better]
+
+    # The 4 color mode needs color0 > color1, swapping them swaps indices 0 & 1, 2 & 3
+    swap = color0 < color1
+    color0[swap], color1[swap] = color1[swap], color0[swap]
+    indices[swap] ^= 1
+    # Equal endpoints select the 3 color mode, where index 3 is black
+    indices[color0 == color1] = 0
+
+    encoded = np.empty((len(colors), 8), np.uint8)
+    encoded[:, 0:2] = color0.astype('<u2').view(np.uint8).reshape(-1, 2)
+    encoded[:, 2:4] = color1.astype('<u2').view(np.uint8).reshape(-1, 2)
+    bits = np.sum(indices.astype(np.uint32) << (2 * np.arange(16, dtype = np.uint32)), axis = 1, dtype = np.uint32)
+    encoded[:, 4:8] = bits.astype('<u4').view(np.uint8).reshape(-1, 4)
+    return encoded
+
+def DecodeColorBlocks(encoded, alwaysOpaque:bool = False):
+    """ (N, 16, 4) uint8 texels of (N, 8) BC1 blocks, BC3 color blocks are alwaysOpaque (4 color mode) """
+    color0 = encoded[:, 0:2].copy().view('<u2')[:, 0]
+    color1 = encoded[:, 2:4].copy().view('<u2')[:, 0]
+    bits = encoded[:, 4:8].copy().view('<u4')[:, 0]
+    indices = (bits[:, None] >> (2 * np.arange(16, dtype = np.uint32))) & 3
+
+    palette = np.full((len(encoded), 4, 4), 255, np.int32)
+    palette[:, :, :3] = ColorPalette(color0, color1)
+    threeColors = (color0 <= color1) & (not alwaysOpaque)
+    c0, c1 = From565(color0[threeColors]), From565(color1[threeColors])
+    palette[threeColors, 2, :3] = (c0 + c1) // 2
+    palette[threeColors, 3] = 0
+    return np.take_along_axis(palette, indices[:, :, None].astype(np.int64), axis = 1).astype(np.uint8)
+
+def AlphaPalette(alpha0, alpha1):
+    """ (N, 8) 8 value palette of alpha0 > alpha1, the 6 interpolated values are rounded """
+    alpha0, alpha1 = np.asarray(alpha0, np.int32)[:, None], np.asarray(alpha1, np.int32)[:, None]
+    steps = np.arange(1, 7, dtype = np.int32)
+    interpolated = ((7 - steps) * alpha0 + steps * alpha1 + 3) // 7
+    return np.concatenate((alpha0, alpha1, interpolated), axis = 1)
+
+def EncodeAlphaBlocks(values):
+    """ BC4 blocks of float (N, 16) values (BC3 alpha, BC5 channels), returns (N, 8) bytes """
+    alpha0 = np.round(values.max(axis = 1)).astype(np.uint8)
+    alpha1 = np.round(values.min(axis = 1)).astype(np.uint8)
+    indices, _ = NearestIndices(values[..., None], AlphaPalette(alpha0, alpha1)[..., None])
+    # Constant blocks would select the 6 value mode
+    indices[alpha0 == alpha1] = 0
+
+    encoded = np.empty((len(values), 8), np.uint8)
+    encoded[:, 0] = alpha0
+    encoded[:, 1] = alpha1
+    bits = np.sum(indices.astype(np.uint64) << (3 * np.arange(16, dtype = np.uint64)), axis = 1, dtype = np.uint64)
+    encoded[:, 2:8] = bits.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :6]
+    return encoded
+
+def DecodeAlphaBlocks(encoded):
+    """ (N, 16) uint8 values of (N, 8) BC4 blocks """
+    alpha0, alpha1 = encoded[:, 0].astype(np.int32), encoded[:, 1].astype(np.int32)
+    bits = np.zeros((len(encoded), 8), np.uint8)
+    bits[:, :6] = encoded[:, 2:8]
+    bits = bits.view('<u8')[:, 0]
+    indices = (bits[:, None] >> (3 * np.arange(16, dtype = np.uint64))) & 7
+
+    palette = AlphaPalette(alpha0, alpha1)
+    # alpha0 <= alpha1 : 4 interpolated values, then 0 & 255
+    sixValues = alpha0 <= alpha1
+    steps = np.arange(1, 5, dtype = np.int32)
+    palette[sixValues, 2:6] = ((5 - steps) * alpha0[sixValues, None] + steps * alpha1[sixValues, None] + 2) // 5
+    palette[sixValues, 6] = 0
+    palette[sixValues, 7] = 255
+    return np.take_along_axis(palette, indices.astype(np.int64), axis = 1).astype(np.uint8)
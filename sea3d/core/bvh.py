@@ -0,0 +1,219 @@
+"""
+Bounding volume hierarchy of mesh triangles, used for ray queries
+SAH : Wald, On fast Construction of SAH-based Bounding Volume Hierarchies (2007)
+@author: Eikins
+"""
+
+import numpy as np
+
+class BVH:
+    """
+    Binned SAH hierarchy of the triangles of a mesh, flattened in numpy arrays.
+    The two children of an inner node are stored next to each other.
+    Rays are traced in batches : every traversal step tests all the (ray, node) pairs at once.
+
+    Attributes:
+        boundsMin, boundsMax: float[N, 3] node bounds
+        children: int[N] first child of inner nodes, -1 for leaves
+        starts, counts: int[N] triangle range of leaves in triangles
+        triangles: int[T] triangle indices, sorted by leaf
+    """
+
+    # Nodes are split above LeafSize triangles, and always above MaxLeafSize
+    LeafSize = 4
+    MaxLeafSize = 16
+    Bins = 12
+    # Cost of a traversal step relative to a triangle test
+    TraversalCost = 1.0
+
+    def __init__(self, vertices, indexes):
+        vertices = np.asarray(vertices, np.float64).reshape(-1, 3)
+        corners = vertices[np.asarray(indexes).reshape(-1, 3)]
+        self.boundsMin, self.boundsMax, self.children, self.starts, self.counts, self.triangles = BVH.Build(corners)
+        # Triangle data in leaf order, for the ray tests
+        corners = corners[self.triangles]
+        self.v0 = corners[:, 0]
+        self.e1 = corners[:, 1] - corners[:, 0]
+        self.e2 = corners[:, 2] - corners[:, 0]
+
+    def GetNodeCount(self) -> int:
+        return len(self.children)
+
+    def GetDepth(self) -> int:
+        depth, level = 0, np.zeros(1, np.int64)
+        while len(level):
+            depth += 1
+            inner = level[self.children[level] >= 0]
+            level = np.concatenate((self.children[inner], self.children[inner] + 1))
+        return depth
+
+    @staticmethod
+    def Build(corners:np.ndarray):
+        """ Build the hierarchy of (T, 3, 3) triangle corners, returns the flattened arrays """
+        triangleMin = corners.min(axis = 1)
+        triangleMax = corners.max(axis = 1)
+        centroids = (triangleMin + triangleMax) / 2
+
+        boundsMin, boundsMax, children, starts, counts = [], [], [], [], []
+        # The triangles of a node are contiguous in triangles
+        triangles = np.arange(len(corners))
+
+        def AddNode(start, count):
+            members = triangles[start:start + count]
+            boundsMin.append(triangleMin[members].min(axis = 0) if count else np.zeros(3))
+            boundsMax.append(triangleMax[members].max(axis = 0) if count else np.zeros(3))
+            children.append(-1)
+            starts.append(start)
+            counts.append(count)
+            return len(children) - 1
+
+        stack = [AddNode(0, len(corners))]
+        while stack:
+            node = stack.pop()
+            start, count = starts[node], counts[node]
+            if count <= BVH.LeafSize:
+                continue
+            members = triangles[start:start + count]
+            split = BVH.FindSplit(triangleMin[members], triangleMax[members], centroids[members], boundsMin[node], boundsMax[node])
+            if split is None:
+                continue
+            left = members[split]
+            triangles[start:start + count] = np.concatenate((left, members[~split]))
+            children[node] = AddNode(start, len(left))
+            AddNode(start + len(left), count - len(left))
+            stack += [children[node], children[node] + 1]
+
+        return (np.array(boundsMin), np.array(boundsMax), np.array(children, np.int64),
+                np.array(starts, np.int64), np.array(counts, np.int64), triangles)
+
+    @staticmethod
+    def FindSplit(triangleMin, triangleMax, centroids, nodeMin, nodeMax):
+        """
+        Evaluate the surface area heuristic on Bins planes of each axis.
+        Returns the mask of the triangles going to the left child, None if a leaf is cheaper.
+        """
+        count = len(centroids)
+        centroidMin = centroids.min(axis = 0)
+        extent = centroids.max(axis = 0) - centroidMin
+        leafCost = count * BVH.SurfaceArea(nodeMin, nodeMax)
+        bestCost, best = np.inf, None
+
+        for axis in np.flatnonzero(extent > 0):
+            bins = np.minimum((BVH.Bins * (centroids[:, axis] - centroidMin[axis]) / extent[axis]).astype(np.int64), BVH.Bins - 1)
+            binCounts = np.bincount(bins, minlength = BVH.Bins)
+            binMin = np.full((BVH.Bins, 3), np.inf)
+            binMax = np.full((BVH.Bins, 3), -np.inf)
+            np.minimum.at(binMin, bins, triangleMin)
+            np.maximum.at(binMax, bins, triangleMax)
+
+            # Left side of the plane after bin i, right side of the plane before bin i
+            leftCounts = np.cumsum(binCounts)[:-1]
+            leftAreas = BVH.SurfaceArea(np.minimum.accumulate(binMin)[:-1], np.maximum.accumulate(binMax)[:-1])
+            rightAreas = BVH.SurfaceArea(np.minimum.accumulate(binMin[::-1])[::-1][1:], np.maximum.accumulate(binMax[::-1])[::-1][1:])
+            with np.errstate(invalid = "ignore"):
+                costs = leftCounts * leftAreas + (count - leftCounts) * rightAreas
+            costs[(leftCounts == 0) | (leftCounts == count)] = np.inf
+            plane = int(np.argmin(costs))
+            if costs[plane] < bestCost:
+                bestCost, best = costs[plane], bins <= plane
+
+        if best is not None and BVH.TraversalCost * BVH.SurfaceArea(nodeMin, nodeMax) + bestCost < leafCost:
+            return best
+        if count <= BVH.MaxLeafSize:
+            return None
+        if best is None:
+            # Stacked centroids, split in halves so the leaves stay small
+            best = np.zeros(count, bool)
+            best[:count // 2] = True
+        return best
+
+    @staticmethod
+    def SurfaceArea(boundsMin, boundsMax):
+        size = np.maximum(np.asarray(boundsMax) - boundsMin, 0)
+        return 2 * (size[..., 0] * size[..., 1] + size[..., 1] * size[..., 2] + size[..., 2] * size[..., 0])
+
+    def Raycast(self, origin, direction, maxDistance:float = np.inf):
+        """ Returns the (distance, triangle, u, v) of the closest hit along origin + t * direction, None if missed """
+        distances, triangles, u, v = self.RaycastMany(np.reshape(origin, (1, 3)), np.reshape(direction, (1, 3)), maxDistance)
+        if triangles[0] < 0:
+            return None
+        return distances[0], triangles[0], u[0], v[0]
+
+    def RaycastMany(self, origins, directions, maxDistances = np.inf):
+        """
+        Trace (R, 3) rays, distances are in direction units.
+        Returns the closest (distances, triangles, u, v), inf and -1 for the rays that missed.
+        """
+        origins = np.asarray(origins, np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, np.float64).reshape(-1, 3)
+        rayCount = len(origins)
+        distances = np.array(np.broadcast_to(maxDistances, rayCount), np.float64)
+        triangles = np.full(rayCount, -1, np.int64)
+        u = np.zeros(rayCount)
+        v = np.zeros(rayCount)
+        if rayCount == 0 or len(self.triangles) == 0:
+            return distances, triangles, u, v
+
+        # Large instead of infinite, an infinity times 0 on a slab plane is nan
+        inverse = 1 / np.where(np.abs(directions) < 1e-30, 1e-30, directions)
+
+        rays = np.arange(rayCount)
+        nodes = np.zeros(rayCount, np.int64)
+        while len(rays):
+            # Slab test
+            t0 = (self.boundsMin[nodes] - origins[rays]) * inverse[rays]
+            t1 = (self.boundsMax[nodes] - origins[rays]) * inverse[rays]
+            near = np.maximum(np.minimum(t0, t1).max(axis = 1), 0)
+            far = np.minimum(np.maximum(t0, t1).min(axis = 1), distances[rays])
+            hit = near <= far
+            rays, nodes = rays[hit], nodes[hit]
+
+            leaves = self.children[nodes] < 0
+            self.IntersectLeaves(rays[leaves], nodes[leaves], origins, directions, distances, triangles, u, v)
+
+            inner = ~leaves
+            firstChild = self.children[nodes[inner]]
+            rays = np.concatenate((rays[inner], rays[inner]))
+            nodes = np.concatenate((firstChild, firstChild + 1))
+
+        missed = triangles < 0
+        distances[missed] = np.inf
+        triangles[~missed] = self.triangles[triangles[~missed]]
+        return distances, triangles, u, v
+
+    def IntersectLeaves(self, rays, nodes, origins, directions, distances, triangles, u, v):
+        """ Moller-Trumbore test of the (ray, leaf) pairs, keeps the closest hits of each ray """
+        counts = self.counts[nodes]
+        rays = np.repeat(rays, counts)
+        if len(rays) == 0:
+            return
+        # Triangle range of each pair : start + 0..count-1
+        offsets = np.arange(len(rays)) - np.repeat(np.cumsum(counts) - counts, counts)
+        tris = np.repeat(self.starts[nodes], counts) + offsets
+
+        d = directions[rays]
+        e1, e2 = self.e1[tris], self.e2[tris]
+        p = np.cross(d, e2)
+        det = np.sum(e1 * p, axis = 1)
+        valid = np.abs(det) > 1e-12
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            inverseDet = 1 / det
+            s = origins[rays] - self.v0[tris]
+            b1 = np.sum(s * p, axis = 1) * inverseDet
+            q = np.cross(s, e1)
+            b2 = np.sum(d * q, axis = 1) * inverseDet
+            t = np.sum(e2 * q, axis = 1) * inverseDet
+        valid &= (b1 >= 0) & (b2 >= 0) & (b1 + b2 <= 1) & (t >= 0) & (t < distances[rays])
+        if not np.any(valid):
+            return
+
+        rays, tris, t, b1, b2 = rays[valid], tris[valid], t[valid], b1[valid], b2[valid]
+        # Closest hit of each ray, first of its run once sorted by (ray, t)
+        order = np.lexsort((t, rays))
+        rays, tris, t, b1, b2 = rays[order], tris[order], t[order], b1[order], b2[order]
+        first = np.concatenate(([True], rays[1:] != rays[:-1]))
+        rays, tris, t, b1, b2 = rays[first], tris[first], t[first], b1[first], b2[first]
+        distances[rays] = t
+        triangles[rays] = tris
+        u[rays] = b1
+        v[rays] = b2
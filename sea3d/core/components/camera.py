@@ -7,6 +7,7 @@ from enum import Enum
 import numpy as np
 
 from sea3d.core import Component, Layers, Texture
+from sea3d.math import NumpyUtils
 
 # TODO : Add Orthogonal camera support
 class Camera(Component):
@@ -22,7 +23,13 @@ class Camera(Component):
         self._near = near
         self._far = far
         self.__changed = True
+        self._projectionVersion = 0
         self._Projection = self.GetProjectionMatrix()
+        # View projection & frustum planes, and the (transform, projection) versions they were computed from
+        self._ViewProjection = None
+        self._frustumPlanes = None
+        self.__viewProjectionVersion = None
+        self.__frustumVersion = None
         self._renderingLayer = Layers.ALL
         self._skybox = None
 
@@ -69,8 +76,47 @@ class Camera(Component):
                                          [  0, m11,   0,   0],
                                          [  0,   0, m22, m23],
                                          [  0,   0,  1,   0]], 'f')
+            self.__changed = False
+            self._projectionVersion += 1
 
         return self._Projection
+
+    def GetViewMatrix(self):
+        """ World to camera matrix, cached by the camera transform """
+        return self.object.transform.GetInverseTRSMatrix()
+
+    def GetViewProjectionMatrix(self):
+        """ Projection @ View, rebuilt only when the projection or the camera transform changed """
+        view = self.GetViewMatrix()
+        projection = self.GetProjectionMatrix()
+        version = (self.object.transform._version, self._projectionVersion)
+        if self.__viewProjectionVersion != version:
+            self._ViewProjection = projection @ view
+            self.__viewProjectionVersion = version
+        return self._ViewProjection
+
+    def ViewportPointToRay(self, x:float, y:float):
+        """
+        World space (origin, direction) of the ray through a viewport point, (0, 0) bottom left & (1, 1) top right.
+        Use it with Scene.Raycast for mouse picking.
+        """
+        projection = self.GetProjectionMatrix()
+        # The camera looks along +z in view space
+        direction = np.array([(2 * x - 1) / projection[0, 0], (2 * y - 1) / projection[1, 1], 1.0])
+        model = self.object.transform.GetTRSMatrix()
+        direction = NumpyUtils.Normalize(model[:3, :3] @ direction)
+        return np.array(model[:3, 3], np.float64), direction
+
+    def GetFrustumPlanes(self):
+        """
+        World space frustum planes (6, 4) : left, right, bottom, top and the two depth planes.
+        They are recomputed only when the projection or the camera transform changed.
+        """
+        viewProjection = self.GetViewProjectionMatrix()
+        if self.__frustumVersion != self.__viewProjectionVersion:
+            self._frustumPlanes = NumpyUtils.FrustumPlanes(viewProjection)
+            self.__frustumVersion = self.__viewProjectionVersion
+        return self._frustumPlanes
     
 
     
\ No newline at end of file
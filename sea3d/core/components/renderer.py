@@ -16,7 +16,20 @@ class Renderer(Component):
             self.properties = PropertyBlock()
         else:
             self.properties = propertyBlock
+        # LOD i + 1 is used when the mesh covers less than lodThresholds[i] of the screen height
+        self.lodThresholds = (0.25, 0.1, 0.04)
+        self.lod = 0
+
+    def SelectLOD(self, screenSize:float) -> int:
+        """ Pick the LOD from the projected bounding sphere diameter, as a fraction of the screen height """
+        lod = 0
+        while lod < len(self.lodThresholds) and screenSize < self.lodThresholds[lod]:
+            lod += 1
+        self.lod = min(lod, self.mesh.GetLODCount() - 1)
+        return self.lod
 
     def Copy(self):
         """ Copy the renderer, but be careful, they share the same model and property block ! """
-        return Renderer(self.mesh, self.material, self.properties)
\ No newline at end of file
+        renderer = Renderer(self.mesh, self.material, self.properties)
+        renderer.lodThresholds = self.lodThresholds
+        return renderer
\ No newline at end of file
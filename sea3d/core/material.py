@@ -20,6 +20,8 @@ class Material:
         self.tessellationEvaluation = ""
         self.renderBothFaces = False
         self.orderInQueue = orderInQueue
+        # Largest distance the shaders move a vertex, None if unknown : the renderers are never culled
+        self.maxDisplacement = None
 
     def AddTessellation(self, control:str, evaluation:str):
         """
@@ -32,6 +34,12 @@ class Material:
         self.tessellationControl = control
         self.tessellationEvaluation = evaluation
 
+    def GetCullingPadding(self):
+        """ Radius added to the bounding spheres, None if the material can't be culled """
+        if self.useTessellation or self.maxDisplacement is not None:
+            return self.maxDisplacement
+        return 0.0
+
     def __hash__(self):
         return hash(self.name)
 
@@ -11,66 +11,346 @@ import numpy as np
 import assimpcy.all as assimpcy
 
 from sea3d.math import NumpyUtils, Matrix4
+from sea3d.core import AssetCache, MeshOptimizer, BVH, ResidencyPolicy
 
 class Mesh:
     """
+    Cache (AssetCache): imported meshes, LoadFromFile skips assimp on a hit
+
     Attributes:
         vertices: float[]
         normals: float[]
         uvs: float[8][]
         indexes: int[]
+
+        compactVertexFormat: upload packed normals & tangents and half float uvs, the shaders must
+                             include vertex_input.glsl (COMPACT_VERTEX variant)
+        lods: index buffers of the simplified LODs 1..n, sharing the vertices of LOD 0
+        lodErrors: simplification error of each LOD, relative to the bounding sphere radius
+        clusterOffsets: int[C + 1] cluster i owns the LOD 0 triangles clusterOffsets[i] to clusterOffsets[i + 1], see BuildClusters
+        clusterSpheres: float[C, 4] cluster bounding spheres, center & radius
+        clusterCones: float[C, 4] cluster normal cones, axis & cutoff
+
+        residencyPolicy (ResidencyPolicy): applied by GLStdVBO after the upload. Only the meshes loaded through
+                                           Mesh.Cache can be dropped or mapped, the others are kept
+        pinned (bool): the vertex data stays in memory, whatever the policy
+        source: (Mesh.Cache key, record) the mesh can be loaded again from, see Acquire
+
+        _bounds: cached (min, max) axis aligned bounding box
+        _sphere: cached (center, radius) bounding sphere
+        _bvh: cached triangle BVH, built by the first ray query
     """
 
+    Cache = AssetCache("meshes")
+    # Policy of the new meshes
+    DefaultPolicy = ResidencyPolicy.KEEP
+    # Vertex counts of the meshes welded by this process, see Weld
+    WeldStatistics = {"meshes": 0, "before": 0, "after": 0}
+
     def __init__(self, vertices, normals, uvs, indexes, tangents = None):
         self.vertices = vertices
         self.normals = normals
         self.uvs = uvs
         self.indexes = indexes
         self.tangents = tangents
+        self.compactVertexFormat = False
+        self.lods = []
+        self.lodErrors = []
+        self.clusterOffsets = None
+        self.clusterSpheres = None
+        self.clusterCones = None
+        self.residencyPolicy = Mesh.DefaultPolicy
+        self.pinned = False
+        self.source = None
+        self._bounds = None
+        self._sphere = None
+        self._bvh = None
         # Removed bitangeants, it's faster to compute the cross product in GLSL
         # Than doing the model mat multiplication on an attribute and then normalize
         #self.bitangeants = bitangeants
     
+    def RecalculateBounds(self):
+        """ Recompute the bounds, call this after modifying the vertices """
+        self._bvh = None
+        vertices = np.asarray(self.vertices, np.float64).reshape(-1, 3)
+        if len(vertices) == 0:
+            self._bounds = (np.zeros(3), np.zeros(3))
+            self._sphere = (np.zeros(3), 0.0)
+            return
+        aabbMin = vertices.min(axis = 0)
+        aabbMax = vertices.max(axis = 0)
+        center = (aabbMin + aabbMax) / 2
+        radius = float(np.sqrt(np.max(np.sum((vertices - center) ** 2, axis = 1))))
+        self._bounds = (aabbMin, aabbMax)
+        self._sphere = (center, radius)
+
+    def GetBounds(self):
+        """ Returns the (min, max) corners of the local axis aligned bounding box """
+        if self._bounds is None:
+            self.RecalculateBounds()
+        return self._bounds
+
+    def GetBoundingSphere(self):
+        """ Returns the (center, radius) of the local bounding sphere, centered on the AABB """
+        if self._sphere is None:
+            self.RecalculateBounds()
+        return self._sphere
+
+    def Acquire(self):
+        """ Load the vertex data dropped after the upload again, call this before reading it on the CPU """
+        if self.vertices is not None:
+            return
+        records = Mesh.Cache.Load(self.source[0]) if self.source is not None else None
+        if records is None:
+            raise RuntimeError("The vertex data of this mesh was dropped and can't be loaded again, pin the mesh")
+        self.SetArrays(records[self.source[1]])
+
+    def ApplyResidencyPolicy(self):
+        """ Called by GLStdVBO once the mesh is on the GPU """
+        if self.pinned or self.source is None or self.residencyPolicy == ResidencyPolicy.KEEP:
+            return
+        # The renderers still cull with the bounds
+        self.GetBoundingSphere()
+        if self.residencyPolicy == ResidencyPolicy.DROP_AFTER_UPLOAD:
+            self.vertices = self.normals = self.tangents = self.indexes = None
+            self.uvs = None
+            self.lods = []
+        elif not isinstance(self.vertices, np.memmap):
+            self.vertices = None
+            self.Acquire()
+
+    def GetBVH(self) -> BVH:
+        """ Returns the BVH of the LOD 0 triangles, built on the first call """
+        if self._bvh is None:
+            self.Acquire()
+            self._bvh = BVH(self.vertices, self.indexes)
+        return self._bvh
+
+    def OptimizeIndices(self, cacheSize:int = 16, overdraw:bool = False, overdrawThreshold:float = 1.05, verbose:bool = False) -> dict:
+        """
+        Reorder the triangles for the post transform vertex cache (Tipsify), then the vertices by first use.
+        With overdraw, clusters of triangles facing outside are moved first, see MeshOptimizer.OptimizeOverdraw.
+        Returns the ACMR & ATVR before and after.
+        """
+        self.Acquire()
+        vertexCount = len(self.vertices)
+        indexes = np.asarray(self.indexes).reshape(-1, 3)
+        before = MeshOptimizer.AnalyzeVertexCache(indexes, vertexCount, cacheSize)
+
+        indexes = MeshOptimizer.Tipsify(indexes, vertexCount, cacheSize)
+        if overdraw:
+            indexes = MeshOptimizer.OptimizeOverdraw(indexes, self.vertices, vertexCount, cacheSize, overdrawThreshold)
+
+        remap, self.indexes = MeshOptimizer.OptimizeVertexFetch(indexes, vertexCount)
+        self._bvh = None
+        self.ClearClusters()
+        self.lods = [remap[lod].astype(self.indexes.dtype) for lod in self.lods]
+        order = np.argsort(remap)
+        self.vertices = np.asarray(self.vertices)[order]
+        self.normals = np.asarray(self.normals)[order]
+        if self.tangents is not None:
+            self.tangents = np.asarray(self.tangents)[order]
+        if self.uvs is not None:
+            self.uvs = [np.asarray(uv)[order] for uv in self.uvs]
+
+        after = MeshOptimizer.AnalyzeVertexCache(self.indexes, vertexCount, cacheSize)
+        stats = {"acmr": (before[0], after[0]), "atvr": (before[1], after[1])}
+        if verbose:
+            print("Vertex cache : ACMR %.3f -> %.3f, ATVR %.3f -> %.3f" % (before[0], after[0], before[1], after[1]))
+        return stats
+
+    def Weld(self, tolerance:float = 0.0, attributeTolerance:float = None, verbose:bool = False) -> dict:
+        """
+        Merge the duplicated vertices and drop the vertices no triangle uses.
+        Positions are quantized on a tolerance grid, normals, tangents & uvs on an attributeTolerance grid
+        (same as tolerance by default), a tolerance of 0 only merges bit identical vertices.
+        Near values on both sides of a grid cell are not merged, the kept vertex is the first of its group.
+        Returns the vertex counts before and after, see Mesh.WeldStatistics for the totals.
+        """
+        self.Acquire()
+        attributeTolerance = tolerance if attributeTolerance is None else attributeTolerance
+        vertexCount = len(self.vertices)
+        attributes = [self.vertices, self.normals, self.tangents] + list(self.uvs or [])
+        tolerances = [tolerance] + [attributeTolerance] * (len(attributes) - 1)
+        keys = np.concatenate([Mesh._QuantizeAttribute(data, tol) for data, tol in zip(attributes, tolerances) if data is not None], axis = 1)
+
+        # One packed key per vertex, np.unique compares its bytes
+        keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+        _, first, inverse = np.unique(keys, return_index = True, return_inverse = True)
+        inverse = inverse.ravel()
+
+        # Keep the vertices referenced by a triangle, in first use order
+        buffers = [np.asarray(self.indexes)] + [np.asarray(lod) for lod in self.lods]
+        used = np.zeros(len(first), bool)
+        for indexes in buffers:
+            used[inverse[indexes.ravel()]] = True
+        groups = np.flatnonzero(used)
+        groups = groups[np.argsort(first[groups], kind = "stable")]
+        order = first[groups]
+        remap = np.full(len(first), -1, np.int64)
+        remap[groups] = np.arange(len(groups))
+        remap = remap[inverse]
+
+        indexDtype = buffers[0].dtype if buffers[0].dtype.kind in "iu" else np.int32
+        self.indexes = remap[buffers[0]].astype(indexDtype)
+        self.lods = [remap[lod].astype(indexDtype) for lod in buffers[1:]]
+        self.vertices = np.asarray(self.vertices)[order]
+        self.normals = np.asarray(self.normals)[order]
+        if self.tangents is not None:
+            self.tangents = np.asarray(self.tangents)[order]
+        if self.uvs is not None:
+            self.uvs = [np.asarray(uv)[order] for uv in self.uvs]
+        self._bounds = None
+        self._sphere = None
+        self._bvh = None
+
+        stats = {"vertices": (vertexCount, len(order)), "duplicates": vertexCount - len(first), "unreferenced": len(first) - len(order)}
+        Mesh.WeldStatistics["meshes"] += 1
+        Mesh.WeldStatistics["before"] += vertexCount
+        Mesh.WeldStatistics["after"] += len(order)
+        if verbose:
+            print("Weld : %d -> %d vertices (%d duplicates, %d unreferenced)" % (
+                vertexCount, len(order), stats["duplicates"], stats["unreferenced"]))
+        return stats
+
+    @staticmethod
+    def _QuantizeAttribute(data, tolerance:float) -> np.ndarray:
+        """ (N, K) int64 keys, equal for the values of a tolerance cell (the exact bits with 0) """
+        data = np.asarray(data, np.float64).reshape(len(data), -1)
+        if tolerance > 0:
+            return np.floor(data / tolerance + 0.5).astype(np.int64)
+        # + 0.0 turns -0.0 into 0.0
+        return np.ascontiguousarray(data + 0.0).view(np.int64)
+
+    @staticmethod
+    def ReportWeld():
+        stats = Mesh.WeldStatistics
+        if stats["meshes"]:
+            print("Weld: %d meshes, %d -> %d vertices (%.1f%% removed)" % (
+                stats["meshes"], stats["before"], stats["after"], 100 * (1 - stats["after"] / max(stats["before"], 1))))
+
+    def BuildClusters(self, maxTriangles:int = 128) -> int:
+        """
+        Reorder the LOD 0 triangles in clusters of at most maxTriangles, each with its bounding sphere and normal cone.
+        The renderers of the mesh then only draw the visible clusters, see GLRenderPipeline.CullClusters.
+        Returns the cluster count.
+        """
+        self.Acquire()
+        indexes, self.clusterOffsets, self.clusterSpheres, self.clusterCones = MeshOptimizer.BuildClusters(
+            self.vertices, self.indexes, maxTriangles)
+        self.indexes = indexes.reshape(np.shape(self.indexes))
+        self._bvh = None
+        return self.GetClusterCount()
+
+    def GetClusterCount(self) -> int:
+        return 0 if self.clusterOffsets is None else len(self.clusterOffsets) - 1
+
+    def ClearClusters(self):
+        self.clusterOffsets = None
+        self.clusterSpheres = None
+        self.clusterCones = None
+
+    def GetLODCount(self) -> int:
+        # lodErrors outlive the dropped lods
+        return 1 + len(self.lodErrors)
+
+    def GetLODIndexes(self, lod:int):
+        return self.indexes if lod == 0 else self.lods[lod - 1]
+
+    def BuildLODs(self, ratios = (0.5, 0.25, 0.125), maxError:float = 0.02) -> int:
+        """
+        Build simplified index buffers with MeshOptimizer.Simplify, ratios are triangle counts relative to LOD 0.
+        maxError is relative to the bounding sphere radius, the chain stops at the first LOD reaching it.
+        Each LOD is simplified from the previous one. Returns the LOD count.
+        """
+        self.Acquire()
+        self.lods = []
+        self.lodErrors = []
+        _, radius = self.GetBoundingSphere()
+        radius = radius if radius > 0 else 1.0
+        indexes = np.asarray(self.indexes).reshape(-1, 3)
+        triangleCount = len(indexes)
+        for ratio in ratios:
+            target = int(triangleCount * ratio)
+            simplified, error = MeshOptimizer.Simplify(self.vertices, indexes, target, maxError * radius)
+            # Not worth a LOD if it barely removes triangles
+            if len(simplified) > 0.9 * len(indexes):
+                break
+            indexes = simplified
+            self.lods += [indexes]
+            self.lodErrors += [error / radius]
+            if len(indexes) > target:
+                break
+        return self.GetLODCount()
+
     def ComputeTangents(self, uvChannel:int = 0):
         """ Compute the mesh tangeants using the uvChannel as reference """
-        # For each triangle, solve the problem
-        self.tangents = np.zeros(self.normals.shape)
-        for tri in self.indexes:
-            vertices = self.vertices[tri]
-            uvs = self.uvs[uvChannel][tri]
-
-            # Edges
-            E = vertices[1:] - vertices[0]
-            # UV Diff
-            dUV = uvs[1:] - uvs[0]
-
-            # Solve the System to get Tangeant and Bitangeant (UV aligned)
-            try:
-                T = np.linalg.solve(dUV, E)[0]
-            except np.linalg.LinAlgError:
-                T = np.array([1, 0, 0])
-            # Add all the tangeants and then normalize to have influence of all triangles
-            self.tangents[tri] += T
-            #self.bitangeants[tri] += B
+        self.Acquire()
+        # Solve the problem for all the triangles at once
+        indexes = np.asarray(self.indexes).reshape(-1, 3)
+        vertices = np.asarray(self.vertices, np.float64)[indexes]
+        uvs = np.asarray(self.uvs[uvChannel], np.float64)[indexes]
+
+        # Edges
+        E1 = vertices[:, 1] - vertices[:, 0]
+        E2 = vertices[:, 2] - vertices[:, 0]
+        # UV Diff
+        dUV1 = uvs[:, 1] - uvs[:, 0]
+        dUV2 = uvs[:, 2] - uvs[:, 0]
+
+        # Solve the System to get Tangeant and Bitangeant (UV aligned)
+        # With a closed form 2x2 inverse, only the first row (Tangeant) is needed
+        det = dUV1[:, 0] * dUV2[:, 1] - dUV1[:, 1] * dUV2[:, 0]
+        degenerate = det == 0
+        det[degenerate] = 1
+        T = (dUV2[:, 1, None] * E1 - dUV1[:, 1, None] * E2) / det[:, None]
+        T[degenerate] = (1, 0, 0)
+
+        # Add all the tangeants and then normalize to have influence of all triangles
+        self.tangents = np.zeros(np.shape(self.normals))
+        for corner in range(3):
+            np.add.at(self.tangents, indexes[:, corner], T)
 
         # Normalize everything
         self.tangents = NumpyUtils.Normalize(self.tangents)
-        #self.bitangeants = NumpyUtils.Normalize(self.bitangeants)
 
     @staticmethod
-    def LoadFromFile(file, flip_uvs = True, gen_normals = True, fix_normals = True):
-        """ Load resources from file using assimp, return list of Mesh """
+    def LoadFromFile(file, flip_uvs = True, gen_normals = True, fix_normals = True, use_cache = True, optimize = True,
+                     lods = None, lod_error = 0.02, weld = None):
+        """
+        Load resources from file using assimp, return list of Mesh
+        Imported meshes are kept in Mesh.Cache, the arrays of a cache hit are read only memory maps
+        weld is the tolerance of Weld, None keeps the vertices as imported
+        With optimize, the index and vertex buffers are reordered for the vertex cache, see OptimizeIndices
+        lods are the triangle ratios of the LOD chain, see BuildLODs
+        """
+        path = "assets/models/" + file
+        pp = assimpcy.aiPostProcessSteps
+        flags = pp.aiProcess_Triangulate | pp.aiProcess_CalcTangentSpace | pp.aiProcess_MakeLeftHanded   
+        if gen_normals:
+            flags |= pp.aiProcess_GenSmoothNormals
+        if flip_uvs:
+            flags |= pp.aiProcess_FlipUVs
+
+        if fix_normals:
+            flags |= pp.aiProcess_FixInfacingNormals 
+
+        key = None
+        if use_cache:
+            try:
+                key = Mesh.Cache.MakeKey(path, int(flags), optimize, lods, lod_error, weld)
+            except OSError as exception:
+                print('ERROR loading', file + ': ', exception)
+                return []
+            records = Mesh.Cache.Load(key)
+            if records is not None:
+                meshes = [Mesh.FromArrays(record) for record in records]
+                for index, mesh in enumerate(meshes):
+                    mesh.source = (key, index)
+                return meshes
+
         try:
-            pp = assimpcy.aiPostProcessSteps
-            flags = pp.aiProcess_Triangulate | pp.aiProcess_CalcTangentSpace | pp.aiProcess_MakeLeftHanded   
-            if gen_normals:
-                flags |= pp.aiProcess_GenSmoothNormals
-            if flip_uvs:
-                flags |= pp.aiProcess_FlipUVs
-
-            if fix_normals:
-                flags |= pp.aiProcess_FixInfacingNormals 
-            scene = assimpcy.aiImportFile("assets/models/" + file, flags)
+            scene = assimpcy.aiImportFile(path, flags)
         except assimpcy.AssimpError as exception:
             print('ERROR loading', file + ': ', exception.args[0].decode())
             return []
@@ -91,12 +371,69 @@ class Mesh:
 
             if tangents is None:
                 loadedMesh.ComputeTangents()
+
+            if weld is not None:
+                loadedMesh.Weld(weld)
+
+            if optimize:
+                loadedMesh.OptimizeIndices(overdraw = True)
+
+            if lods:
+                loadedMesh.BuildLODs(lods, lod_error)
             
             meshes += [loadedMesh]
 
+        if key is not None:
+            Mesh.Cache.Store(key, [mesh.ToArrays() for mesh in meshes])
+            for index, mesh in enumerate(meshes):
+                mesh.source = (key, index)
 
         return meshes
 
+    def ToArrays(self) -> dict:
+        """ Name -> array record of the mesh, see FromArrays """
+        self.Acquire()
+        arrays = {
+            "vertices": self.vertices,
+            "normals": self.normals,
+            "tangents": self.tangents,
+            "indexes": self.indexes
+        }
+        for channel, uv in enumerate(self.uvs or []):
+            arrays["uv%d" % channel] = uv
+        for lod, indexes in enumerate(self.lods):
+            arrays["lod%d" % (lod + 1)] = indexes
+        if self.lods:
+            arrays["lodErrors"] = np.array(self.lodErrors)
+        if self.clusterOffsets is not None:
+            arrays["clusterOffsets"] = self.clusterOffsets
+            arrays["clusterSpheres"] = self.clusterSpheres
+            arrays["clusterCones"] = self.clusterCones
+        return arrays
+
+    @staticmethod
+    def FromArrays(arrays:dict) -> Mesh:
+        mesh = Mesh(None, None, [], None)
+        mesh.SetArrays(arrays)
+        return mesh
+
+    def SetArrays(self, arrays:dict):
+        """ Replace the data of the mesh by a record of ToArrays """
+        self.uvs = []
+        while ("uv%d" % len(self.uvs)) in arrays:
+            self.uvs += [arrays["uv%d" % len(self.uvs)]]
+        self.vertices = arrays["vertices"]
+        self.normals = arrays["normals"]
+        self.indexes = arrays["indexes"]
+        self.tangents = arrays.get("tangents")
+        self.lods = []
+        while ("lod%d" % (len(self.lods) + 1)) in arrays:
+            self.lods += [arrays["lod%d" % (len(self.lods) + 1)]]
+        self.lodErrors = list(arrays["lodErrors"]) if "lodErrors" in arrays else []
+        self.clusterOffsets = arrays.get("clusterOffsets")
+        self.clusterSpheres = arrays.get("clusterSpheres")
+        self.clusterCones = arrays.get("clusterCones")
+
     @staticmethod
     def Quad(size = (1, 1), offset = (0, 0)):
         """
@@ -115,9 +452,10 @@ class Mesh:
         return Mesh(vertices, normals, [uvs], indexes, tangents)
 
     @staticmethod
-    def Plane(size = (10, 10), count = (2, 2), repeat_uv = False):
+    def Plane(size = (10, 10), count = (2, 2), repeat_uv = False, dtype = None):
         """
         Generate a XZ plane
+        dtype sets the vertices type, np.float32 avoids a conversion on upload
         """
 
         w, h = size
@@ -134,6 +472,8 @@ class Mesh:
         YY = np.zeros_like(XX)
 
         vertices = np.concatenate((XX, YY, ZZ), axis=1)
+        if dtype is not None:
+            vertices = vertices.astype(dtype)
 
         uvs = np.empty((len(vertices), 2), dtype = np.float32)
         uvs[:, 0] = 0.5 + vertices[:, 0] / w
@@ -142,39 +482,147 @@ class Mesh:
         if repeat_uv:
             uvs[:, 0] = (uvs[:, 0] - 0.5) * (cx - 1) 
             uvs[:, 1] = (uvs[:, 1] - 0.5) * (cz - 1) 
-        indexes = []
 
-        for z in range(0, cz - 1):
-            for x in range(0, cx - 1):
-                tri = z * cx + x
-                indexes += [
-                    (tri, tri + 1, tri + 1 + cx),
-                    (tri, tri + 1 + cx, tri + cx)]
+        # First vertex of each quad, row by row
+        tri = (np.arange(cz - 1, dtype = 'u4')[:, None] * cx + np.arange(cx - 1, dtype = 'u4')).reshape(-1, 1)
+        # Two triangles per quad
+        indexes = np.concatenate((tri, tri + 1, tri + 1 + cx,
+                                  tri, tri + 1 + cx, tri + cx), axis = 1).reshape(-1, 3)
 
-        normals = np.array([(0, 1, 0)] * len(vertices), dtype = np.float32)
-        tangeants = np.array([(1, 0, 0)] * len(vertices), dtype = np.float32)
-        indexes = np.array(indexes, 'u4')
+        normals = np.tile(np.array((0, 1, 0), dtype = np.float32), (len(vertices), 1))
+        tangeants = np.tile(np.array((1, 0, 0), dtype = np.float32), (len(vertices), 1))
 
         return Mesh(vertices, normals, [uvs], indexes, tangeants)
 
     @staticmethod
-    def Transform(mesh:Mesh, transformMatrix:Matrix4):
+    def Transform(mesh:Mesh, transformMatrix:Matrix4, dtype = None):
         """
         Apply the transform Matrix to the mesh vertices, normals and tangents.
         /!\ This should never be done in realtime /!\ 
         This helps to either modify the offset, or to combine meshes
+        dtype sets the output type, np.float32 avoids a conversion on upload
         """
-        vertices = np.array([np.array(transformMatrix @ np.append(vertex, 1.0))[0:3] for vertex in mesh.vertices])
-        normals = np.array([np.array(transformMatrix @ np.append(normal, 0.0))[0:3] for normal in mesh.normals])
-        tangents = np.array([np.array(transformMatrix @ np.append(tangent, 0.0))[0:3] for tangent in mesh.tangents])
+        mesh.Acquire()
+        vertices, normals, tangents = Mesh._TransformAttributes(mesh, transformMatrix)
+
+        if dtype is not None:
+            vertices = vertices.astype(dtype)
+            normals = normals.astype(dtype)
+            if tangents is not None:
+                tangents = tangents.astype(dtype)
+
         return Mesh(vertices, normals, [np.copy(mesh.uvs[0])], np.copy(mesh.indexes), tangents)
 
+    @staticmethod
+    def _TransformAttributes(mesh:Mesh, transformMatrix:Matrix4):
+        """ Returns the transformed vertices, normals and tangents of the mesh """
+        mesh.Acquire()
+        M = np.asarray(transformMatrix, np.float64)
+        linear = M[:3, :3]
+
+        # Homogeneous positions, all transformed at once
+        positions = np.ones((len(mesh.vertices), 4))
+        positions[:, :3] = mesh.vertices
+        vertices = (positions @ M.T)[:, :3]
+
+        # Normals use the inverse transpose to stay orthogonal to the surface under non uniform scale
+        # Tangents lie on the surface, they use the matrix itself
+        normals = NumpyUtils.Normalize(np.asarray(mesh.normals) @ np.linalg.inv(linear))
+        tangents = None
+        if mesh.tangents is not None:
+            tangents = NumpyUtils.Normalize(np.asarray(mesh.tangents) @ linear.T)
+        return vertices, normals, tangents
+
+    @staticmethod
+    def CombineMany(parts, dtype = None):
+        """
+        Combine many meshes in one, parts are meshes or (mesh, transformMatrix) pairs.
+        The final arrays are allocated once and each part is written in its slice.
+        Be careful, the meshes must have the same textures !
+        """
+        parts = [(part, None) if isinstance(part, Mesh) else part for part in parts]
+        meshes = [mesh for mesh, _ in parts]
+        for mesh in meshes:
+            mesh.Acquire()
+        if dtype is None:
+            dtype = np.result_type(*[np.asarray(mesh.vertices).dtype for mesh in meshes])
+
+        vertexCounts = np.array([len(mesh.vertices) for mesh in meshes], np.int64)
+        indexCounts = np.array([len(mesh.indexes) for mesh in meshes], np.int64)
+        vertexOffsets = np.concatenate(([0], np.cumsum(vertexCounts)))
+        indexOffsets = np.concatenate(([0], np.cumsum(indexCounts)))
+        vertexCount = vertexOffsets[-1]
+
+        # Only the uv channels and tangents shared by all the meshes are kept
+        uvChannels = min(len(mesh.uvs) if mesh.uvs is not None else 0 for mesh in meshes)
+        hasTangents = all(mesh.tangents is not None for mesh in meshes)
+
+        vertices = np.empty((vertexCount, 3), dtype)
+        normals = np.empty((vertexCount, 3), dtype)
+        tangents = np.empty((vertexCount, 3), dtype) if hasTangents else None
+        uvs = [np.empty((vertexCount, 2), dtype) for _ in range(uvChannels)]
+        indexes = np.empty((indexOffsets[-1], 3), 'u4')
+
+        for i, (mesh, transformMatrix) in enumerate(parts):
+            vertexSlice = slice(vertexOffsets[i], vertexOffsets[i + 1])
+            if transformMatrix is None:
+                vertices[vertexSlice] = mesh.vertices
+                normals[vertexSlice] = mesh.normals
+                if hasTangents:
+                    tangents[vertexSlice] = mesh.tangents
+            else:
+                partVertices, partNormals, partTangents = Mesh._TransformAttributes(mesh, transformMatrix)
+                vertices[vertexSlice] = partVertices
+                normals[vertexSlice] = partNormals
+                if hasTangents:
+                    tangents[vertexSlice] = partTangents
+            for channel in range(uvChannels):
+                uvs[channel][vertexSlice] = mesh.uvs[channel]
+            indexes[indexOffsets[i]:indexOffsets[i + 1]] = mesh.indexes
+
+        # Offset the indexes of every part by its first vertex
+        indexes += np.repeat(vertexOffsets[:-1], indexCounts).astype('u4')[:, None]
+        return Mesh(vertices, normals, uvs, indexes, tangents)
+
+    @staticmethod
+    def Replicate(mesh:Mesh, matrices, dtype = None):
+        """
+        Combine copies of the mesh transformed by a (N, 4, 4) stack of matrices in one mesh.
+        Be careful, all the copies share the mesh textures !
+        """
+        mesh.Acquire()
+        matrices = np.asarray(matrices, np.float64).reshape(-1, 4, 4)
+        if dtype is None:
+            dtype = np.asarray(mesh.vertices).dtype
+        count = len(matrices)
+        vertexCount = len(mesh.vertices)
+        linear = matrices[:, :3, :3]
+
+        vertices = np.einsum('nij,vj->nvi', linear, np.asarray(mesh.vertices, np.float64)) + matrices[:, None, :3, 3]
+        # Inverse transpose for normals, matrix itself for tangents, see Transform
+        inverse = Matrix4.AffineInverse(matrices)[:, :3, :3]
+        normals = NumpyUtils.Normalize(np.einsum('vj,nji->nvi', np.asarray(mesh.normals, np.float64), inverse))
+        tangents = None
+        if mesh.tangents is not None:
+            tangents = NumpyUtils.Normalize(np.einsum('nij,vj->nvi', linear, np.asarray(mesh.tangents, np.float64)))
+            tangents = tangents.reshape(-1, 3).astype(dtype)
+
+        uvs = None
+        if mesh.uvs is not None:
+            uvs = [np.tile(np.asarray(uv, dtype), (count, 1)) for uv in mesh.uvs]
+        offsets = (np.arange(count, dtype = 'u4') * vertexCount)[:, None, None]
+        indexes = (np.asarray(mesh.indexes, 'u4')[None] + offsets).reshape(-1, 3)
+
+        return Mesh(vertices.reshape(-1, 3).astype(dtype), normals.reshape(-1, 3).astype(dtype), uvs, indexes, tangents)
+
     @staticmethod
     def Combine(mesh1:Mesh, mesh2:Mesh):
         """
         Combine twos mesh in one
         Be careful, the meshes must have the same textures !
         """
+        mesh1.Acquire()
+        mesh2.Acquire()
         firstIndex = len(mesh1.vertices)
         vertices = np.concatenate((mesh1.vertices, mesh2.vertices))
         normals = np.concatenate((mesh1.normals, mesh2.normals))
@@ -0,0 +1,339 @@
+"""
+Index & vertex buffer optimizations
+Tipsify : Sander, Nehab & Barczak, Fast Triangle Reordering for Vertex Locality and Reduced Overdraw (2007)
+Simplify : Garland & Heckbert, Surface Simplification Using Quadric Error Metrics (1997)
+BuildClusters : Morton ordered clusters with normal cones, as in meshoptimizer (Kapoulkine)
+@author: Eikins
+"""
+
+import heapq
+
+import numpy as np
+
+from sea3d.math import NumpyUtils
+
+# Front faces are clockwise in the left handed space of GLRenderPipeline, cross(p1 - p0, p2 - p0) points inside
+FrontFaceSign = -1.0
+
+def SimulateCache(indexes, vertexCount:int, cacheSize:int = 16):
+    """
+    Simulate a FIFO post transform cache, returns the number of cache misses of each triangle.
+    A vertex is still in the cache if less than cacheSize misses happened since it was loaded.
+    """
+    indexes = np.asarray(indexes).reshape(-1, 3)
+    loadedAt = [-cacheSize - 1] * vertexCount
+    misses = 0
+    triangleMisses = np.zeros(len(indexes), np.int32)
+    for t, tri in enumerate(indexes.tolist()):
+        for v in tri:
+            if misses - loadedAt[v] >= cacheSize:
+                loadedAt[v] = misses
+                misses += 1
+                triangleMisses[t] += 1
+    return triangleMisses
+
+def AnalyzeVertexCache(indexes, vertexCount:int, cacheSize:int = 16):
+    """
+    Returns the (ACMR, ATVR) of an index buffer
+    ACMR : average cache miss ratio, transformed vertices per triangle, 0.5 at best for large grids, 3 at worst
+    ATVR : average transform to vertex ratio, transformed vertices per referenced vertex, 1 at best
+    """
+    indexes = np.asarray(indexes).reshape(-1, 3)
+    if len(indexes) == 0:
+        return 0.0, 0.0
+    misses = int(SimulateCache(indexes, vertexCount, cacheSize).sum())
+    return misses / len(indexes), misses / len(np.unique(indexes))
+
+def Tipsify(indexes, vertexCount:int, cacheSize:int = 16):
+    """ Reorder the triangles for post transform cache locality, returns the new (F, 3) index buffer """
+    indexes = np.asarray(indexes).reshape(-1, 3)
+    triangleCount = len(indexes)
+    if triangleCount == 0:
+        return indexes.copy()
+
+    # Vertex -> triangles adjacency, in CSR form
+    flat = indexes.ravel()
+    order = np.argsort(flat, kind = "stable")
+    adjacency = (order // 3).tolist()
+    starts = np.concatenate(([0], np.cumsum(np.bincount(flat, minlength = vertexCount)))).tolist()
+
+    triangles = indexes.tolist()
+    # Live triangles of each vertex
+    live = np.bincount(flat, minlength = vertexCount).tolist()
+    cacheTime = [0] * vertexCount
+    emitted = [False] * triangleCount
+    deadEnds = []
+    output = []
+
+    fan = 0
+    time = cacheSize + 1
+    cursor = 0
+    while fan >= 0:
+        candidates = set()
+        for t in adjacency[starts[fan]:starts[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            output.append(t)
+            for v in triangles[t]:
+                deadEnds.append(v)
+                candidates.add(v)
+                live[v] -= 1
+                if time - cacheTime[v] > cacheSize:
+                    cacheTime[v] = time
+                    time += 1
+
+        # Next fanning vertex : the candidate that will still be in the cache after its fan is emitted
+        fan = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if time - cacheTime[v] + 2 * live[v] <= cacheSize:
+                    priority = time - cacheTime[v]
+                if priority > best:
+                    best = priority
+                    fan = v
+
+        if fan == -1:
+            # Dead end, go back to a recently used vertex, or to the next vertex with live triangles
+            while deadEnds and fan == -1:
+                v = deadEnds.pop()
+                if live[v] > 0:
+                    fan = v
+            while fan == -1 and cursor < vertexCount:
+                if live[cursor] > 0:
+                    fan = cursor
+                cursor += 1
+
+    return indexes[np.array(output)]
+
+def OptimizeOverdraw(indexes, vertices, vertexCount:int, cacheSize:int = 16, threshold:float = 1.05):
+    """
+    Sort the clusters of a cache optimized index buffer so that outer facing clusters are drawn first,
+    they are more likely to occlude the others. Clusters start at hard cache boundaries (3 misses).
+    The new order is kept only if it keeps the ACMR below threshold times the original one.
+    """
+    indexes = np.asarray(indexes).reshape(-1, 3)
+    if len(indexes) == 0:
+        return indexes.copy()
+    triangleMisses = SimulateCache(indexes, vertexCount, cacheSize)
+    clusterStarts = np.flatnonzero(triangleMisses == 3)
+    if len(clusterStarts) == 0 or clusterStarts[0] != 0:
+        clusterStarts = np.concatenate(([0], clusterStarts))
+    if len(clusterStarts) < 2:
+        return indexes.copy()
+
+    # View independent occlusion metric : distance of the cluster to the mesh center along its normal
+    vertices = np.asarray(vertices, np.float64)
+    corners = vertices[indexes]
+    faceNormals = FrontFaceSign * np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    faceCenters = corners.mean(axis = 1)
+    meshCenter = faceCenters.mean(axis = 0)
+
+    clusterIds = np.repeat(np.arange(len(clusterStarts)), np.diff(np.concatenate((clusterStarts, [len(indexes)]))))
+    counts = np.bincount(clusterIds).astype(np.float64)
+    clusterCenters = np.stack([np.bincount(clusterIds, faceCenters[:, i]) for i in range(3)], axis = 1) / counts[:, None]
+    clusterNormals = np.stack([np.bincount(clusterIds, faceNormals[:, i]) for i in range(3)], axis = 1)
+    metric = np.sum((clusterCenters - meshCenter) * clusterNormals, axis = 1)
+
+    # Stable sort keeps the original order of equivalent clusters
+    clusterOrder = np.argsort(-metric, kind = "stable")
+    triangleOrder = np.argsort(np.argsort(clusterOrder)[clusterIds], kind = "stable")
+    sortedIndexes = indexes[triangleOrder]
+
+    acmr, _ = AnalyzeVertexCache(indexes, vertexCount, cacheSize)
+    sortedAcmr, _ = AnalyzeVertexCache(sortedIndexes, vertexCount, cacheSize)
+    if sortedAcmr > acmr * threshold:
+        return indexes.copy()
+    return sortedIndexes
+
+def OptimizeVertexFetch(indexes, vertexCount:int):
+    """
+    Returns (remap, indexes) : vertices are sorted by first use, remap[old] = new.
+    Unreferenced vertices are moved at the end.
+    """
+    indexes = np.asarray(indexes)
+    flat = indexes.ravel()
+    referenced, firstUse = np.unique(flat, return_index = True)
+    order = referenced[np.argsort(firstUse)]
+    unreferenced = np.setdiff1d(np.arange(vertexCount), referenced)
+    order = np.concatenate((order, unreferenced)).astype(np.int64)
+
+    remap = np.empty(vertexCount, np.int64)
+    remap[order] = np.arange(vertexCount)
+    return remap, remap[indexes].astype(indexes.dtype)
+
+def Simplify(vertices, indexes, targetCount:int, maxError:float = np.inf):
+    """
+    Quadric error metric simplification with half edge collapses (Garland & Heckbert).
+    Vertices are never moved, they collapse onto a neighbour, so all the LODs share the vertex buffer.
+    Boundary vertices (mesh borders and uv seams) are locked, collapses flipping a triangle are rejected.
+    Stops at targetCount triangles or when the next collapse error is above maxError.
+    Returns (indexes, error), error is the square root of the largest collapse cost.
+    """
+    V = np.asarray(vertices, np.float64)
+    I = np.asarray(indexes).reshape(-1, 3)
+    vertexCount = len(V)
+    if len(I) <= targetCount:
+        return I.copy(), 0.0
+
+    # Plane quadrics of the faces, accumulated on their vertices
+    p0, p1, p2 = V[I[:, 0]], V[I[:, 1]], V[I[:, 2]]
+    normals = NumpyUtils.Normalize(np.cross(p1 - p0, p2 - p0))
+    planes = np.concatenate((normals, -np.sum(normals * p0, axis = 1, keepdims = True)), axis = 1)
+    Q = np.zeros((vertexCount, 4, 4))
+    faceQuadrics = planes[:, :, None] * planes[:, None, :]
+    for corner in range(3):
+        np.add.at(Q, I[:, corner], faceQuadrics)
+
+    # Edges used by a single triangle are on a boundary
+    edges = np.sort(np.concatenate((I[:, [0, 1]], I[:, [1, 2]], I[:, [2, 0]])), axis = 1)
+    edges, counts = np.unique(edges, axis = 0, return_counts = True)
+    locked = np.zeros(vertexCount, bool)
+    locked[edges[counts == 1].ravel()] = True
+
+    H = np.ones((vertexCount, 4))
+    H[:, :3] = V
+
+    def Cost(u, v):
+        """ Error of moving u onto v """
+        h = H[v]
+        return float(h @ (Q[u] + Q[v]) @ h)
+
+    # Initial costs of all the edges, in both directions
+    a, b = edges[:, 0], edges[:, 1]
+    Qab = Q[a] + Q[b]
+    costToB = np.einsum('ni,nij,nj->n', H[b], Qab, H[b])
+    costToA = np.einsum('ni,nij,nj->n', H[a], Qab, H[a])
+    heap = [(cost, u, v, 0, 0) for cost, u, v in zip(costToB.tolist(), a.tolist(), b.tolist()) if not locked[u]]
+    heap += [(cost, u, v, 0, 0) for cost, u, v in zip(costToA.tolist(), b.tolist(), a.tolist()) if not locked[u]]
+    heapq.heapify(heap)
+
+    triangles = I.tolist()
+    positions = V.tolist()
+    alive = [True] * len(triangles)
+    vertexTriangles = [set() for _ in range(vertexCount)]
+    for t, tri in enumerate(triangles):
+        for v in tri:
+            vertexTriangles[v].add(t)
+    # Bumped each time the quadric or the neighbourhood of a vertex changes, older heap entries are skipped
+    version = [0] * vertexCount
+
+    def FaceNormal(tri):
+        (ax, ay, az), (bx, by, bz), (cx, cy, cz) = positions[tri[0]], positions[tri[1]], positions[tri[2]]
+        ux, uy, uz = bx - ax, by - ay, bz - az
+        vx, vy, vz = cx - ax, cy - ay, cz - az
+        return (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
+
+    triangleCount = len(triangles)
+    maxCost = 0.0
+    maxErrorSquared = maxError * maxError
+    while heap and triangleCount > targetCount:
+        cost, u, v, versionU, versionV = heapq.heappop(heap)
+        if versionU != version[u] or versionV != version[v]:
+            continue
+        if cost > maxErrorSquared:
+            break
+
+        shared = vertexTriangles[u] & vertexTriangles[v]
+        if not shared:
+            continue
+
+        # Link condition, the common neighbours must be the opposite vertices of the shared triangles
+        neighboursU = {w for t in vertexTriangles[u] for w in triangles[t]}
+        neighboursV = {w for t in vertexTriangles[v] for w in triangles[t]}
+        opposite = {w for t in shared for w in triangles[t]}
+        if (neighboursU & neighboursV) != opposite:
+            continue
+
+        # Reject collapses flipping a triangle
+        moved = vertexTriangles[u] - shared
+        flipped = False
+        for t in moved:
+            before = FaceNormal(triangles[t])
+            after = FaceNormal([v if w == u else w for w in triangles[t]])
+            if before[0] * after[0] + before[1] * after[1] + before[2] * after[2] <= 0:
+                flipped = True
+                break
+        if flipped:
+            continue
+
+        # Collapse u onto v
+        for t in shared:
+            alive[t] = False
+            triangleCount -= 1
+            for w in triangles[t]:
+                vertexTriangles[w].discard(t)
+        for t in moved:
+            triangles[t] = [v if w == u else w for w in triangles[t]]
+            vertexTriangles[v].add(t)
+        vertexTriangles[u] = set()
+        Q[v] += Q[u]
+        version[u] += 1
+        version[v] += 1
+        maxCost = max(maxCost, cost)
+
+        # Edges around v have a new cost
+        for w in {w for t in vertexTriangles[v] for w in triangles[t]} - {v}:
+            if not locked[v]:
+                heapq.heappush(heap, (Cost(v, w), v, w, version[v], version[w]))
+            if not locked[w]:
+                heapq.heappush(heap, (Cost(w, v), w, v, version[w], version[v]))
+
+    result = np.array([tri for tri, isAlive in zip(triangles, alive) if isAlive], I.dtype).reshape(-1, 3)
+    return result, float(np.sqrt(max(maxCost, 0.0)))
+
+def MortonCodes(points, bits:int = 10):
+    """ Z order curve codes of (N, 3) points, quantized on bits per axis inside their bounding box """
+    points = np.asarray(points, np.float64)
+    low = points.min(axis = 0)
+    extent = np.maximum(points.max(axis = 0) - low, 1e-20)
+    cells = np.minimum(((points - low) / extent * (1 << bits)).astype(np.uint64), (1 << bits) - 1)
+    codes = np.zeros(len(points), np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return codes
+
+def BuildClusters(vertices, indexes, maxTriangles:int = 128):
+    """
+    Split the triangles in spatially coherent clusters of at most maxTriangles, cut along the Morton order of
+    their centroids. Inside a cluster, the triangles keep their previous order (e.g. from Tipsify).
+    Returns (indexes, offsets, spheres, cones) :
+        indexes: (F, 3) reordered index buffer, cluster i owns the triangles offsets[i] to offsets[i + 1]
+        spheres: (C, 4) bounding spheres, center & radius
+        cones: (C, 4) normal cones, axis & cutoff. Every triangle faces away from a viewer at e when
+               dot(center - e, axis) >= cutoff * |center - e| + radius
+    """
+    V = np.asarray(vertices, np.float64)
+    I = np.asarray(indexes).reshape(-1, 3)
+    triangleCount = len(I)
+    if triangleCount == 0:
+        return I.copy(), np.zeros(1, np.int64), np.zeros((0, 4)), np.zeros((0, 4))
+
+    corners = V[I]
+    clusterOf = np.empty(triangleCount, np.int64)
+    clusterOf[np.argsort(MortonCodes(corners.mean(axis = 1)), kind = "stable")] = np.arange(triangleCount) // maxTriangles
+    order = np.argsort(clusterOf, kind = "stable")
+    I, corners, clusterOf = I[order], corners[order], clusterOf[order]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(clusterOf))))
+    starts = offsets[:-1]
+
+    # Bounding spheres, centered on the cluster AABB
+    low = np.minimum.reduceat(corners.min(axis = 1), starts)
+    high = np.maximum.reduceat(corners.max(axis = 1), starts)
+    centers = (low + high) / 2
+    radii = np.sqrt(np.maximum.reduceat(np.max(np.sum((corners - centers[clusterOf][:, None]) ** 2, axis = 2), axis = 1), starts))
+
+    # Normal cones, from the face normals : back face culling uses the winding, not the vertex normals
+    faceNormals = NumpyUtils.Normalize(FrontFaceSign * np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]))
+    axes = NumpyUtils.Normalize(np.add.reduceat(faceNormals, starts))
+    # Degenerate triangles are never drawn, they don't widen the cone
+    degenerate = ~np.any(faceNormals, axis = 1)
+    spread = np.minimum.reduceat(np.where(degenerate, 1.0, np.sum(faceNormals * axes[clusterOf], axis = 1)), starts)
+    # A cone wider than a half space never faces away, 1 can't satisfy the test
+    cutoffs = np.where(spread > 0, np.sqrt(np.maximum(1 - spread * spread, 0)), 1.0)
+
+    return (I, offsets, np.concatenate((centers, radii[:, None]), axis = 1),
+            np.concatenate((axes, cutoffs[:, None]), axis = 1))
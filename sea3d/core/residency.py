@@ -0,0 +1,109 @@
+"""
+Memory budgets of the loaded resources
+@author: Eikins
+"""
+
+import threading
+
+from collections import OrderedDict
+from enum import Enum
+
+class ResidencyPolicy(Enum):
+    """ What happens to the CPU data of an asset once it is uploaded to the GPU """
+    KEEP = 0
+    # Freed, loaded again from the asset file or cache if the CPU reads it later
+    DROP_AFTER_UPLOAD = 1
+    # Replaced by read only memory maps of the asset cache, the OS can page it out
+    KEEP_AS_MMAP = 2
+
+class ResidencyManager:
+    """
+    Least recently used set of resident resources under a byte budget.
+    Resources are touched when they are used. Trim, called once per frame, evicts the least recently used ones
+    until the budget is met, the resources used since the previous Trim and the pinned ones are never evicted.
+    evict(resource) frees a resource, it must be able to load it again on its next use.
+
+    Attributes:
+        budget (int): bytes, None for no limit
+        usedBytes (int)
+        hits (int): uses of resident resources, counted once per frame
+        misses (int): uses of resources which had to be loaded, counted once per frame
+        evictions (int)
+    """
+
+    def __init__(self, name:str, budget:int = None, evict = None):
+        self.name = name
+        self.budget = budget
+        self.evict = evict
+        # Resource -> bytes, least recently used first
+        self.entries = OrderedDict()
+        self.used = set()
+        self.pinned = set()
+        self.usedBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Resources may be loaded by worker threads, see AssetLoader
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, resource):
+        return resource in self.entries
+
+    def Add(self, resource, size:int):
+        """ Register a loaded resource, it is the most recently used one """
+        with self.lock:
+            self.usedBytes += size - self.entries.get(resource, 0)
+            self.entries[resource] = size
+            self.entries.move_to_end(resource)
+            self.used.add(resource)
+
+    def Remove(self, resource):
+        """ Forget a resource freed by its owner, it doesn't count as an eviction """
+        with self.lock:
+            self.usedBytes -= self.entries.pop(resource, 0)
+            self.used.discard(resource)
+
+    def Pin(self, resource, pinned:bool = True):
+        """ A pinned resource is never evicted """
+        with self.lock:
+            if pinned:
+                self.pinned.add(resource)
+            else:
+                self.pinned.discard(resource)
+
+    def Touch(self, resource) -> bool:
+        """ Mark the resource as used, returns True if it is resident """
+        with self.lock:
+            resident = resource in self.entries
+            if resource not in self.used:
+                self.used.add(resource)
+                if resident:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if resident:
+                self.entries.move_to_end(resource)
+            return resident
+
+    def Trim(self):
+        """ Evict the least recently used resources until the budget is met, then start a new frame """
+        with self.lock:
+            if self.budget is not None and self.usedBytes > self.budget:
+                for resource in list(self.entries):
+                    if self.usedBytes <= self.budget:
+                        break
+                    if resource in self.used or resource in self.pinned:
+                        continue
+                    self.usedBytes -= self.entries.pop(resource)
+                    self.evictions += 1
+                    if self.evict is not None:
+                        self.evict(resource)
+            self.used.clear()
+
+    def Report(self):
+        budget = "unlimited" if self.budget is None else "%.1f MB" % (self.budget / 2**20)
+        print("%s: %d resident, %.1f MB / %s, %d hits, %d misses, %d evictions" % (
+            self.name, len(self.entries), self.usedBytes / 2**20, budget, self.hits, self.misses, self.evictions))
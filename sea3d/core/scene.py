@@ -9,7 +9,10 @@ Component and Behaviour class used for objects logic
 # Used for typing
 from __future__ import annotations
 
+import numpy as np
+
 from sea3d.core import Transform, Layers
+from sea3d.math import NumpyUtils
 
 class SceneObject:
 
@@ -19,11 +22,21 @@ class SceneObject:
         self.transform.object = self
         self.components = []
         self.layer = Layers.DEFAULT # Default Layer
+        self.scene:Scene = None
 
     def AddComponent(self, component: Component):
         if component.object is None:
             component.object = self
             self.components += [component]
+            if self.scene is not None:
+                self.scene.OnComponentAdded(component)
+
+    def RemoveComponent(self, component: Component):
+        if component.object is self:
+            self.components.remove(component)
+            if self.scene is not None:
+                self.scene.OnComponentRemoved(component)
+            component.object = None
 
     def GetComponent(self, component:type):
         for comp in self.components:
@@ -61,18 +74,106 @@ class Scene:
 
     def __init__(self, name:str):
         self.name = name
-        self.objects = []
+        # Insertion ordered, as a dict the objects are removed in constant time
+        self.objects = dict()
+        # Called with the component when a component enters or leaves the scene
+        self.componentAddedHandlers = []
+        self.componentRemovedHandlers = []
 
     def AddObject(self, object:SceneObject):
-        self.objects += [object]
+        if object.scene is not None:
+            return
+        self.objects[object] = None
+        object.scene = self
+        for comp in object.components:
+            self.OnComponentAdded(comp)
+
+    def RemoveObject(self, object:SceneObject):
+        """ Remove the object and its children from the scene """
+        if object.scene is not self:
+            return
+        for child in object.transform._children:
+            self.RemoveObject(child.object)
+        del self.objects[object]
+        for comp in object.components:
+            self.OnComponentRemoved(comp)
+        object.scene = None
+
+    def OnComponentAdded(self, component:Component):
+        for handler in self.componentAddedHandlers:
+            handler(component)
+
+    def OnComponentRemoved(self, component:Component):
+        for handler in self.componentRemovedHandlers:
+            handler(component)
 
     def Start(self):
-        for obj in self.objects:
-            obj.Start()
+        # Behaviours may spawn & despawn objects, skip the ones removed meanwhile
+        for obj in list(self.objects):
+            if obj.scene is self:
+                obj.Start()
 
     def Update(self):
-        for obj in self.objects:
-            obj.Update()
+        for obj in list(self.objects):
+            if obj.scene is self:
+                obj.Update()
+
+    def Raycast(self, origin, direction, layers:int = Layers.ALL, maxDistance:float = np.inf) -> RaycastHit:
+        """ Returns the closest RaycastHit of the ray on the renderers of layers, None if missed """
+        return self.RaycastMany([origin], [direction], layers, maxDistance)[0]
+
+    def RaycastMany(self, origins, directions, layers:int = Layers.ALL, maxDistance:float = np.inf) -> list:
+        """
+        Trace (R, 3) world space rays at once, returns the list of their closest RaycastHit (None if missed).
+        The rays are first tested against the bounding spheres of the objects, closest first,
+        then against the BVH of the meshes, in local space.
+        Shader displacements (e.g. tessellated terrain & water) are ignored.
+        """
+        from sea3d.core.components import Renderer
+
+        origins = np.asarray(origins, np.float64).reshape(-1, 3)
+        directions = NumpyUtils.Normalize(np.asarray(directions, np.float64).reshape(-1, 3))
+        hits = [None] * len(origins)
+        renderers = [comp for obj in self.objects if obj.layer & layers for comp in obj.components if isinstance(comp, Renderer)]
+        if not renderers or not hits:
+            return hits
+
+        matrices = np.array([renderer.object.transform.GetTRSMatrix() for renderer in renderers], np.float64)
+        spheres = [renderer.mesh.GetBoundingSphere() for renderer in renderers]
+        centers, radii = NumpyUtils.TransformSpheres(matrices, np.array([sphere[0] for sphere in spheres]), np.array([sphere[1] for sphere in spheres]))
+        entries = NumpyUtils.RaySpheres(origins, directions, centers, radii)
+
+        distances = np.full(len(origins), maxDistance, np.float64)
+        triangles = np.full(len(origins), -1, np.int64)
+        owners = np.full(len(origins), -1, np.int64)
+        barycentrics = np.zeros((len(origins), 2))
+        # Close objects first, their hits skip the objects behind them
+        for index in np.argsort(entries.min(axis = 0)):
+            rays = np.flatnonzero(entries[:, index] < distances)
+            if len(rays) == 0:
+                continue
+            # The directions are not normalized in local space, local distances stay world distances
+            inverse = renderers[index].object.transform.GetInverseTRSMatrix()
+            localOrigins = origins[rays] @ inverse[:3, :3].T + inverse[:3, 3]
+            localDirections = directions[rays] @ inverse[:3, :3].T
+            d, t, u, v = renderers[index].mesh.GetBVH().RaycastMany(localOrigins, localDirections, distances[rays])
+            hit = t >= 0
+            rays = rays[hit]
+            distances[rays] = d[hit]
+            triangles[rays] = t[hit]
+            owners[rays] = index
+            barycentrics[rays] = np.stack((u[hit], v[hit]), axis = 1)
+
+        for ray in np.flatnonzero(owners >= 0):
+            renderer = renderers[owners[ray]]
+            renderer.mesh.Acquire()
+            corners = np.asarray(renderer.mesh.vertices, np.float64)[np.asarray(renderer.mesh.indexes).reshape(-1, 3)[triangles[ray]]]
+            # Normals are transformed by the inverse transpose, and face the ray
+            normal = renderer.object.transform.GetInverseTRSMatrix()[:3, :3].T @ np.cross(corners[1] - corners[0], corners[2] - corners[0])
+            normal = (normal if normal @ directions[ray] <= 0 else -normal) / max(np.linalg.norm(normal), 1e-20)
+            hits[ray] = RaycastHit(distances[ray], origins[ray] + distances[ray] * directions[ray], normal,
+                                   int(triangles[ray]), tuple(barycentrics[ray]), renderer)
+        return hits
 
     def GetAllComponents(self):
         # TODO : Change this terrible search
@@ -95,6 +196,32 @@ class Scene:
                 sceneStr += obj.ToStr(0)
         return sceneStr
 
+class RaycastHit:
+    """
+    Closest intersection of a ray with a renderer, see Scene.Raycast
+
+    Attributes:
+        distance (float): from the ray origin
+        point, normal (np.ndarray): world space, normal of the hit triangle
+        triangle (int): index of the triangle in the mesh
+        barycentric (tuple): (u, v) weights of the second and third triangle corners
+        renderer (Renderer)
+        object (SceneObject)
+    """
+
+    def __init__(self, distance:float, point, normal, triangle:int, barycentric:tuple, renderer:Component):
+        self.distance = float(distance)
+        self.point = point
+        self.normal = normal
+        self.triangle = triangle
+        self.barycentric = barycentric
+        self.renderer = renderer
+        self.object = renderer.object
+
+    def __repr__(self):
+        return "RaycastHit(%s, distance %.3f, triangle %d)" % (self.object.name, self.distance, self.triangle)
+
+
 class Component:
     """
     Base component class for scene objects
@@ -7,12 +7,15 @@ Texture classes
 # Used for typing
 from __future__ import annotations
 
+import time
 from enum import Enum
 
 import numpy as np
 
 from PIL import Image  
 
+from sea3d.core import AssetCache, ResidencyManager, ResidencyPolicy, BlockCompression
+
 class TextureWrapMode(Enum):
     REPEAT = 0
     MIRRORED_REPEAT = 1
@@ -23,48 +26,303 @@ class TextureFilter(Enum):
     POINT = 0
     LINEAR = 1
 
+class TextureCompression(Enum):
+    NONE = "none"
+    # RGB, 8 bytes per 4x4 block
+    BC1 = "BC1"
+    # RGBA, 16 bytes per 4x4 block
+    BC3 = "BC3"
+    # RG, 16 bytes per 4x4 block, normal maps
+    BC5 = "BC5"
+
 class Texture:
+    """
+    Cache (AssetCache): decoded texels and mip chains, a hit maps them from disk instead of decoding the file
+    Residency (ResidencyManager): host memory of the textures loaded from files, evicted texels are
+                                  loaded again when data or mips are read
+
+    Attributes:
+        data: uint8[H, W, C] texels, the six faces of a cubemap
+        mips: levels 0..n of a 2D texture, None if the GPU has to generate them
+        fromFile (bool): the texels can be evicted and loaded again from the file
+        residencyPolicy (ResidencyPolicy): applied by GLTextureAtlas after the upload, to the textures loaded from files
+        pinned (bool): the texels stay in host memory, whatever the policy and budget, see Pin
+        compression (TextureCompression): GPU format, see ChooseCompression
+        blocks: uint8[H/4, W/4, B] encoded levels 0..n of a compressed texture, see CompressLevels
+    """
 
     Atlas = dict()
+    # Location -> Future of the textures being decoded by an AssetLoader
+    Pending = dict()
+    # GL cubemap faces order
+    CubemapFaces = ("right", "left", "top", "bottom", "front", "back")
 
-    def __init__(self, name:str, data):
+    Cache = AssetCache("textures")
+    # The shaders read the other textures as gamma encoded colors, see GammaToLinear
+    LinearNames = ("normal", "roughness", "metalness", "ao", "height")
+    Gamma = 2.2
+    # Files and seconds spent decoding them (cold) or mapping them from the cache (warm)
+    LoadStatistics = {"cold": [0, 0.0], "warm": [0, 0.0]}
+    Residency = ResidencyManager("Host textures", None, lambda texture: texture.Unload())
+    # Policy of the new textures
+    DefaultPolicy = ResidencyPolicy.KEEP
+    # Block compress the textures loaded from files, except the ones read as data (heights drive displacement)
+    Compress = False
+    UncompressedNames = ("height",)
+    # File -> (format, PSNR of level 0 in dB, compression ratio)
+    CompressionStatistics = dict()
+
+    def __init__(self, name:str, data, mips:list = None):
         self.name = name
         self.useMipmaps = True
         self.wrapMode = TextureWrapMode.REPEAT
         self.filter = TextureFilter.LINEAR
         self.mipLevelFilter = TextureFilter.POINT
         self.mipMapFilter = TextureFilter.LINEAR
-        self.data = data
+        self._data = data
+        self._mips = mips
         self.isCubemap = False
+        self.fromFile = False
+        self.fileExtension = None
+        self.residencyPolicy = Texture.DefaultPolicy
+        self.pinned = False
+        self.compression = TextureCompression.NONE
+        self._blocks = None
 
     def __hash__(self):
         return hash(self.name)
 
+    @property
+    def data(self):
+        if self.fromFile and not Texture.Residency.Touch(self):
+            self.Reload()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    @property
+    def mips(self):
+        if self.fromFile and not Texture.Residency.Touch(self):
+            self.Reload()
+        return self._mips
+
+    @mips.setter
+    def mips(self, mips):
+        self._mips = mips
+
+    @property
+    def blocks(self):
+        if self.fromFile and not Texture.Residency.Touch(self):
+            self.Reload()
+        return self._blocks
+
+    @blocks.setter
+    def blocks(self, blocks):
+        self._blocks = blocks
+
+    def GetHostSize(self) -> int:
+        """ Bytes of the texels, mip levels and encoded levels in host memory """
+        faces = self._data if self.isCubemap else [self._data]
+        levels = list(faces) + list(self._mips[1:] if self._mips is not None else []) + list(self._blocks or [])
+        return sum(level.nbytes for level in levels if level is not None)
+
+    def Pin(self, pinned:bool = True):
+        """ Keep the texels in host memory, for textures read by the CPU (e.g. a heightmap) """
+        self.pinned = pinned
+        Texture.Residency.Pin(self, pinned)
+
+    def ApplyResidencyPolicy(self):
+        """ Called by GLTextureAtlas once the texture is on the GPU """
+        if self.pinned or not self.fromFile or self.residencyPolicy == ResidencyPolicy.KEEP:
+            return
+        if self.residencyPolicy == ResidencyPolicy.DROP_AFTER_UPLOAD:
+            Texture.Residency.Remove(self)
+            self.Unload()
+        elif not isinstance(self._data[0] if self.isCubemap else self._data, np.memmap):
+            # Mapped from the cache entry written when it was decoded
+            self.Reload()
+
+    def Unload(self):
+        """ Drop the texels, called by Texture.Residency """
+        self._data = None
+        self._mips = None
+        self._blocks = None
+
+    def Reload(self):
+        """ Load the evicted texels again, mapped from Texture.Cache most of the time """
+        self._data, self._mips, _, self._blocks = Texture.LoadLevels(self.name, self.isCubemap, self.fileExtension)
+        Texture.Residency.Add(self, self.GetHostSize())
+
     @staticmethod
     def LoadFromFile(location:str, loadAsCubemap=False, fileExtension=None) -> Texture:
 
         if location in Texture.Atlas:
             return Texture.Atlas[location]
 
+        # Already requested to an AssetLoader, wait for it
+        if location in Texture.Pending:
+            return Texture.Pending[location].result()
+
+        data, mips, compression, blocks = Texture.LoadLevels(location, loadAsCubemap, fileExtension)
+        return Texture.Register(location, data, loadAsCubemap, mips, fileExtension, compression, blocks)
+
+    @staticmethod
+    def LoadLevels(location:str, loadAsCubemap=False, fileExtension=None):
+        """
+        Returns the (data, mips, compression, blocks) of a texture file, see DecodeLevels & CompressLevels.
+        This is safe to call from worker threads & processes.
+        """
+        files = Texture.GetFiles(location, loadAsCubemap, fileExtension)
+        if (loadAsCubemap):
+            return [Texture.DecodeLevels(file, "RGB", False)[0] for file in files], None, TextureCompression.NONE, None
+        linear = Texture.IsLinear(location)
+        levels = Texture.DecodeLevels(files[0], "RGBA", True, linear)
+        compression = Texture.ChooseCompression(location, levels[0])
+        return levels[0], levels, compression, Texture.CompressLevels(files[0], levels, compression, linear)
+
+    @staticmethod
+    def GetFiles(location:str, loadAsCubemap=False, fileExtension=None) -> list:
+        """ Image files of a texture, the six faces of a cubemap """
         if (loadAsCubemap):
             if fileExtension is None:
                 fileExtension = ".png"
-            data = [
-                np.asarray(Image.open("assets/textures/" + location + "/right" + fileExtension).convert("RGB")),
-                np.asarray(Image.open("assets/textures/" + location + "/left" + fileExtension).convert("RGB")),
-                np.asarray(Image.open("assets/textures/" + location + "/top" + fileExtension).convert("RGB")),
-                np.asarray(Image.open("assets/textures/" + location + "/bottom" + fileExtension).convert("RGB")),
-                np.asarray(Image.open("assets/textures/" + location + "/front" + fileExtension).convert("RGB")),
-                np.asarray(Image.open("assets/textures/" + location + "/back" + fileExtension).convert("RGB"))
-            ]
-        else:
-            data = np.asarray(Image.open("assets/textures/" + location).convert("RGBA"))
-        tex = Texture(location, data)
-        if loadAsCubemap:
-            tex.isCubemap = True
-        Texture.Atlas[location] = tex
-        return tex
+            return ["assets/textures/" + location + "/" + face + fileExtension for face in Texture.CubemapFaces]
+        return ["assets/textures/" + location]
 
+    @staticmethod
+    def Decode(file:str, mode:str):
+        """ Decode an image file to a numpy array, this is safe to call from worker threads & processes """
+        return np.asarray(Image.open(file).convert(mode))
+
+    @staticmethod
+    def IsLinear(location:str) -> bool:
+        """ Data textures are filtered as they are, colors are filtered in linear space """
+        name = location.lower()
+        return any(linearName in name for linearName in Texture.LinearNames)
+
+    @staticmethod
+    def DecodeLevels(file:str, mode:str, mipmaps:bool, linear:bool = False, useCache:bool = True) -> list:
+        """
+        Decoded texels of an image file followed by their mip chain, see BuildMipChain.
+        They are stored in Texture.Cache, a hit returns read only memory maps.
+        This is safe to call from worker threads & processes.
+        """
+        start = time.perf_counter()
+        key = None
+        if useCache:
+            key = Texture.Cache.MakeKey(file, mode, mipmaps, linear, Texture.Gamma)
+            records = Texture.Cache.Load(key)
+            if records is not None:
+                levels = [records[0]["level%d" % level] for level in range(len(records[0]))]
+                Texture.CountLoad("warm", start)
+                return levels
+
+        data = Texture.Decode(file, mode)
+        levels = Texture.BuildMipChain(data, linear) if mipmaps else [data]
+        if key is not None:
+            Texture.Cache.Store(key, [{"level%d" % level: data for level, data in enumerate(levels)}])
+        Texture.CountLoad("cold", start)
+        return levels
 
+    @staticmethod
+    def ChooseCompression(location:str, data) -> TextureCompression:
+        """ BC5 for normal maps, BC3 for textures with transparent texels (cutouts), BC1 for the others """
+        name = location.lower()
+        if not Texture.Compress or any(uncompressedName in name for uncompressedName in Texture.UncompressedNames):
+            return TextureCompression.NONE
+        if "normal" in name:
+            return TextureCompression.BC5
+        if data.shape[2] == 4 and data[..., 3].min() < 255:
+            return TextureCompression.BC3
+        return TextureCompression.BC1
+
+    @staticmethod
+    def CompressLevels(file:str, levels:list, compression:TextureCompression, linear:bool = False, useCache:bool = True) -> list:
+        """
+        Encoded blocks of every mip level, None for TextureCompression.NONE.
+        They are stored in Texture.Cache with the PSNR & ratio, encoding is only done once per file.
+        This is safe to call from worker threads & processes.
+        """
+        if compression == TextureCompression.NONE:
+            return None
+        key = None
+        if useCache:
+            key = Texture.Cache.MakeKey(file, "RGBA", linear, Texture.Gamma, compression.value)
+            records = Texture.Cache.Load(key)
+            if records is not None and len(records[0]) == len(levels) + 1:
+                psnr, ratio = records[0]["statistics"]
+                Texture.CompressionStatistics[file] = (compression.value, float(psnr), float(ratio))
+                return [records[0]["level%d" % level] for level in range(len(levels))]
+
+        blocks = [BlockCompression.Encode(level, compression.value) for level in levels]
+        channels = BlockCompression.Channels[compression.value]
+        height, width = levels[0].shape[0:2]
+        decoded = BlockCompression.Decode(blocks[0], compression.value, height, width)
+        psnr = BlockCompression.PSNR(levels[0][..., :channels], decoded[..., :channels])
+        ratio = sum(level.nbytes for level in levels) / sum(level.nbytes for level in blocks)
+        Texture.CompressionStatistics[file] = (compression.value, psnr, ratio)
+        if key is not None:
+            record = {"level%d" % level: data for level, data in enumerate(blocks)}
+            record["statistics"] = np.array([psnr, ratio])
+            Texture.Cache.Store(key, [record])
+        return blocks
+
+    @staticmethod
+    def ReportCompression():
+        print("Texture compression: %d textures" % len(Texture.CompressionStatistics))
+        for file, (compression, psnr, ratio) in sorted(Texture.CompressionStatistics.items()):
+            print("    %s: %s, %.2f dB PSNR, %.1f:1" % (file, compression, psnr, ratio))
 
-    
\ No newline at end of file
+    @staticmethod
+    def CountLoad(kind:str, start:float):
+        statistics = Texture.LoadStatistics[kind]
+        statistics[0] += 1
+        statistics[1] += time.perf_counter() - start
+
+    @staticmethod
+    def ReportLoading():
+        cold, warm = Texture.LoadStatistics["cold"], Texture.LoadStatistics["warm"]
+        print("Textures: %d decoded in %.2f s (cold), %d mapped from the cache in %.2f s (warm)" % (cold[0], cold[1], warm[0], warm[1]))
+
+    @staticmethod
+    def BuildMipChain(data, linear:bool = False) -> list:
+        """
+        Box filtered mip levels of uint8 (H, W, C) texels, down to 1x1. Level sizes are halved and rounded down as in GL,
+        the last row / column of odd sizes is dropped.
+        Unless linear, the color channels are averaged in linear space, alpha always is.
+        """
+        data = np.asarray(data)
+        channels = data.shape[2] if data.ndim == 3 else 1
+        colors = 0 if linear else min(channels, 3)
+        decode = np.power(np.arange(256, dtype = np.float32) / 255, Texture.Gamma)
+
+        current = data.reshape(data.shape[0], data.shape[1], channels).astype(np.float32) / 255
+        current[..., :colors] = decode[data.reshape(current.shape)[..., :colors]]
+        levels = [data]
+        while current.shape[0] > 1 or current.shape[1] > 1:
+            height, width = current.shape[0] // 2, current.shape[1] // 2
+            if height > 0:
+                current = (current[0:2 * height:2] + current[1:2 * height:2]) / 2
+            if width > 0:
+                current = (current[:, 0:2 * width:2] + current[:, 1:2 * width:2]) / 2
+            level = current.copy()
+            level[..., :colors] = np.power(level[..., :colors], 1 / Texture.Gamma)
+            levels.append(np.round(level * 255).astype(np.uint8).reshape(level.shape[:2] + data.shape[2:]))
+        return levels
+
+    @staticmethod
+    def Register(location:str, data, isCubemap=False, mips:list = None, fileExtension=None,
+                 compression:TextureCompression = TextureCompression.NONE, blocks:list = None) -> Texture:
+        """ Create the texture from the data decoded from its file and add it to the Atlas """
+        tex = Texture(location, data, mips)
+        tex.compression = compression
+        tex.blocks = blocks
+        if isCubemap:
+            tex.isCubemap = True
+        tex.fromFile = True
+        tex.fileExtension = fileExtension
+        Texture.Atlas[location] = tex
+        Texture.Residency.Add(tex, tex.GetHostSize())
+        return tex
@@ -24,6 +24,7 @@ class Transform:
         __changed (bool)
 
         _Model (Matrix4x4)
+        _version (int): incremented each time _Model is rebuilt
     """
 
     def __init__(self, parent: Transform = None):
@@ -35,6 +36,10 @@ class Transform:
         self.__changed = True
         self.__notifyChildren = True
         self.__LocalTRS = None
+        self.__parentVersion = None
+        self.__Inverse = None
+        self.__inverseVersion = None
+        self._version = 0
         self.object = None
         self._Model = self.GetTRSMatrix()
 
@@ -101,21 +106,32 @@ class Transform:
         return Vector3.Normalize(Vector3(vec3[0], vec3[1], vec3[2]))
 
     def GetTRSMatrix(self):
-        """ Returns the model matrix for this object """
+        """ Returns the model matrix for this object, rebuilt only if it or one of its parents changed """
+        parentVersion = None
+        if self._parent is not None:
+            parentModel = self._parent.GetTRSMatrix()
+            parentVersion = self._parent._version
+
         if self.__changed:
-            
-            # self._Model = ...
             self.__LocalTRS = Matrix4.Translate(self._position) @ Matrix4.Quaternion(self._rotation) @ Matrix4.Scale(self._scale)
 
+        if self.__changed or parentVersion != self.__parentVersion:
             # Hierarchical modeling
             if self._parent is not None:
-                self._Model = self._parent.GetTRSMatrix() @ self.__LocalTRS
+                self._Model = parentModel @ self.__LocalTRS
             else:
                 self._Model = self.__LocalTRS
-                
+
+            self.__parentVersion = parentVersion
             self.__changed = False
-        
-        elif self._parent:
-            self._Model = self._parent.GetTRSMatrix() @ self.__LocalTRS
+            self._version += 1
 
         return self._Model
+
+    def GetInverseTRSMatrix(self):
+        """ Returns the inverse of the model matrix, cached until the model matrix changes """
+        model = self.GetTRSMatrix()
+        if self.__inverseVersion != self._version:
+            self.__Inverse = Matrix4.AffineInverse(model)
+            self.__inverseVersion = self._version
+        return self.__Inverse
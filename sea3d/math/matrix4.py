@@ -49,3 +49,22 @@ class Matrix4:
                          [0, 0, 0, 1]], 'f')
 
 
+
+    @staticmethod
+    def AffineInverse(M):
+        """
+        Inverse of an affine matrix (rotation, scale, shear & translation), or of a (..., 4, 4) stack of them.
+        The 3x3 part is inverted with cross products, much cheaper than a generic 4x4 inversion.
+        """
+        M = np.asarray(M)
+        a0 = M[..., :3, 0]
+        a1 = M[..., :3, 1]
+        a2 = M[..., :3, 2]
+        # Rows of the inverse are orthogonal to two columns of the matrix
+        rows = np.stack((np.cross(a1, a2), np.cross(a2, a0), np.cross(a0, a1)), axis = -2)
+        det = np.sum(a0 * rows[..., 0, :], axis = -1)
+        inverse = np.zeros(M.shape, np.result_type(M.dtype, np.float32))
+        inverse[..., :3, :3] = rows / det[..., None, None]
+        inverse[..., :3, 3] = -np.einsum('...ij,...j->...i', inverse[..., :3, :3], M[..., :3, 3])
+        inverse[..., 3, 3] = 1
+        return inverse
@@ -9,4 +9,62 @@ import numpy as np
 def Normalize(a, axis = -1, order = 2):
     mag = np.atleast_1d(np.linalg.norm(a, order, axis))
     mag[mag==0] = 1
-    return a / np.expand_dims(mag, axis)
\ No newline at end of file
+    return a / np.expand_dims(mag, axis)
+
+def FrustumPlanes(viewProjection):
+    """
+    Extract the 6 planes (a, b, c, d) of a view projection matrix (Gribb & Hartmann).
+    Normals point inside the frustum and are normalized, so a.x + b.y + c.z + d is a distance.
+    """
+    M = np.asarray(viewProjection, np.float64)
+    planes = np.array([M[3] + M[0], M[3] - M[0],
+                       M[3] + M[1], M[3] - M[1],
+                       M[3] + M[2], M[3] - M[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis = 1, keepdims = True)
+
+def SpheresInFrustum(planes, centers, radii):
+    """ Returns a bool mask of the (N, 3) centers spheres intersecting the frustum planes """
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return np.all(distances >= -radii[:, None], axis = 1)
+
+def TransformSpheres(matrices, centers, radii):
+    """
+    Transform (N, 3) local spheres by a (N, 4, 4) stack of model matrices.
+    Radii are scaled by the largest axis scale, the sphere still bounds the mesh.
+    """
+    linear = matrices[:, :3, :3]
+    worldCenters = np.einsum('nij,nj->ni', linear, centers) + matrices[:, :3, 3]
+    scales = np.sqrt(np.max(np.sum(linear * linear, axis = 1), axis = 1))
+    return worldCenters, radii * scales
+
+def RaySpheres(origins, directions, centers, radii):
+    """
+    Entry distances of (R, 3) rays with unit directions into (S, 3) spheres, returns a (R, S) array.
+    Rays starting inside a sphere enter it at 0, missed spheres are at inf.
+    """
+    offsets = centers[None, :, :] - origins[:, None, :]
+    along = np.einsum('rsi,ri->rs', offsets, directions)
+    squaredDistances = np.sum(offsets * offsets, axis = 2) - along * along
+    half = np.sqrt(np.maximum(radii * radii - squaredDistances, 0))
+    entry = np.maximum(along - half, 0)
+    return np.where((squaredDistances <= radii * radii) & (along + half >= 0), entry, np.inf)
+
+def OctEncode(vectors):
+    """ Octahedral encoding of (N, 3) directions in (N, 2) normalized int16 """
+    v = np.asarray(vectors, np.float64)
+    v = v / np.maximum(np.sum(np.abs(v), axis = 1, keepdims = True), 1e-20)
+    xy = v[:, :2].copy()
+    # The lower hemisphere is folded over the diagonals
+    lower = v[:, 2] < 0
+    signs = np.where(xy[lower] >= 0, 1.0, -1.0)
+    xy[lower] = (1 - np.abs(xy[lower][:, ::-1])) * signs
+    return np.round(np.clip(xy, -1, 1) * 32767).astype(np.int16)
+
+def OctDecode(encoded):
+    """ Inverse of OctEncode, returns (N, 3) unit vectors """
+    xy = np.asarray(encoded, np.float64) / 32767
+    v = np.concatenate((xy, 1 - np.sum(np.abs(xy), axis = 1, keepdims = True)), axis = 1)
+    t = np.maximum(-v[:, 2], 0)
+    v[:, 0] -= np.where(v[:, 0] >= 0, t, -t)
+    v[:, 1] -= np.where(v[:, 1] >= 0, t, -t)
+    return Normalize(v)
@@ -1,8 +1,13 @@
+from sea3d.opengl.state import *
 from sea3d.opengl.vao import *
+from sea3d.opengl.uniform_buffer import *
 from sea3d.opengl.std_vbo import *
+from sea3d.opengl.mesh_cache import *
+from sea3d.opengl.instancing import *
 from sea3d.opengl.skybox import *
 from sea3d.opengl.textures import *
 from sea3d.opengl.std_shader import *
 from sea3d.opengl.framebuffer import *
+from sea3d.opengl.draw_list import *
 from sea3d.opengl.render_pipeline import *
 from sea3d.opengl.window import *
\ No newline at end of file
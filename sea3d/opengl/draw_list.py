@@ -0,0 +1,127 @@
+"""
+OpenGL Draw List
+@author: Eikins
+"""
+
+import bisect
+import heapq
+
+from sea3d.core import Layers
+from sea3d.core.components import Renderer
+
+class GLDrawItem:
+    """
+    A renderer and its vertex array, ordered in a draw list by its sort key
+
+    Attributes:
+        key (int): 64 bits state key
+        sortKey (tuple): key used for ordering, renderers sharing a property block are adjacent
+        renderer (Renderer)
+        vbo (GLStdVBO)
+        layer (Layers): layer of the draw list holding the item
+        states (tuple): program, texture set & mesh whose ids are in the key, see GLKeyAllocator
+        clusters (np.ndarray): visible clusters of the mesh this frame, None draws all of it
+    """
+
+    def __init__(self, key:int, renderer:Renderer, vbo, layer:Layers = None):
+        self.renderer = renderer
+        self.vbo = vbo
+        self.layer = layer
+        self.states = None
+        self.clusters = None
+        self.SetKey(key)
+
+    def SetKey(self, key:int):
+        """ Only while the item is out of its draw list """
+        self.key = key
+        self.sortKey = (key, id(self.renderer.properties), id(self.renderer))
+
+class GLKeyAllocator:
+    """
+    Refcounted small ids of the states packed in the draw list keys.
+    The id of a state no item uses anymore is reused, the smallest first, so the key fields don't
+    overflow as renderers come and go, and the state (e.g. a mesh) is not kept alive.
+    """
+
+    def __init__(self):
+        self.ids = dict()
+        self.references = dict()
+        self.free = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def Acquire(self, state) -> int:
+        if state not in self.ids:
+            # Without free ids, the ids in use are exactly 0 to len - 1
+            self.ids[state] = heapq.heappop(self.free) if self.free else len(self.ids)
+            self.references[state] = 0
+        self.references[state] += 1
+        return self.ids[state]
+
+    def Release(self, state):
+        if state not in self.references:
+            return
+        self.references[state] -= 1
+        if self.references[state] <= 0:
+            heapq.heappush(self.free, self.ids.pop(state))
+            del self.references[state]
+
+class GLDrawList:
+    """
+    Draw items sorted by a 64 bits key, from the most significant bits :
+    | layer (6) | queue (16) | program (10) | texture set (16) | vertex array (16) |
+    Consecutive items then share as much GL state as possible.
+    """
+
+    LayerShift = 58
+    QueueShift = 42
+    ProgramShift = 32
+    TextureSetShift = 16
+
+    QueueMask = (1 << 16) - 1
+    ProgramMask = (1 << 10) - 1
+    TextureSetMask = (1 << 16) - 1
+    VertexArrayMask = (1 << 16) - 1
+
+    def __init__(self):
+        self.items = []
+        self.sortKeys = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def Build(self, items):
+        """ Replace the content of the list, sorting everything once """
+        self.items = sorted(items, key = lambda item : item.sortKey)
+        self.sortKeys = [item.sortKey for item in self.items]
+
+    def Insert(self, item:GLDrawItem):
+        index = bisect.bisect_right(self.sortKeys, item.sortKey)
+        self.sortKeys.insert(index, item.sortKey)
+        self.items.insert(index, item)
+
+    def Remove(self, item:GLDrawItem):
+        index = bisect.bisect_left(self.sortKeys, item.sortKey)
+        if index < len(self.items) and self.items[index] is item:
+            del self.sortKeys[index]
+            del self.items[index]
+
+    def Update(self, item:GLDrawItem, key:int):
+        """ Move an item whose state changed, the rest of the list stays sorted """
+        sortKey = (key, id(item.renderer.properties), id(item.renderer))
+        if sortKey != item.sortKey:
+            self.Remove(item)
+            item.SetKey(key)
+            self.Insert(item)
+
+    @staticmethod
+    def MakeKey(layer:Layers, queue:int, program:int, textureSet:int, vertexArray:int) -> int:
+        return ((int(layer).bit_length() << GLDrawList.LayerShift)
+              | (min(max(queue, 0), GLDrawList.QueueMask) << GLDrawList.QueueShift)
+              | ((program & GLDrawList.ProgramMask) << GLDrawList.ProgramShift)
+              | ((textureSet & GLDrawList.TextureSetMask) << GLDrawList.TextureSetShift)
+              | (vertexArray & GLDrawList.VertexArrayMask))
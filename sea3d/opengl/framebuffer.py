@@ -8,7 +8,7 @@ import glfw
 import numpy as np
 
 from sea3d.core import PropertyBlock
-from sea3d.opengl import GLMaterialBatch, GLVertexArrayObject
+from sea3d.opengl import GLState, GLMaterialBatch, GLVertexArrayObject
 
 class GLFramebuffer:
 
@@ -22,6 +22,7 @@ class GLFramebuffer:
         self.depthTex:int = None
         self.vbo:int = None
         self.program:int = None
+        self.uniforms:dict = None
         self.texUniform:int = None
         self.depthTexUniform:int = None
         self.sizeUniform:int = None
@@ -38,8 +39,7 @@ class GLFramebuffer:
 
         # Create the buffer
         self.texture = GL.glGenTextures(1)
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        GLState.BindTexture(0, GL.GL_TEXTURE_2D, self.texture)
         # CLAMP TO EDGE to avoid border warping
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
@@ -48,7 +48,7 @@ class GLFramebuffer:
         GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, self.width, self.height, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
 
         self.depthTex = GL.glGenTextures(1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.depthTex)
+        GLState.BindTexture(0, GL.GL_TEXTURE_2D, self.depthTex)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
@@ -63,7 +63,7 @@ class GLFramebuffer:
 
         # Generate framebuffer and link all
         self.glid = GL.glGenFramebuffers(1)
-        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.glid)
+        GLState.BindFramebuffer(self.glid)
         # Link depth to the framebuffer
         GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER, GL.GL_DEPTH_ATTACHMENT, GL.GL_RENDERBUFFER, self.depth)
 
@@ -76,7 +76,7 @@ class GLFramebuffer:
             print("Error when creating framebuffer : ", status)
             noError = False
 
-        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+        GLState.BindFramebuffer(0)
 
         return noError
 
@@ -106,26 +106,25 @@ class GLFramebuffer:
             GL.glDeleteProgram(self.program)
 
         GL.glBindAttribLocation(self.program, 0, "_Coords")
-        self.texUniform = GL.glGetUniformLocation(self.program, "_MainTex")
-        self.depthTexUniform = GL.glGetUniformLocation(self.program, "_DepthTex")
-        self.sizeUniform = GL.glGetUniformLocation(self.program, "_ScreenSize")
+        self.uniforms = GLMaterialBatch.ReflectUniforms(self.program)
+        GLMaterialBatch.BindUniformBlocks(self.program)
+        self.texUniform = self.uniforms.get("_MainTex", -1)
+        self.depthTexUniform = self.uniforms.get("_DepthTex", -1)
+        self.sizeUniform = self.uniforms.get("_ScreenSize", -1)
 
     def Bind(self):
-        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.glid)
+        GLState.BindFramebuffer(self.glid)
 
     def Unbind(self):
-        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+        GLState.BindFramebuffer(0)
 
     def Draw(self, props:PropertyBlock = None):
         GL.glClear(GL.GL_COLOR_BUFFER_BIT)
-        GL.glDisable(GL.GL_DEPTH_TEST)
-        GL.glUseProgram(self.program)
+        GLState.Disable(GL.GL_DEPTH_TEST)
+        GLState.UseProgram(self.program)
 
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
-
-        GL.glActiveTexture(GL.GL_TEXTURE1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.depthTex)
+        GLState.BindTexture(0, GL.GL_TEXTURE_2D, self.texture)
+        GLState.BindTexture(1, GL.GL_TEXTURE_2D, self.depthTex)
 
         GL.glUniform1i(self.texUniform, 0)
         GL.glUniform1i(self.depthTexUniform, 1)
@@ -133,16 +132,13 @@ class GLFramebuffer:
         if props is not None:
             # Bind Properties
             for name, value in props.floatProperties.items():
-                loc = GL.glGetUniformLocation(self.program, name)
-                GL.glUniform1f(loc, value)
+                GL.glUniform1f(GLMaterialBatch.FindUniform(self.uniforms, name), value)
 
             for name, value in props.intProperties.items():
-                loc = GL.glGetUniformLocation(self.program, name)
-                GL.glUniform1i(loc, value)
+                GL.glUniform1i(GLMaterialBatch.FindUniform(self.uniforms, name), value)
         
             for name, value in props.vec3Properties.items():
-                loc = GL.glGetUniformLocation(self.program, name)
-                GL.glUniform3f(loc, value.x, value.y, value.z)
+                GL.glUniform3f(GLMaterialBatch.FindUniform(self.uniforms, name), value.x, value.y, value.z)
 
             #TODO : Add Textures
 
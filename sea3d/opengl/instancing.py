@@ -0,0 +1,60 @@
+"""
+OpenGL Instance Buffer
+@author: Eikins
+"""
+
+import ctypes
+import weakref
+
+import OpenGL.GL as GL
+
+import numpy as np
+
+from sea3d.opengl import GLStdVBO, GLVertexArrayObject
+
+class GLInstanceBuffer:
+    """
+    Packed per instance model matrices, streamed every frame.
+    Each instance is a column major mat4, read by the InModelMatrix attribute.
+    """
+
+    Location = GLStdVBO.AttributeLocations["InModelMatrix"]
+    Stride = 16 * 4
+
+    def __init__(self):
+        self.glid = None
+        self.capacity = 0
+        # Vertex arrays whose instance attributes are already enabled
+        # Weak references, a deleted vertex array name can be reused by OpenGL
+        self.vertexArrays = weakref.WeakSet()
+
+    def Init(self):
+        self.glid = GL.glGenBuffers(1)
+
+    def Upload(self, matrices:np.ndarray):
+        """ Upload a (N, 4, 4) stack of row major model matrices """
+        data = np.ascontiguousarray(matrices.transpose(0, 2, 1), np.float32)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.glid)
+        if data.nbytes > self.capacity:
+            self.capacity = max(data.nbytes, 2 * self.capacity)
+        # Orphan the previous storage, the driver doesn't have to wait for the draws still reading it
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.capacity, None, GL.GL_STREAM_DRAW)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, data.nbytes, data)
+
+    def Bind(self, vertexArray:GLVertexArrayObject, first:int):
+        """ Read the model matrices of the vertex array from the instance first """
+        vertexArray.Bind()
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.glid)
+        configure = vertexArray not in self.vertexArrays
+        for column in range(4):
+            location = GLInstanceBuffer.Location + column
+            if configure:
+                GL.glEnableVertexAttribArray(location)
+                GL.glVertexAttribDivisor(location, 1)
+            offset = first * GLInstanceBuffer.Stride + column * 16
+            GL.glVertexAttribPointer(location, 4, GL.GL_FLOAT, False, GLInstanceBuffer.Stride, ctypes.c_void_p(offset))
+        self.vertexArrays.add(vertexArray)
+
+    def __del__(self):
+        if self.glid is not None:
+            GL.glDeleteBuffers(1, [self.glid])
@@ -0,0 +1,71 @@
+"""
+OpenGL Mesh Cache
+@author: Eikins
+"""
+
+from sea3d.core import Mesh
+
+from sea3d.opengl import GLStdVBO
+
+class GLMeshCache:
+    """
+    Mesh -> vertex array residency cache.
+    A mesh used by several renderers (Renderer.Copy, the terrain & water plane) is uploaded once,
+    its vertex array is freed when the last renderer using it is released.
+
+    Attributes:
+        vertexArrays (dict): Mesh -> GLStdVBO
+        references (dict): Mesh -> number of renderers using the vertex array
+    """
+
+    def __init__(self):
+        self.vertexArrays = dict()
+        self.references = dict()
+
+    def __len__(self):
+        return len(self.vertexArrays)
+
+    def __contains__(self, mesh:Mesh):
+        return mesh in self.vertexArrays
+
+    def Acquire(self, mesh:Mesh) -> GLStdVBO:
+        """ Returns the vertex array of the mesh, uploading it on first use """
+        vertexArray = self.vertexArrays.get(mesh)
+        if vertexArray is None:
+            vertexArray = GLStdVBO(mesh)
+            vertexArray.Init()
+            self.vertexArrays[mesh] = vertexArray
+            self.references[mesh] = 0
+        self.references[mesh] += 1
+        return vertexArray
+
+    def Release(self, mesh:Mesh):
+        """ Drop a reference to the mesh, its GPU buffers are deleted with the last one """
+        if mesh not in self.references:
+            return
+        self.references[mesh] -= 1
+        if self.references[mesh] <= 0:
+            self.vertexArrays.pop(mesh).Delete()
+            del self.references[mesh]
+
+    def GetUploadedBytes(self) -> int:
+        return sum(vertexArray.size for vertexArray in self.vertexArrays.values())
+
+    def GetSavedBytes(self) -> int:
+        """ VRAM that one vertex array per renderer would have used in addition """
+        return sum(vertexArray.size * (self.references[mesh] - 1) for mesh, vertexArray in self.vertexArrays.items())
+
+    def Report(self):
+        print("Mesh cache: %d meshes for %d renderers, %.2f MB uploaded, %.2f MB saved" % (
+            len(self.vertexArrays), sum(self.references.values()),
+            self.GetUploadedBytes() / 2**20, self.GetSavedBytes() / 2**20))
+        for mesh, vertexArray in self.vertexArrays.items():
+            if vertexArray.vertexSize != vertexArray.standardVertexSize:
+                print("    %d vertices: %d -> %d bytes per vertex" % (
+                    vertexArray.vertexCount, vertexArray.standardVertexSize, vertexArray.vertexSize))
+
+    def Clear(self):
+        for vertexArray in self.vertexArrays.values():
+            vertexArray.Delete()
+        self.vertexArrays.clear()
+        self.references.clear()
@@ -12,56 +12,89 @@ from itertools import cycle
 
 from PIL import Image  
 
-from sea3d.core import Scene, Time, Material, PropertyBlock, Layers, Mesh
+from sea3d.core import Scene, Time, Material, PropertyBlock, Layers, Mesh, Texture
 from sea3d.core.components import Camera, Renderer
-from sea3d.math import Vector3, Quaternion, Matrix4
+from sea3d.math import Vector3, Quaternion, Matrix4, NumpyUtils
 
-from sea3d.opengl import GLStdVBO, GLMaterialBatch, GLTextureAtlas, GLSkybox, GLFramebuffer
+from sea3d.opengl import GLState, GLMeshCache, GLInstanceBuffer, GLMaterialBatch, GLTextureAtlas, GLSkybox, GLFramebuffer, GLDrawItem, GLDrawList, GLKeyAllocator, GLUniformBuffer
 
 class GLRenderPipeline:
 
+    # std140 FrameData block, see assets/shaders/include/frame_data.glsl
+    FrameDataSize = 160
+
+    # Shader variant reading the model matrix from the instance buffer
+    InstancingDefines = ("INSTANCING",)
+    # Shader variant decoding the compact vertex format, see GLStdVBO.CompactVertices
+    CompactVertexDefines = ("COMPACT_VERTEX",)
+    # Shader variant reading the 2D textures from texture arrays, see GLTextureAtlas.packArrays
+    TextureArrayDefines = ("TEXTURE_ARRAYS",)
+
     def __init__(self, scene:Scene, camera:Camera, width:int, height:int):
         self.scene = scene
         self.camera = camera
         self.materialBatch = GLMaterialBatch()
         self.textureAtlas = GLTextureAtlas()
         self.skybox = GLSkybox()
+        self.meshCache = GLMeshCache()
+        # Layer -> GLDrawList
         self.renderers = dict()
+        # Renderer -> GLDrawItem
+        self.drawItems = dict()
+        # Small ids used to build the sort keys, freed with the last renderer using them
+        self.programIDs = GLKeyAllocator()
+        self.textureSetIDs = GLKeyAllocator()
+        self.vertexArrayIDs = GLKeyAllocator()
         self.width = width
         self.height = height
         self.framebuffer = None
         self.postProcess = True
+        self.lightPosition = Vector3()
+        self.frameUniforms = GLUniformBuffer(GLMaterialBatch.UniformBlocks["FrameData"], GLRenderPipeline.FrameDataSize)
+        self.frameData = np.zeros(GLRenderPipeline.FrameDataSize // 4, np.float32)
+        # Renderers sharing mesh, material and property block are drawn with one instanced call
+        self.instanceBuffer = GLInstanceBuffer()
+        self.instancedMaterials = dict()
+        self.minInstances = 2
+        self.drawCalls = 0
+        # Frustum culling, counts of the last frame
+        self.frustumCulling = True
+        self.visibleCount = 0
+        self.culledCount = 0
+        # Cluster culling of the meshes with clusters, see Mesh.BuildClusters
+        self.clusterCulling = True
+        self.visibleClusters = 0
+        self.culledClusters = 0
 
     def Init(self):
         # initialize GL by setting viewport and default render characteristics
         GL.glClearColor(0.1, 0.1, 0.1, 0.1)
         # Left handed coordinate system, invert Depth Range
         GL.glDepthRange(1.0, 0.0)
-        GL.glEnable(GL.GL_DEPTH_TEST) 
-        GL.glDepthFunc(GL.GL_LESS)
-        GL.glEnable(GL.GL_CULL_FACE)
-        GL.glCullFace(GL.GL_BACK)
+        GLState.Enable(GL.GL_DEPTH_TEST)
+        GLState.DepthFunc(GL.GL_LESS)
+        GLState.Enable(GL.GL_CULL_FACE)
+        GLState.CullFace(GL.GL_BACK)
 
         self.framebuffer = GLFramebuffer(self.width, self.height, "post")
         self.framebuffer.Init()
+        self.frameUniforms.Init()
+        self.instanceBuffer.Init()
 
         # Initialize Material Batch
+        items = dict()
         for renderer in self.scene.GetAllComponents():
             if isinstance(renderer, Renderer):
-                self.materialBatch.AddMaterial(renderer.material)
-                vertexArray = GLStdVBO(renderer.mesh)
-                if (renderer.material.useTessellation):
-                    vertexArray.primitive = GL.GL_PATCHES
-                vertexArray.Init()
-                self.renderers.setdefault(renderer.object.layer, []).append((vertexArray, renderer))
-
-        # TODO : Change to dynamic sorted list
-        # Sort renderers
-        for renderers in self.renderers.values():
-            renderers.sort(key = lambda r : r[1].material.orderInQueue)
-            # print(layer)
-            # for r in renderers:
-            #    print(r[1].material.name + ":",r[1].material.orderInQueue)
+                item = self.CreateDrawItem(renderer)
+                items.setdefault(item.layer, []).append(item)
+
+        # Sort the renderers of the scene once by state, see GLDrawList
+        for layer, layerItems in items.items():
+            self.renderers.setdefault(layer, GLDrawList()).Build(layerItems)
+
+        # Then keep the draw lists sorted as renderers are added and removed
+        self.scene.componentAddedHandlers.append(self.OnComponentAdded)
+        self.scene.componentRemovedHandlers.append(self.OnComponentRemoved)
 
         self.skyboxMaterial = Material("Skybox", "skybox", "skybox")
         self.materialBatch.AddMaterial(self.skyboxMaterial)
@@ -74,7 +107,87 @@ class GLRenderPipeline:
 
         self.scene.Start()
 
+    def CreateDrawItem(self, renderer:Renderer) -> GLDrawItem:
+        """ The vertex array is created on the first draw, see PrepareItems """
+        self.materialBatch.AddMaterial(renderer.material, self.ShaderDefines(renderer))
+        item = GLDrawItem(0, renderer, None, renderer.object.layer)
+        item.SetKey(self.MakeSortKey(item))
+        self.drawItems[renderer] = item
+        return item
+
+    def OnComponentAdded(self, component):
+        if isinstance(component, Renderer) and component not in self.drawItems:
+            item = self.CreateDrawItem(component)
+            self.renderers.setdefault(item.layer, GLDrawList()).Insert(item)
+
+    def OnComponentRemoved(self, component):
+        if isinstance(component, Renderer) and component in self.drawItems:
+            item = self.drawItems.pop(component)
+            # The object may have changed of layer since, the item knows its draw list
+            self.renderers[item.layer].Remove(item)
+            self.ReleaseSortKey(item)
+            self.ReleaseVertexArray(item)
+
+    def ReleaseVertexArray(self, item:GLDrawItem):
+        """ Release the mesh the vertex array was acquired for, the renderer mesh may have been replaced since """
+        if item.vbo is not None:
+            self.meshCache.Release(item.vbo.mesh)
+            item.vbo = None
+
+    def PrepareItems(self, items:list):
+        """ Create the missing vertex arrays, renderers sharing a mesh share its vertex array """
+        for item in items:
+            if item.vbo is None:
+                item.vbo = self.meshCache.Acquire(item.renderer.mesh)
+
+    def MakeSortKey(self, item:GLDrawItem) -> int:
+        """
+        64 bits state key of the item renderer : layer, queue, program, texture set and vertex array.
+        The ids of the previous states of the item are released.
+        """
+        renderer = item.renderer
+        material = renderer.material
+        shaders = (material.vertex, material.fragment)
+        if material.useTessellation:
+            shaders += (material.tessellationControl, material.tessellationEvaluation)
+        shaders += self.ShaderDefines(renderer)
+        # Packed textures sharing an array are bound the same way, only their layers differ
+        textureSet = tuple((name, self.textureAtlas.GetArrayKey(tex) or tex) for name, tex in renderer.properties.textures.items())
+
+        # Acquired before the release, an unchanged state keeps its id
+        states = (shaders, textureSet, renderer.mesh)
+        ids = [allocator.Acquire(state) for allocator, state in zip(self.GetKeyAllocators(), states)]
+        self.ReleaseSortKey(item)
+        item.states = states
+        return GLDrawList.MakeKey(renderer.object.layer, material.orderInQueue, *ids)
+
+    def ReleaseSortKey(self, item:GLDrawItem):
+        if item.states is not None:
+            for allocator, state in zip(self.GetKeyAllocators(), item.states):
+                allocator.Release(state)
+            item.states = None
+
+    def GetKeyAllocators(self) -> tuple:
+        return (self.programIDs, self.textureSetIDs, self.vertexArrayIDs)
+
+    def RefreshRenderer(self, renderer:Renderer):
+        """ Call this when the mesh, the material, the textures or the layer of a renderer changed, to keep the draw lists sorted """
+        item = self.drawItems[renderer]
+        if item.vbo is not None and item.vbo.mesh is not renderer.mesh:
+            # Acquired again on the next draw, see PrepareItems
+            self.ReleaseVertexArray(item)
+        if item.layer != renderer.object.layer:
+            self.renderers[item.layer].Remove(item)
+            item.layer = renderer.object.layer
+            item.SetKey(self.MakeSortKey(item))
+            self.renderers.setdefault(item.layer, GLDrawList()).Insert(item)
+        else:
+            self.renderers[item.layer].Update(item, self.MakeSortKey(item))
+
     def Execute(self):
+        # GLState counters hold the calls of the last frame
+        GLState.ResetCounters()
+        self.drawCalls = 0
 
         self.materialBatch.BakeMaterials()
         self.textureAtlas.BakeTextures()
@@ -82,117 +195,295 @@ class GLRenderPipeline:
         self.scene.Update()
 
         self._Projection = self.camera.GetProjectionMatrix()
-        self._View = np.linalg.inv(self.camera.object.transform.GetTRSMatrix())
+        self._View = self.camera.GetViewMatrix()
         self._ViewPos = self.camera.object.transform._position
+        self.UpdateFrameData()
 
         if self.postProcess:
             self.framebuffer.Bind()
         self.DrawFrame()
         if self.postProcess:
             self.framebuffer.Unbind()
-            props = PropertyBlock()
-            props.SetVector3("_ViewPos", self._ViewPos)
-            props.SetFloat("_Time", Time.time)   
-            self.framebuffer.Draw(props)
+            self.framebuffer.Draw()
+
+        # The textures bound this frame stay resident
+        self.textureAtlas.EndFrame()
+        Texture.Residency.Trim()
+
+    def UpdateFrameData(self):
+        """ Upload camera and time data once per frame, shared by all programs through the FrameData block """
+        data = self.frameData
+        # std140 matrices are column major
+        data[0:16] = self._View.T.ravel()
+        data[16:32] = self._Projection.T.ravel()
+        data[32:35] = (self._ViewPos.x, self._ViewPos.y, self._ViewPos.z)
+        data[35] = Time.time
+        data[36:39] = (self.lightPosition.x, self.lightPosition.y, self.lightPosition.z)
+        self.frameUniforms.Update(data)
 
     def DrawFrame(self):
         GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
-        GL.glEnable(GL.GL_DEPTH_TEST)
-        for layer in self.renderers.keys():
-            if layer & self.camera._renderingLayer:
-                self.DrawLayer(layer)
+        GLState.Enable(GL.GL_DEPTH_TEST)
+        # Layers are drawn in the order of their sort keys
+        layers = [layer for layer in sorted(self.renderers.keys()) if layer & self.camera._renderingLayer]
+        visibleItems = self.CullItems([self.renderers[layer].items for layer in layers])
+        for layer, items in zip(layers, visibleItems):
+            self.DrawLayer(layer, items)
         self.DrawSkybox()
 
-
-    def DrawLayer(self, layer:Layers):
+    def CullItems(self, layerItems:list) -> list:
+        """
+        Frustum culling of the draw items of all the layers in one vectorized pass, the LOD of the visible
+        renderers is selected from the same bounding spheres.
+        layerItems is a list of sorted item lists, returns the visible items of each list, still sorted.
+        """
+        items = [item for itemList in layerItems for item in itemList]
+        if not items:
+            self.visibleCount = 0
+            self.culledCount = 0
+            return layerItems
+
+        spheres = [item.renderer.mesh.GetBoundingSphere() for item in items]
+        centers = np.array([center for center, _ in spheres])
+        radii = np.array([radius for _, radius in spheres])
+        matrices = np.array([item.renderer.object.transform.GetTRSMatrix() for item in items], np.float64)
+        # Shaders displacing the vertices move them out of the mesh bounds
+        paddings = [item.renderer.material.GetCullingPadding() for item in items]
+        unbounded = np.array([padding is None for padding in paddings])
+        paddings = np.array([padding or 0.0 for padding in paddings])
+
+        centers, radii = NumpyUtils.TransformSpheres(matrices, centers, radii)
+        if self.frustumCulling:
+            visible = NumpyUtils.SpheresInFrustum(self.camera.GetFrustumPlanes(), centers, radii + paddings) | unbounded
+        else:
+            visible = np.ones(len(items), bool)
+
+        # Projected diameter of the spheres, as a fraction of the screen height
+        distances = np.linalg.norm(centers - self.camera.object.transform.GetTRSMatrix()[:3, 3], axis = 1)
+        screenSizes = radii * self._Projection[1, 1] / np.maximum(distances, self.camera._near)
+        for index in np.flatnonzero(visible).tolist():
+            items[index].renderer.SelectLOD(screenSizes[index])
+
+        # Some visible spheres have no visible cluster
+        clustered = np.flatnonzero(visible & ~unbounded)
+        visible[clustered] = self.CullClusters([items[index] for index in clustered], matrices[clustered], paddings[clustered])
+
+        self.visibleCount = int(np.count_nonzero(visible))
+        self.culledCount = len(items) - self.visibleCount
+
+        visibleItems = []
+        first = 0
+        for itemList in layerItems:
+            mask = visible[first:first + len(itemList)]
+            visibleItems.append([item for item, isVisible in zip(itemList, mask) if isVisible])
+            first += len(itemList)
+        return visibleItems
+
+    def CullClusters(self, items:list, matrices:np.ndarray, paddings:np.ndarray) -> np.ndarray:
+        """
+        Frustum & normal cone culling of the clusters of the visible items, all the clusters are tested in one vectorized pass.
+        Sets item.clusters to the visible cluster indices, None draws the whole mesh (no clusters, LOD > 0 or culling disabled).
+        Cones are only tested for single sided materials which don't move the vertices, they assume uniform scales.
+        Returns the mask of the items with at least one visible cluster.
+        """
+        keep = np.ones(len(items), bool)
+        clustered = []
+        for index, item in enumerate(items):
+            item.clusters = None
+            if (self.clusterCulling and self.frustumCulling
+                and item.renderer.mesh.GetClusterCount() > 0 and item.renderer.lod == 0):
+                clustered.append(index)
+        if not clustered:
+            self.visibleClusters = 0
+            self.culledClusters = 0
+            return keep
+
+        meshes = [items[index].renderer.mesh for index in clustered]
+        counts = [mesh.GetClusterCount() for mesh in meshes]
+        owners = np.repeat(np.arange(len(clustered)), counts)
+        spheres = np.concatenate([mesh.clusterSpheres for mesh in meshes])
+        cones = np.concatenate([mesh.clusterCones for mesh in meshes])
+        clusterMatrices = matrices[clustered][owners]
+
+        centers, radii = NumpyUtils.TransformSpheres(clusterMatrices, spheres[:, :3], spheres[:, 3])
+        radii += paddings[clustered][owners]
+        visible = NumpyUtils.SpheresInFrustum(self.camera.GetFrustumPlanes(), centers, radii)
+
+        # A cluster facing away from the camera only has back faces
+        singleSided = np.array([not items[index].renderer.material.renderBothFaces and paddings[index] == 0 for index in clustered])
+        axes = NumpyUtils.Normalize(np.einsum('nij,nj->ni', clusterMatrices[:, :3, :3], cones[:, :3]))
+        offsets = centers - self.camera.object.transform.GetTRSMatrix()[:3, 3]
+        backFacing = np.sum(offsets * axes, axis = 1) > cones[:, 3] * np.linalg.norm(offsets, axis = 1) + radii
+        visible &= ~(backFacing & singleSided[owners])
+
+        self.visibleClusters = int(np.count_nonzero(visible))
+        self.culledClusters = len(visible) - self.visibleClusters
+        first = 0
+        for index, count in zip(clustered, counts):
+            clusters = np.flatnonzero(visible[first:first + count])
+            first += count
+            keep[index] = len(clusters) > 0
+            # Everything visible, one plain draw
+            items[index].clusters = clusters if len(clusters) < count else None
+        return keep
+
+    def DrawLayer(self, layer:Layers, items:list = None):
+        """ Draw the items of a layer, all of them if items is None """
         # In case of transparent & water layers, we need to activate color blending
         if layer & (Layers.TRANSPARENT | Layers.WATER):
-            GL.glEnable(GL.GL_BLEND)
+            GLState.Enable(GL.GL_BLEND)
+            GLState.BlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+        else:
+            GLState.Disable(GL.GL_BLEND)
 
-            GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+        if items is None:
+            items = self.renderers[layer].items
+        self.PrepareItems(items)
+        batches = self.BatchInstances(items)
 
         # Draw Scene
-        for vbo, renderer in self.renderers[layer]:
-
-            if renderer.material.renderBothFaces:
-                # We want to render water both sides, so disable face culling
-                GL.glDisable(GL.GL_CULL_FACE)
+        # Items are sorted by state, only rebind what differs from the previous batch
+        # Camera and time data come from the FrameData block
+        program = None
+        textureSet = None
+        for batchItems, instance in batches:
+            renderer = batchItems[0].renderer
+            defines = self.ShaderDefines(renderer)
+            if instance is not None:
+                defines += GLRenderPipeline.InstancingDefines
+
+            # We want to render water both sides, so disable face culling
+            GLState.SetCapability(GL.GL_CULL_FACE, not renderer.material.renderBothFaces)
+            # Vertex arrays are shared, the primitive depends on the material
+            primitive = GL.GL_PATCHES if renderer.material.useTessellation else GL.GL_TRIANGLES
             
-            glid = self.materialBatch.GetProgramID(renderer.material)
-
-            GL.glUseProgram(glid)
-            _ViewPTR = GL.glGetUniformLocation(glid, "_ViewMatrix")
-            _ProjPTR = GL.glGetUniformLocation(glid, "_ProjectionMatrix")
-            _ModelPTR = GL.glGetUniformLocation(glid, "_ModelMatrix")
-            _ViewPosPTR = GL.glGetUniformLocation(glid, "_ViewPos")
-            _TimePTR = GL.glGetUniformLocation(glid, "_Time")   
-            _LightPosPTR = GL.glGetUniformLocation(glid, "_LightPos")
-
-            GL.glUniformMatrix4fv(_ViewPTR, 1, True, self._View)
-            GL.glUniformMatrix4fv(_ProjPTR, 1, True, self._Projection)
-            GL.glUniformMatrix4fv(_ModelPTR, 1, True, renderer.object.transform.GetTRSMatrix())
-            GL.glUniform3f(_ViewPosPTR, self._ViewPos.x, self._ViewPos.y, self._ViewPos.z)
-            GL.glUniform1f(_TimePTR, Time.time)
- 
-            # Bind Properties
+            glid = self.materialBatch.GetProgramID(renderer.material, defines)
+
+            if glid != program:
+                program = glid
+                textureSet = None
+                uniforms = self.materialBatch.GetUniforms(glid)
+
+                GLState.UseProgram(glid)
+
+            # Bind Properties, they are shared by the whole batch
             props:PropertyBlock = renderer.properties
             for name, value in props.floatProperties.items():
-                loc = GL.glGetUniformLocation(glid, name)
-                GL.glUniform1f(loc, value)
+                GL.glUniform1f(GLMaterialBatch.FindUniform(uniforms, name), value)
 
             for name, value in props.intProperties.items():
-                loc = GL.glGetUniformLocation(glid, name)
-                GL.glUniform1i(loc, value)
+                GL.glUniform1i(GLMaterialBatch.FindUniform(uniforms, name), value)
         
             for name, value in props.vec3Properties.items():
-                loc = GL.glGetUniformLocation(glid, name)
-                GL.glUniform3f(loc, value.x, value.y, value.z)
-
-            for index, (name, tex) in enumerate(props.textures.items()):
-                if tex not in self.textureAtlas.textures:
-                    self.textureAtlas.AddTexture(tex)
-                    self.textureAtlas.BakeTextures()
-                GL.glActiveTexture(GL.GL_TEXTURE0 + index)
-                if tex.isCubemap:
-                    GL.glBindTexture(GL.GL_TEXTURE_CUBE_MAP, self.textureAtlas.textures[tex])
+                GL.glUniform3f(GLMaterialBatch.FindUniform(uniforms, name), value.x, value.y, value.z)
+
+            textures = tuple(props.textures.items())
+            if textures != textureSet:
+                textureSet = textures
+                for index, (name, tex) in enumerate(textures):
+                    textureID = self.textureAtlas.Use(tex)
+                    textureLayer = self.textureAtlas.GetLayer(tex)
+                    if textureLayer is not None:
+                        GLState.BindTexture(index, GL.GL_TEXTURE_2D_ARRAY, textureID)
+                        GL.glUniform1f(GLMaterialBatch.FindUniform(uniforms, name + "Layer"), textureLayer)
+                    else:
+                        target = GL.GL_TEXTURE_CUBE_MAP if tex.isCubemap else GL.GL_TEXTURE_2D
+                        GLState.BindTexture(index, target, textureID)
+                    GL.glUniform1i(GLMaterialBatch.FindUniform(uniforms, name), index)
+
+            if instance is not None:
+                vbo = batchItems[0].vbo
+                self.instanceBuffer.Bind(vbo, instance)
+                vbo.DrawInstanced(len(batchItems), primitive, renderer.lod)
+                self.drawCalls += 1
+            else:
+                modelLocation = uniforms.get("_ModelMatrix", -1)
+                for item in batchItems:
+                    GL.glUniformMatrix4fv(modelLocation, 1, True, item.renderer.object.transform.GetTRSMatrix())
+                    if item.clusters is not None:
+                        item.vbo.DrawClusters(item.clusters, primitive)
+                    else:
+                        item.vbo.Draw(primitive, item.renderer.lod)
+                self.drawCalls += len(batchItems)
+
+    def BatchInstances(self, items) -> list:
+        """
+        Split sorted items in batches of renderers sharing mesh, LOD, material and property block.
+        Returns a list of (batch items, first instance), first instance is None when
+        the batch is drawn without instancing. The model matrices of all the instanced
+        batches are uploaded at once in the instance buffer.
+        """
+        batches = []
+        matrices = []
+        first = 0
+        while first < len(items):
+            renderer = items[first].renderer
+            last = first + 1
+            while (last < len(items) 
+                   and items[last].renderer.mesh is renderer.mesh
+                   and items[last].renderer.material == renderer.material
+                   and items[last].renderer.properties is renderer.properties):
+                last += 1
+
+            # The draw list doesn't order by LOD, the renderers of a run pick theirs every frame
+            lods = dict()
+            for item in items[first:last]:
+                lods.setdefault(item.renderer.lod, []).append(item)
+
+            for lodItems in lods.values():
+                if len(lodItems) >= self.minInstances and self.PrepareInstancing(renderer.material, self.ShaderDefines(renderer)):
+                    batches.append((lodItems, len(matrices)))
+                    matrices += [item.renderer.object.transform.GetTRSMatrix() for item in lodItems]
                 else:
-                    GL.glBindTexture(GL.GL_TEXTURE_2D, self.textureAtlas.textures[tex])
-                loc = GL.glGetUniformLocation(glid, name)
-                GL.glUniform1i(loc, index)
-
-            vbo.Draw()
-
-            if renderer.material.renderBothFaces:
-                # Reset OpenGL State
-                GL.glDisable(GL.GL_CULL_FACE)
-
-        # Reset OpenGL states
-        if layer & (Layers.TRANSPARENT | Layers.WATER):
-            GL.glDisable(GL.GL_BLEND)
+                    batches.append((lodItems, None))
+            first = last
+
+        if matrices:
+            self.instanceBuffer.Upload(np.array(matrices, np.float32))
+        return batches
+
+    def PrepareInstancing(self, material:Material, defines:tuple = ()) -> bool:
+        """ Bake the instanced variant of a material, returns False if its shaders don't support instancing """
+        key = (material, defines)
+        if key not in self.instancedMaterials:
+            defines += GLRenderPipeline.InstancingDefines
+            self.materialBatch.AddMaterial(material, defines)
+            self.materialBatch.BakeMaterials()
+            supported = False
+            if self.materialBatch.HasProgram(material, defines):
+                glid = self.materialBatch.GetProgramID(material, defines)
+                supported = GL.glGetAttribLocation(glid, "InModelMatrix") != -1
+            self.instancedMaterials[key] = supported
+        return self.instancedMaterials[key]
+
+    @staticmethod
+    def VertexDefines(mesh:Mesh) -> tuple:
+        """ Shader variant matching the vertex format of the mesh """
+        return GLRenderPipeline.CompactVertexDefines if mesh.compactVertexFormat else ()
+
+    def ShaderDefines(self, renderer:Renderer) -> tuple:
+        """ Shader variant of a renderer, matching its vertex format and the texture packing """
+        defines = GLRenderPipeline.VertexDefines(renderer.mesh)
+        if self.textureAtlas.packArrays:
+            defines += GLRenderPipeline.TextureArrayDefines
+        return defines
 
     def DrawSkybox(self):
         # Draw skybox at the end (avoiding fragment shader overhead)
         if self.camera._skybox is not None:
-            if self.camera._skybox not in self.textureAtlas.textures:
-                self.textureAtlas.AddTexture(self.camera._skybox)
-                self.textureAtlas.BakeTextures()
             glid = self.materialBatch.GetProgramID(self.skyboxMaterial)
-            GL.glUseProgram(glid)
-            GL.glActiveTexture(GL.GL_TEXTURE0)
-            GL.glBindTexture(GL.GL_TEXTURE_CUBE_MAP, self.textureAtlas.textures[self.camera._skybox])
-
-            _ViewPTR = GL.glGetUniformLocation(glid, "_ViewMatrix")
-            _ProjPTR = GL.glGetUniformLocation(glid, "_ProjectionMatrix")
-
-            GL.glUniformMatrix4fv(_ViewPTR, 1, True, self._View)
-            GL.glUniformMatrix4fv(_ProjPTR, 1, True, self._Projection)
-
-            loc = GL.glGetUniformLocation(glid, "_Skybox")
-            GL.glUniform1i(loc, 0)
+            uniforms = self.materialBatch.GetUniforms(glid)
+            GLState.UseProgram(glid)
+            # The cube is seen from the inside
+            GLState.Disable(GL.GL_CULL_FACE)
+            GLState.Disable(GL.GL_BLEND)
+            GLState.BindTexture(0, GL.GL_TEXTURE_CUBE_MAP, self.textureAtlas.Use(self.camera._skybox))
+
+            GL.glUniform1i(uniforms.get("_Skybox", -1), 0)
             self.skybox.Draw()
 
     def FrameBufferToFile(self):   
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.framebuffer.texture)
+        GLState.BindTexture(0, GL.GL_TEXTURE_2D, self.framebuffer.texture)
         data = GL.glGetTexImage(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
         img = Image.fromarray(np.reshape(np.fromstring(data, np.uint8), (self.height, self.width, 4)))
         img.save("framebuffer.png", "PNG")
\ No newline at end of file
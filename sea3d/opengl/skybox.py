@@ -9,7 +9,7 @@ import numpy as np
 
 from sea3d.core import Mesh
 
-from sea3d.opengl import GLVertexArrayObject
+from sea3d.opengl import GLState, GLVertexArrayObject
 
 class GLSkybox(GLVertexArrayObject):
 
@@ -39,6 +39,6 @@ class GLSkybox(GLVertexArrayObject):
         super().Init([self.vertices], self.indexes)
 
     def Draw(self):
-        GL.glDepthFunc(GL.GL_LEQUAL)
+        GLState.DepthFunc(GL.GL_LEQUAL)
         super().Draw()
-        GL.glDepthFunc(GL.GL_LESS)
+        GLState.DepthFunc(GL.GL_LESS)
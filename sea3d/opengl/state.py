@@ -0,0 +1,120 @@
+"""
+OpenGL State Cache
+@author: Eikins
+"""
+
+import OpenGL.GL as GL
+
+class GLStateCache:
+    """
+    Shadow copy of the OpenGL state.
+    Each PyOpenGL call costs Python overhead, so calls that would not change
+    the current state are dropped. All the GL classes must go through GLState,
+    otherwise the shadow copy is out of date and Invalidate() must be called.
+
+    Attributes:
+        issued (int): calls forwarded to OpenGL since the last ResetCounters
+        skipped (int): redundant calls dropped since the last ResetCounters
+    """
+
+    def __init__(self):
+        self.issued = 0
+        self.skipped = 0
+        self.Invalidate()
+
+    def Invalidate(self):
+        """ Forget the shadowed state, the next calls are always issued """
+        self.capabilities = dict()
+        self.program = None
+        self.activeTexture = None
+        # (unit, target) -> texture
+        self.textures = dict()
+        self.vertexArray = None
+        self.framebuffer = None
+        self.blendFunc = None
+        self.depthFunc = None
+        self.cullFace = None
+
+    def ResetCounters(self):
+        self.issued = 0
+        self.skipped = 0
+
+    def _Changed(self, changed:bool) -> bool:
+        if changed:
+            self.issued += 1
+        else:
+            self.skipped += 1
+        return changed
+
+    def SetCapability(self, capability:int, enabled:bool):
+        if self._Changed(self.capabilities.get(capability) != enabled):
+            self.capabilities[capability] = enabled
+            if enabled:
+                GL.glEnable(capability)
+            else:
+                GL.glDisable(capability)
+
+    def Enable(self, capability:int):
+        self.SetCapability(capability, True)
+
+    def Disable(self, capability:int):
+        self.SetCapability(capability, False)
+
+    def UseProgram(self, program:int):
+        if self._Changed(self.program != program):
+            self.program = program
+            GL.glUseProgram(program)
+
+    def ActiveTexture(self, unit:int):
+        if self._Changed(self.activeTexture != unit):
+            self.activeTexture = unit
+            GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+
+    def BindTexture(self, unit:int, target:int, texture:int):
+        """ Bind texture to target on the texture unit, only switching the active unit if needed """
+        if self._Changed(self.textures.get((unit, target)) != texture):
+            self.ActiveTexture(unit)
+            self.textures[(unit, target)] = texture
+            GL.glBindTexture(target, texture)
+
+    def BindVertexArray(self, vertexArray:int):
+        if self._Changed(self.vertexArray != vertexArray):
+            self.vertexArray = vertexArray
+            GL.glBindVertexArray(vertexArray)
+
+    def BindFramebuffer(self, framebuffer:int):
+        if self._Changed(self.framebuffer != framebuffer):
+            self.framebuffer = framebuffer
+            GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, framebuffer)
+
+    def BlendFunc(self, source:int, destination:int):
+        if self._Changed(self.blendFunc != (source, destination)):
+            self.blendFunc = (source, destination)
+            GL.glBlendFunc(source, destination)
+
+    def DepthFunc(self, func:int):
+        if self._Changed(self.depthFunc != func):
+            self.depthFunc = func
+            GL.glDepthFunc(func)
+
+    def CullFace(self, mode:int):
+        if self._Changed(self.cullFace != mode):
+            self.cullFace = mode
+            GL.glCullFace(mode)
+
+    def ForgetTexture(self, texture:int):
+        """ Deleted names can be reused by OpenGL, drop them from the shadowed bindings """
+        for binding, bound in list(self.textures.items()):
+            if bound == texture:
+                del self.textures[binding]
+
+    def ForgetVertexArray(self, vertexArray:int):
+        if self.vertexArray == vertexArray:
+            self.vertexArray = None
+
+    def ForgetProgram(self, program:int):
+        if self.program == program:
+            self.program = None
+
+# There is only one GL context, its state is shared by all the GL classes
+GLState = GLStateCache()
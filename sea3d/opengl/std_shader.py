@@ -6,10 +6,18 @@ import os
 import OpenGL.GL as GL
 
 from sea3d.core import Material
-from sea3d.opengl import GLStdVBO
+from sea3d.opengl import GLState, GLStdVBO
 
 class GLMaterialBatch:
 
+    # Fixed binding points of the uniform blocks shared by all shaders
+    UniformBlocks = {
+        "FrameData":0
+    }
+
+    # Directory used to resolve #include "file" directives
+    IncludeDirectory = "assets/shaders/"
+
     def __init__(self):
         self.materialsToBake = []
         self.vertexShaders = dict()
@@ -18,38 +26,32 @@ class GLMaterialBatch:
         self.tesselationEvaluationShaders = dict()
         self.programs = dict()
         self.materialPrograms = dict()
+        # Uniform locations of each linked program, name -> location
+        self.uniformLocations = dict()
 
-    def AddMaterial(self, material:Material):
-        self.materialsToBake += [material]
+    def AddMaterial(self, material:Material, defines:tuple = ()):
+        """ defines are injected in every stage, they select a shader variant (e.g. INSTANCING) """
+        self.materialsToBake += [(material, defines)]
 
     def BakeMaterials(self):
-        for material in self.materialsToBake:
+        for material, defines in self.materialsToBake:
 
-            if material.vertex not in self.vertexShaders:
-                vertex = self.vertexShaders[material.vertex] = GLMaterialBatch.Compile("assets/shaders/" + material.vertex + ".vert", GL.GL_VERTEX_SHADER)
-            else:
-                vertex = self.vertexShaders[material.vertex]
+            if (material, defines) in self.materialPrograms:
+                continue
 
-            if material.fragment not in self.fragmentShaders:
-                frag = self.fragmentShaders[material.fragment] = GLMaterialBatch.Compile("assets/shaders/" + material.fragment + ".frag", GL.GL_FRAGMENT_SHADER)
-            else:
-                frag = self.fragmentShaders[material.fragment]
+            vertex = self.GetShader(self.vertexShaders, material.vertex, ".vert", GL.GL_VERTEX_SHADER, defines)
+            frag = self.GetShader(self.fragmentShaders, material.fragment, ".frag", GL.GL_FRAGMENT_SHADER, defines)
 
             # Add Tessellation support
             if material.useTessellation:
-                if material.tessellationControl not in self.tesselationControlShaders:
-                    tcs = self.tesselationControlShaders[material.tessellationControl] = GLMaterialBatch.Compile("assets/shaders/" + material.tessellationControl + ".tcs", GL.GL_TESS_CONTROL_SHADER)
-                else:
-                    tcs = self.tesselationControlShaders[material.tessellationControl]
-
-                if material.tessellationEvaluation not in self.tesselationEvaluationShaders:
-                    tes = self.tesselationEvaluationShaders[material.tessellationEvaluation] = GLMaterialBatch.Compile("assets/shaders/" + material.tessellationEvaluation + ".tes", GL.GL_TESS_EVALUATION_SHADER)
-                else:
-                    tes = self.tesselationEvaluationShaders[material.tessellationEvaluation]
-            # 
+                tcs = self.GetShader(self.tesselationControlShaders, material.tessellationControl, ".tcs", GL.GL_TESS_CONTROL_SHADER, defines)
+                tes = self.GetShader(self.tesselationEvaluationShaders, material.tessellationEvaluation, ".tes", GL.GL_TESS_EVALUATION_SHADER, defines)
+                shaders = (vertex, frag, tcs, tes)
+            else:
+                shaders = (vertex, frag)
 
-            if (vertex, frag) in self.programs:
-                self.materialPrograms[material] = self.programs[(vertex, frag)]
+            if shaders in self.programs:
+                self.materialPrograms[(material, defines)] = self.programs[shaders]
             else:
                 glid = GL.glCreateProgram()
                 GL.glAttachShader(glid, vertex)
@@ -70,15 +72,31 @@ class GLMaterialBatch:
                     print(GL.glGetProgramInfoLog(glid).decode("ascii"))
                     GL.glDeleteProgram(glid)
                 else:
-                    self.materialPrograms[material] = glid
+                    self.programs[shaders] = glid
+                    self.materialPrograms[(material, defines)] = glid
+                    self.uniformLocations[glid] = GLMaterialBatch.ReflectUniforms(glid)
+                    GLMaterialBatch.BindUniformBlocks(glid)
         
         self.materialsToBake.clear()
 
-    def BindProgram(self, material:Material):
-        GL.glUseProgram(self.materialPrograms[material]) 
+    def GetShader(self, shaders:dict, name:str, extension:str, shader_type, defines:tuple):
+        """ Compile a shader stage once per variant """
+        if (name, defines) not in shaders:
+            shaders[(name, defines)] = GLMaterialBatch.Compile("assets/shaders/" + name + extension, shader_type, defines)
+        return shaders[(name, defines)]
+
+    def BindProgram(self, material:Material, defines:tuple = ()):
+        GLState.UseProgram(self.materialPrograms[(material, defines)])
+
+    def HasProgram(self, material:Material, defines:tuple = ()) -> bool:
+        return (material, defines) in self.materialPrograms
 
-    def GetProgramID(self, material:Material):
-        return self.materialPrograms[material]  
+    def GetProgramID(self, material:Material, defines:tuple = ()):
+        return self.materialPrograms[(material, defines)]  
+
+    def GetUniforms(self, glid:int) -> dict:
+        """ Returns the uniform table (name -> location) of a linked program """
+        return self.uniformLocations[glid]
 
     def __del__(self):
         for vertex in self.vertexShaders.values():
@@ -87,14 +105,53 @@ class GLMaterialBatch:
         for frag in self.fragmentShaders.values():
             GL.glDeleteShader(frag)
 
-        for program in self.materialPrograms.values():
+        for program in self.programs.values():
+            GLState.ForgetProgram(program)
             GL.glDeleteProgram(program)
 
+    @staticmethod
+    def ReflectUniforms(program:int) -> dict:
+        """ Query all the active uniforms of a linked program once, returns a name -> location table """
+        uniforms = dict()
+        count = GL.glGetProgramiv(program, GL.GL_ACTIVE_UNIFORMS)
+        for index in range(count):
+            name, _size, _type = GL.glGetActiveUniform(program, index)
+            name = name.decode("ascii") if isinstance(name, bytes) else name
+            # Arrays are reported as "name[0]"
+            if name.endswith("[0]"):
+                name = name[:-3]
+            location = GL.glGetUniformLocation(program, name)
+            # Uniforms inside blocks don't have a location
+            if location != -1:
+                uniforms[name] = location
+        return uniforms
+
+    @staticmethod
+    def BindUniformBlocks(program:int):
+        """ Attach the uniform blocks used by the program to their fixed binding points """
+        for name, binding in GLMaterialBatch.UniformBlocks.items():
+            index = GL.glGetUniformBlockIndex(program, name)
+            if index != GL.GL_INVALID_INDEX:
+                GL.glUniformBlockBinding(program, index, binding)
+
+    @staticmethod
+    def FindUniform(uniforms:dict, name:str) -> int:
+        """
+        Returns the location of name in a reflected uniform table.
+        Unknown names are reported once and then cached as -1, GL ignores this location.
+        """
+        location = uniforms.get(name)
+        if location is None:
+            print("Warning: uniform", name, "is not used by the program, it will be ignored")
+            location = uniforms[name] = -1
+        return location
+
     
     @staticmethod
-    def Compile(src, shader_type):
+    def Compile(src, shader_type, defines:tuple = ()):
         src = open(src, "r").read() if os.path.exists(src) else src
         src = src.decode("ascii") if isinstance(src, bytes) else src
+        src = GLMaterialBatch.Preprocess(src, defines)
         shader = GL.glCreateShader(shader_type) # pylint: disable=E1111
         GL.glShaderSource(shader, src)
         GL.glCompileShader(shader)
@@ -106,4 +163,27 @@ class GLMaterialBatch:
             src = '\n'.join(src)
             print('Compile failed for %s\n%s\n%s' % (shader_type, log, src))
             return None
-        return shader
\ No newline at end of file
+        return shader
+
+    @staticmethod
+    def Preprocess(src:str, defines:tuple = (), included:set = None) -> str:
+        """
+        Resolve #include "file" directives, GLSL doesn't support them.
+        defines are added right after the #version directive.
+        """
+        if included is None:
+            included = set()
+        lines = []
+        for line in src.splitlines():
+            if line.strip().startswith("#version"):
+                lines.append(line)
+                lines += ["#define " + define for define in defines]
+            elif line.strip().startswith("#include"):
+                name = line.strip()[len("#include"):].strip().strip('"')
+                if name not in included:
+                    included.add(name)
+                    include = open(GLMaterialBatch.IncludeDirectory + name, "r").read()
+                    lines.append(GLMaterialBatch.Preprocess(include, (), included))
+            else:
+                lines.append(line)
+        return "\n".join(lines)
@@ -3,13 +3,16 @@ OpenGL Vertex Array
 @author: Eikins
 """
 
+import ctypes
+
 import OpenGL.GL as GL
 
 import numpy as np
 
 from sea3d.core import Mesh
+from sea3d.math import NumpyUtils
 
-from sea3d.opengl import GLVertexArrayObject
+from sea3d.opengl import GLState, GLVertexArrayObject
 
 class GLStdVBO(GLVertexArrayObject):
 
@@ -24,22 +27,102 @@ class GLStdVBO(GLVertexArrayObject):
         "InTexCoord4":7,
         "InTexCoord5":8,
         "InTexCoord6":9,
-        "InTexCoord7":10
+        "InTexCoord7":10,
+        "InModelMatrix":11 # Instancing only, a mat4 uses locations 11 to 14
     }
 
     def __init__(self, mesh:Mesh):
         super().__init__()
         self.mesh = mesh
         self.primitive = GL.GL_TRIANGLES
+        # Bytes per vertex on the GPU, and with the standard float layout
+        self.vertexSize = 0
+        self.standardVertexSize = 0
+        self.vertexCount = 0
 
     def Init(self):
+        # The data may have been dropped after a previous upload
+        self.mesh.Acquire()
+
+        # LODs are stored after LOD 0 in the index buffer
+        lods = [np.asarray(self.mesh.GetLODIndexes(lod), np.int32) for lod in range(self.mesh.GetLODCount())]
+        indexes = np.concatenate(lods) if len(lods) > 1 else lods[0]
+
+        self.standardVertexSize = GLStdVBO.StandardVertexSize(self.mesh)
+        if self.mesh.compactVertexFormat:
+            vertices, locations = GLStdVBO.CompactVertices(self.mesh)
+            super().InitInterleaved(vertices, locations, indexes)
+            self.vertexSize = vertices.dtype.itemsize
+        else:
+            attributes = [self.mesh.vertices, self.mesh.normals, self.mesh.tangents]
+            if self.mesh.uvs is not None:
+                attributes += self.mesh.uvs
+            super().Init(attributes, indexes)
+            self.vertexSize = self.standardVertexSize
+
+        self.lodArguments = [self.arguments]
+        if self.draw_command == GL.glDrawElements:
+            offset = 0
+            self.lodArguments = []
+            for indexes in lods:
+                self.lodArguments += [(indexes.size, GL.GL_UNSIGNED_INT, ctypes.c_void_p(offset * 4))]
+                offset += indexes.size
+
+        self.vertexCount = len(self.mesh.vertices)
+        self.mesh.ApplyResidencyPolicy()
+
+    @staticmethod
+    def StandardVertexSize(mesh:Mesh) -> int:
+        """ Bytes per vertex with one float32 buffer per attribute """
+        attributes = [mesh.vertices, mesh.normals, mesh.tangents] + list(mesh.uvs or [])
+        return sum(4 * np.shape(data)[1] for data in attributes if data is not None)
+
+    @staticmethod
+    def CompactVertices(mesh:Mesh):
+        """
+        Interleaved compact vertices : float32 positions, octahedral int16 normals & tangents, half float uvs.
+        Returns the structured array and its field -> attribute location table.
+        Half float uvs lose precision above a few hundreds, don't use it with large repeated uvs.
+        """
+        fields = [("InPosition", np.float32, 3), ("InNormal", np.int16, 2)]
+        if mesh.tangents is not None:
+            fields += [("InTangent", np.int16, 2)]
+        uvs = list(mesh.uvs or [])
+        fields += [("InTexCoord%d" % channel, np.float16, 2) for channel in range(len(uvs))]
+
+        vertices = np.empty(len(mesh.vertices), np.dtype([(name, dtype, (count,)) for name, dtype, count in fields]))
+        vertices["InPosition"] = mesh.vertices
+        vertices["InNormal"] = NumpyUtils.OctEncode(mesh.normals)
+        if mesh.tangents is not None:
+            vertices["InTangent"] = NumpyUtils.OctEncode(mesh.tangents)
+        for channel, uv in enumerate(uvs):
+            vertices["InTexCoord%d" % channel] = uv
 
-        attributes = [self.mesh.vertices, self.mesh.normals, self.mesh.tangents]
-        if self.mesh.uvs is not None:
-            attributes += self.mesh.uvs
+        return vertices, {name: GLStdVBO.AttributeLocations[name] for name, _, _ in fields}
 
-        super().Init(attributes, self.mesh.indexes)
+    def Draw(self, primitive = None, lod:int = 0):
+        GLState.BindVertexArray(self.glid)
+        arguments = self.lodArguments[min(lod, len(self.lodArguments) - 1)]
+        self.draw_command(self.primitive if primitive is None else primitive, *arguments)
 
+    def DrawClusters(self, clusters:np.ndarray, primitive = None):
+        """ Draw sorted LOD 0 clusters with one glMultiDrawElements, consecutive clusters are one range """
+        GLState.BindVertexArray(self.glid)
+        offsets = self.mesh.clusterOffsets
+        breaks = np.flatnonzero(np.diff(clusters) != 1) + 1
+        firsts = clusters[np.concatenate(([0], breaks))]
+        lasts = clusters[np.concatenate((breaks - 1, [len(clusters) - 1]))]
+        starts = offsets[firsts] * 3
+        counts = np.asarray(offsets[lasts + 1] * 3 - starts, np.int32)
+        # Byte offsets in the index buffer
+        pointers = (ctypes.c_void_p * len(starts))(*(starts * 4).tolist())
+        GL.glMultiDrawElements(self.primitive if primitive is None else primitive, counts, GL.GL_UNSIGNED_INT, pointers, len(counts))
 
-    def Draw(self):
-        super().Draw()
+    def DrawInstanced(self, count:int, primitive = None, lod:int = 0):
+        GLState.BindVertexArray(self.glid)
+        primitive = self.primitive if primitive is None else primitive
+        arguments = self.lodArguments[min(lod, len(self.lodArguments) - 1)]
+        if self.draw_command == GL.glDrawElements:
+            GL.glDrawElementsInstanced(primitive, *arguments, count)
+        else:
+            GL.glDrawArraysInstanced(primitive, *arguments, count)
@@ -5,12 +5,124 @@ OpenGL Window stuff
 import os
 import OpenGL.GL as GL
 
+from OpenGL.GL.EXT.texture_compression_s3tc import GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+
 import numpy as np
 
-from sea3d.core import Texture, TextureFilter, TextureWrapMode
-from sea3d.opengl import GLStdVBO
+from sea3d.core import Texture, TextureFilter, TextureWrapMode, TextureCompression, ResidencyManager, BlockCompression
+from sea3d.opengl import GLState, GLStdVBO
+
+class GLTextureArray:
+    """
+    2D textures of the same size, levels, sampling and compression packed in the layers of a GL_TEXTURE_2D_ARRAY.
+    The array grows by doubling its layer count, the layers freed by deleted textures are reused.
+    It is a single resource of the atlas residency, charged for all its layers, see GetSize.
+    """
+
+    def __init__(self, key:tuple):
+        self.key = key
+        self.glid = None
+        # Layer -> Texture, None for free layers
+        self.layers = []
+
+    def GetTextureCount(self) -> int:
+        return len(self.layers) - self.layers.count(None)
+
+    def Add(self, textures:list) -> bool:
+        """ Place textures in free layers, returns True if the array had to grow, its layers must then be uploaded again """
+        free = [layer for layer, texture in enumerate(self.layers) if texture is None]
+        grow = len(textures) > len(free)
+        if grow:
+            capacity = max(2 * len(self.layers), len(self.layers) - len(free) + len(textures))
+            free += list(range(len(self.layers), capacity))
+            self.layers += [None] * (capacity - len(self.layers))
+        for layer, texture in zip(free, textures):
+            self.layers[layer] = texture
+        return grow
+
+    def Remove(self, texture:Texture):
+        self.layers[self.layers.index(texture)] = None
+
+    def GetSize(self) -> int:
+        """ VRAM bytes of all the layers, used or free, the GPU generated mips are a third of level 0 """
+        width, height, levels = self.key[0:3]
+        compression = self.key[8]
+        size = 0
+        for level in range(max(levels, 1)):
+            levelWidth, levelHeight = max(width >> level, 1), max(height >> level, 1)
+            if compression != TextureCompression.NONE:
+                size += ((levelWidth + 3) // 4) * ((levelHeight + 3) // 4) * BlockCompression.BlockBytes[compression.value]
+            else:
+                size += levelWidth * levelHeight * 4
+        if levels == 0:
+            size = size * 4 // 3
+        return size * len(self.layers)
+
+    def Allocate(self):
+        """ Create the GL array with all its layers, the previous one is deleted """
+        self.Delete()
+        width, height, levels = self.key[0:3]
+        compression = self.key[8]
+        self.glid = int(np.atleast_1d(GL.glGenTextures(1))[0])
+        GLState.BindTexture(0, GL.GL_TEXTURE_2D_ARRAY, self.glid)
+        # GPU generated mips are allocated by glGenerateMipmap
+        for level in range(max(levels, 1)):
+            levelWidth, levelHeight = max(width >> level, 1), max(height >> level, 1)
+            if compression != TextureCompression.NONE:
+                size = ((levelWidth + 3) // 4) * ((levelHeight + 3) // 4) * BlockCompression.BlockBytes[compression.value] * len(self.layers)
+                GL.glCompressedTexImage3D(GL.GL_TEXTURE_2D_ARRAY, level, GLTextureAtlas.CompressedFormats[compression],
+                                          levelWidth, levelHeight, len(self.layers), 0, size, None)
+            else:
+                GL.glTexImage3D(GL.GL_TEXTURE_2D_ARRAY, level, GL.GL_RGBA, levelWidth, levelHeight,
+                                len(self.layers), 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
+
+        wrapMode, filter, useMipmaps, mipLevelFilter, mipMapFilter = self.key[3:8]
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_WRAP_S, GLTextureAtlas.WrapModes[wrapMode])
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_WRAP_T, GLTextureAtlas.WrapModes[wrapMode])
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MAG_FILTER, GLTextureAtlas.Filters[filter])
+        if useMipmaps:
+            GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MIN_FILTER, GLTextureAtlas.MipFilters[(mipLevelFilter, mipMapFilter)])
+            if levels > 0:
+                GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MAX_LEVEL, levels - 1)
+        else:
+            GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MIN_FILTER, GLTextureAtlas.Filters[filter])
+
+    def Upload(self, textures:list):
+        """ Copy the texels & CPU mips of textures in their layers """
+        GLState.BindTexture(0, GL.GL_TEXTURE_2D_ARRAY, self.glid)
+        width, height, levels = self.key[0:3]
+        compression = self.key[8]
+        for texture in textures:
+            layer = self.layers.index(texture)
+            if compression != TextureCompression.NONE:
+                for level, blocks in enumerate(texture.blocks[:levels]):
+                    GL.glCompressedTexSubImage3D(GL.GL_TEXTURE_2D_ARRAY, level, 0, 0, layer, max(width >> level, 1), max(height >> level, 1), 1,
+                                                 GLTextureAtlas.CompressedFormats[compression], blocks.nbytes, blocks)
+                continue
+            data = texture.mips[:levels] if levels > 1 else [texture.data]
+            for level, texels in enumerate(data):
+                levelHeight, levelWidth = texels.shape[0:2]
+                GL.glTexSubImage3D(GL.GL_TEXTURE_2D_ARRAY, level, 0, 0, layer, levelWidth, levelHeight, 1, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, texels)
+        if levels == 0:
+            GL.glGenerateMipmap(GL.GL_TEXTURE_2D_ARRAY)
+
+    def Delete(self):
+        if self.glid is not None:
+            GLState.ForgetTexture(self.glid)
+            GL.glDeleteTextures(1, [self.glid])
+            self.glid = None
 
 class GLTextureAtlas:
+    """
+    Texture -> GL texture names.
+    residency (ResidencyManager): VRAM budget, the textures the pipeline binds are touched by Use,
+                                  evicted textures are uploaded again on their next use.
+                                  Packed textures are charged and evicted with their whole GLTextureArray
+    packArrays (bool): 2D textures sharing a size and sampling state are packed in texture arrays, see GetArrayKey.
+                       The shaders address them by layer, see GetLayer and the TEXTURE_ARRAYS variant
+                       of assets/shaders/include/textures.glsl
+    Block compressed textures are uploaded with their encoded levels if the driver supports the format, see GetCompression
+    """
 
     WrapModes = {
         TextureWrapMode.REPEAT: GL.GL_REPEAT,
@@ -31,10 +143,80 @@ class GLTextureAtlas:
         (TextureFilter.LINEAR, TextureFilter.LINEAR): GL.GL_LINEAR_MIPMAP_LINEAR
     }
 
+    CompressedFormats = {
+        TextureCompression.BC1: GL_COMPRESSED_RGB_S3TC_DXT1_EXT,
+        TextureCompression.BC3: GL_COMPRESSED_RGBA_S3TC_DXT5_EXT,
+        TextureCompression.BC5: GL.GL_COMPRESSED_RG_RGTC2
+    }
+
+    # VRAM budget in bytes of new atlases, None for no limit
+    Budget = None
+    # Packing mode of new atlases
+    PackArrays = False
+
     def __init__(self):
         self.glid = None
         self.texturesToBake = []
         self.textures = dict()
+        self.residency = ResidencyManager("VRAM textures", GLTextureAtlas.Budget, self.EvictTexture)
+        self.packArrays = GLTextureAtlas.PackArrays
+        # Array key -> GLTextureArray
+        self.arrays = dict()
+        # Packed Texture -> GLTextureArray
+        self.packed = dict()
+        # Texture -> array key, computed once as the texels may be dropped after the upload
+        self.arrayKeys = dict()
+        # Compressed GL formats of the driver, queried on the first compressed texture
+        self.compressedFormats = None
+
+    def Use(self, texture:Texture) -> int:
+        """ Returns the GL name of a texture about to be bound, uploading it if it isn't resident """
+        self.residency.Touch(self.packed.get(texture, texture))
+        if texture not in self.textures:
+            self.AddTexture(texture)
+            self.BakeTextures()
+        return self.textures[texture]
+
+    def GetLayer(self, texture:Texture):
+        """ Layer of a packed texture in the array Use returned, None if it isn't packed """
+        array = self.packed.get(texture)
+        return array.layers.index(texture) if array is not None else None
+
+    def GetArrayKey(self, texture:Texture):
+        """
+        Textures with the same key are packed in the same array : size, levels and sampling state.
+        Returns None for the textures which are never packed (cubemaps, or packArrays disabled).
+        """
+        if not self.packArrays or texture.isCubemap:
+            return None
+        if texture not in self.arrayKeys:
+            height, width = texture.data.shape[0:2]
+            # 0 levels : the GPU generates them
+            levels = 1
+            if texture.useMipmaps:
+                levels = len(texture.mips) if texture.mips is not None else 0
+            self.arrayKeys[texture] = (width, height, levels, texture.wrapMode, texture.filter,
+                                       texture.useMipmaps, texture.mipLevelFilter, texture.mipMapFilter, self.GetCompression(texture))
+        return self.arrayKeys[texture]
+
+    def GetCompression(self, texture:Texture) -> TextureCompression:
+        """ Format the texture is uploaded in, NONE if it isn't compressed or the driver doesn't support its format """
+        if texture.compression == TextureCompression.NONE or texture.isCubemap:
+            return TextureCompression.NONE
+        if self.compressedFormats is None:
+            count = int(np.atleast_1d(GL.glGetIntegerv(GL.GL_NUM_COMPRESSED_TEXTURE_FORMATS))[0])
+            self.compressedFormats = set(np.atleast_1d(GL.glGetIntegerv(GL.GL_COMPRESSED_TEXTURE_FORMATS)).tolist()) if count else set()
+            # RGTC is core since GL 3.0, some drivers don't list it
+            self.compressedFormats.add(int(GL.GL_COMPRESSED_RG_RGTC2))
+            if int(GL_COMPRESSED_RGB_S3TC_DXT1_EXT) not in self.compressedFormats:
+                print("Warning: S3TC is not supported, BC1 & BC3 textures will be uploaded uncompressed")
+        if int(GLTextureAtlas.CompressedFormats[texture.compression]) not in self.compressedFormats:
+            return TextureCompression.NONE
+        return texture.compression
+
+    def EndFrame(self):
+        """ Evict the least recently bound textures above the VRAM budget """
+        self.residency.Trim()
 
     def AddTexture(self, texture:Texture):
         self.texturesToBake += [texture]
@@ -44,12 +226,18 @@ class GLTextureAtlas:
         if len(self.texturesToBake) == 0:
             return
 
-        textureIDs = [GL.glGenTextures(len(self.texturesToBake))]
+        if self.packArrays:
+            self.BakeArrays()
+            if len(self.texturesToBake) == 0:
+                return
+
+        textureIDs = np.atleast_1d(GL.glGenTextures(len(self.texturesToBake)))
         for index, glid in enumerate(textureIDs):
+            glid = int(glid)
             tex:Texture = self.texturesToBake[index]
 
             if tex.isCubemap:
-                GL.glBindTexture(GL.GL_TEXTURE_CUBE_MAP, glid)
+                GLState.BindTexture(0, GL.GL_TEXTURE_CUBE_MAP, glid)
                 for i, face in enumerate(tex.data):
                     height, width = face.shape[0:2]
                     GL.glTexImage2D(GL.GL_TEXTURE_CUBE_MAP_POSITIVE_X + i, 0, GL.GL_RGB, width, height, 0, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, face)
@@ -61,8 +249,17 @@ class GLTextureAtlas:
                 GL.glTexParameteri(GL.GL_TEXTURE_CUBE_MAP, GL.GL_TEXTURE_WRAP_R, GLTextureAtlas.WrapModes[tex.wrapMode])
             else:
                 height, width = tex.data.shape[0:2]
-                GL.glBindTexture(GL.GL_TEXTURE_2D, glid)
-                GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, width, height, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, tex.data)
+                GLState.BindTexture(0, GL.GL_TEXTURE_2D, glid)
+                compression = self.GetCompression(tex)
+                if compression != TextureCompression.NONE:
+                    # The encoded levels include the CPU mips
+                    levels = tex.blocks if tex.useMipmaps else tex.blocks[:1]
+                    for level, blocks in enumerate(levels):
+                        GL.glCompressedTexImage2D(GL.GL_TEXTURE_2D, level, GLTextureAtlas.CompressedFormats[compression],
+                                                  max(width >> level, 1), max(height >> level, 1), 0, blocks.nbytes, blocks)
+                    GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+                else:
+                    GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, width, height, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, tex.data)
                 
                 GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GLTextureAtlas.WrapModes[tex.wrapMode])
                 GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GLTextureAtlas.WrapModes[tex.wrapMode])
@@ -70,18 +267,102 @@ class GLTextureAtlas:
 
                 if tex.useMipmaps:
                     GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GLTextureAtlas.MipFilters[(tex.mipLevelFilter, tex.mipMapFilter)])
-                    GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
+                    if compression == TextureCompression.NONE and tex.mips is not None:
+                        # Levels built on the CPU, uploaded from the cache memory maps
+                        for level, data in enumerate(tex.mips[1:], 1):
+                            height, width = data.shape[0:2]
+                            GL.glTexImage2D(GL.GL_TEXTURE_2D, level, GL.GL_RGBA, width, height, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, data)
+                        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL, len(tex.mips) - 1)
+                    elif compression == TextureCompression.NONE:
+                        GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
                 else:
                     GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GLTextureAtlas.Filters[tex.filter])
 
             self.textures[tex] = glid
+            self.residency.Add(tex, self.GetSize(tex))
+            tex.ApplyResidencyPolicy()
 
         self.texturesToBake.clear()
 
+    def BakeArrays(self):
+        """ Pack the 2D textures to bake in their arrays, the cubemaps are left in texturesToBake """
+        groups = dict()
+        for tex in self.texturesToBake:
+            key = self.GetArrayKey(tex)
+            if key is not None:
+                groups.setdefault(key, []).append(tex)
+        self.texturesToBake = [tex for tex in self.texturesToBake if self.GetArrayKey(tex) is None]
+
+        for key, textures in groups.items():
+            array = self.arrays.setdefault(key, GLTextureArray(key))
+            added = textures
+            if array.Add(textures):
+                # All the layers are uploaded again in the larger array
+                array.Allocate()
+                textures = [tex for tex in array.layers if tex is not None]
+            array.Upload(textures)
+            # Charged again with its new capacity
+            self.residency.Add(array, array.GetSize())
+            for tex in textures:
+                self.textures[tex] = array.glid
+                self.packed[tex] = array
+            for tex in added:
+                tex.ApplyResidencyPolicy()
+
+    def Report(self):
+        layers = sum(len(array.layers) for array in self.arrays.values())
+        print("Texture arrays: %d arrays, %d / %d layers used, %d textures not packed" % (
+            len(self.arrays), len(self.packed), layers, len(self.textures) - len(self.packed)))
+
+    def GetSize(self, texture:Texture) -> int:
+        """ VRAM bytes of a texture, the GPU generated mips are a third of level 0 """
+        if texture.isCubemap:
+            return sum(face.nbytes for face in texture.data)
+        if self.GetCompression(texture) != TextureCompression.NONE:
+            return sum(blocks.nbytes for blocks in (texture.blocks if texture.useMipmaps else texture.blocks[:1]))
+        if not texture.useMipmaps:
+            return texture.data.nbytes
+        if texture.mips is not None:
+            return sum(level.nbytes for level in texture.mips)
+        return texture.data.nbytes * 4 // 3
+
+    def EvictTexture(self, resource):
+        """ Free the GL texture or the whole GLTextureArray, called by the residency manager """
+        if isinstance(resource, GLTextureArray):
+            self.DeleteArray(resource)
+            return
+        glid = self.textures.pop(resource, None)
+        if glid:
+            GLState.ForgetTexture(glid)
+            GL.glDeleteTextures(1, [glid])
+
+    def DeleteArray(self, array:GLTextureArray):
+        """ Free an array, its textures are packed again on their next use """
+        for tex in array.layers:
+            if tex is not None:
+                self.textures.pop(tex, None)
+                self.packed.pop(tex, None)
+        array.Delete()
+        self.arrays.pop(array.key, None)
+
+    def ReleaseLayer(self, texture:Texture):
+        """ Free the layer of a packed texture, the array keeps its VRAM until it is empty """
+        array = self.packed.pop(texture)
+        array.Remove(texture)
+        if array.GetTextureCount() == 0:
+            self.residency.Remove(array)
+            self.DeleteArray(array)
+
     def DeleteTexture(self, texture:Texture):
         tex = self.textures.pop(texture)
+        if texture in self.packed:
+            self.ReleaseLayer(texture)
+            return
+        self.residency.Remove(texture)
         if tex:
+            GLState.ForgetTexture(tex)
             GL.glDeleteTextures(tex)
 
     def __del__(self):
-        GL.glDeleteTextures(np.fromiter(self.textures.values(), 'u4'))
\ No newline at end of file
+        # Packed textures share the names of their arrays
+        GL.glDeleteTextures(np.fromiter(set(self.textures.values()), 'u4'))
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+OpenGL Uniform Buffer
+@author: Eikins
+"""
+
+import OpenGL.GL as GL
+
+import numpy as np
+
+class GLUniformBuffer:
+    """
+    Uniform buffer object attached to a fixed binding point,
+    shared by all the programs declaring the matching uniform block
+    """
+
+    def __init__(self, binding:int, size:int):
+        self.glid = None
+        self.binding = binding
+        self.size = size
+
+    def Init(self):
+        self.glid = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self.glid)
+        GL.glBufferData(GL.GL_UNIFORM_BUFFER, self.size, None, GL.GL_DYNAMIC_DRAW)
+        GL.glBindBufferBase(GL.GL_UNIFORM_BUFFER, self.binding, self.glid)
+
+    def Update(self, data:np.ndarray):
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self.glid)
+        GL.glBufferSubData(GL.GL_UNIFORM_BUFFER, 0, data.nbytes, data)
+
+    def __del__(self):
+        if self.glid is not None:
+            GL.glDeleteBuffers(1, [self.glid])
@@ -3,22 +3,36 @@ OpenGL Vertex Array
 @author: Eikins
 """
 
+import ctypes
+
 import OpenGL.GL as GL
 
 import numpy as np
 
 from sea3d.core import Mesh
 
+from sea3d.opengl import GLState
+
 class GLVertexArrayObject:
 
+    # Numpy type -> (GL type, normalized) of interleaved attributes
+    AttributeTypes = {
+        np.dtype(np.float32): (GL.GL_FLOAT, False),
+        np.dtype(np.float16): (GL.GL_HALF_FLOAT, False),
+        np.dtype(np.int16): (GL.GL_SHORT, True),
+        np.dtype(np.uint8): (GL.GL_UNSIGNED_BYTE, True)
+    }
+
     def __init__(self):
         self.glid = None
         self.buffers = []
         self.primitive = GL.GL_TRIANGLES
+        # Bytes uploaded to the GPU
+        self.size = 0
 
     def Init(self, attributes, indexes = None, usage = GL.GL_STATIC_DRAW):
         self.glid = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.glid)
+        GLState.BindVertexArray(self.glid)
 
         n, size = 0, 0
 
@@ -27,34 +41,82 @@ class GLVertexArrayObject:
                 # Bind a new buffer and upload its data to GPU
                 self.buffers += [GL.glGenBuffers(1)]
                 # Ensuire numpy format
-                data = np.array(data, np.float32, copy = False)
+                data = np.asarray(data, np.float32)
                 n, size = data.shape # pylint: disable=unpacking-non-sequence  # pylint/issues/3139
                 
                 GL.glEnableVertexAttribArray(loc)
                 GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[-1])
                 GL.glBufferData(GL.GL_ARRAY_BUFFER, data, usage)
+                self.size += data.nbytes
                 GL.glVertexAttribPointer(loc, size, GL.GL_FLOAT, False, 0, None)
 
+        self.InitIndexes(indexes, n, usage)
+        GLState.BindVertexArray(0)
+
+    def InitInterleaved(self, vertices:np.ndarray, locations:dict, indexes = None, usage = GL.GL_STATIC_DRAW):
+        """
+        Upload a structured array in one interleaved buffer, locations maps its fields to attribute locations.
+        Field types are converted by GL, see AttributeTypes.
+        """
+        self.glid = GL.glGenVertexArrays(1)
+        GLState.BindVertexArray(self.glid)
+
+        self.buffers += [GL.glGenBuffers(1)]
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[-1])
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, vertices, usage)
+        self.size += vertices.nbytes
+
+        stride = vertices.dtype.itemsize
+        for name, loc in locations.items():
+            fieldType, offset = vertices.dtype.fields[name][:2]
+            glType, normalized = GLVertexArrayObject.AttributeTypes[fieldType.base]
+            GL.glEnableVertexAttribArray(loc)
+            GL.glVertexAttribPointer(loc, fieldType.shape[0], glType, normalized, stride, ctypes.c_void_p(offset))
+
+        self.InitIndexes(indexes, len(vertices), usage)
+        GLState.BindVertexArray(0)
+
+    def InitIndexes(self, indexes, n:int, usage = GL.GL_STATIC_DRAW):
+        """ Upload the index buffer of the bound vertex array and choose the draw command """
         if indexes is not None:
             self.buffers += [GL.glGenBuffers(1)]
-            index_buffer = np.array(indexes, np.int32, copy = False)
+            index_buffer = np.asarray(indexes, np.int32)
             GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.buffers[-1])
             GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, index_buffer, usage)
+            self.size += index_buffer.nbytes
             self.draw_command = GL.glDrawElements
             self.arguments = (index_buffer.size, GL.GL_UNSIGNED_INT, None)
         else:
             self.draw_command = GL.glDrawArrays
             self.arguments = (0, n)
 
-        GL.glBindVertexArray(0)
+    def Bind(self):
+        GLState.BindVertexArray(self.glid)
 
-    def Draw(self):
-        GL.glBindVertexArray(self.glid)
-        self.draw_command(self.primitive, *self.arguments)
-        GL.glBindVertexArray(0)
+    def Draw(self, primitive = None):
+        """ primitive overrides the default one, a vertex array can be shared by tessellated and classic materials """
+        # The vertex array stays bound, the next draw of the same mesh won't rebind it
+        GLState.BindVertexArray(self.glid)
+        self.draw_command(self.primitive if primitive is None else primitive, *self.arguments)
 
-    def __del__(self):
+    def DrawInstanced(self, count:int, primitive = None):
+        GLState.BindVertexArray(self.glid)
+        primitive = self.primitive if primitive is None else primitive
+        if self.draw_command == GL.glDrawElements:
+            GL.glDrawElementsInstanced(primitive, *self.arguments, count)
+        else:
+            GL.glDrawArraysInstanced(primitive, *self.arguments, count)
+
+    def Delete(self):
+        """ Free the GPU buffers now instead of waiting for the garbage collector """
         if self.glid is not None:
+            GLState.ForgetVertexArray(self.glid)
             GL.glDeleteVertexArrays(1, [self.glid])
-        if not self.buffers:
+            self.glid = None
+        if self.buffers:
             GL.glDeleteBuffers(len(self.buffers), self.buffers)
+            self.buffers = []
+        self.size = 0
+
+    def __del__(self):
+        self.Delete()
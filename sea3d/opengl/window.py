@@ -11,7 +11,7 @@ import numpy as np
 
 from itertools import cycle
 
-from sea3d.core import Scene, Time, Material, PropertyBlock, Layers
+from sea3d.core import Scene, Time, Material, PropertyBlock, Layers, Texture
 from sea3d.core.components import Camera, Renderer
 from sea3d.math import Vector3, Quaternion, Matrix4
 
@@ -110,4 +110,10 @@ class GLWindow:
             lastFrameTime = Time.time
 
             # Poll for and process events
-            glfw.poll_events()
\ No newline at end of file
+            glfw.poll_events()
+
+        self.pipeline.meshCache.Report()
+        self.pipeline.textureAtlas.residency.Report()
+        if self.pipeline.textureAtlas.packArrays:
+            self.pipeline.textureAtlas.Report()
+        Texture.Residency.Report()
\ No newline at end of file
@@ -2,6 +2,9 @@ import unittest
 
 from sea3d.math.quaternion import Quaternion
 from sea3d.math.vector3 import Vector3
+import sea3d.math.numpy_utils as NumpyUtils
+
+import numpy as np
 
 class TestMath(unittest.TestCase):
 
@@ -24,6 +27,38 @@ class TestMath(unittest.TestCase):
         self.assertEqual(i * i, -1)
         self.assertEqual((3 * i - k) * (2 + j + k), 1 + 7 * i - 3 * j + k)
 
+    def test_frustum(self):
+        # Left handed perspective looking at +z, near 1 and far 100
+        projection = np.array([[1, 0, 0, 0],
+                               [0, 1, 0, 0],
+                               [0, 0, -101 / 99, 200 / 99],
+                               [0, 0, 1, 0]])
+        planes = NumpyUtils.FrustumPlanes(projection)
+        print("Frustum planes :")
+        print(planes)
+
+        centers = np.array([[0, 0, 10], [0, 0, -10], [0, 0, 150], [30, 0, 10], [10.5, 0, 10]])
+        radii = np.ones(len(centers))
+        visible = NumpyUtils.SpheresInFrustum(planes, centers, radii)
+        self.assertEqual(list(visible), [True, False, False, False, True])
+
+        # Scaled spheres keep bounding their mesh
+        matrices = np.array([np.diag((1, 3, 2, 1))] * 2, float)
+        matrices[1, :3, 3] = (0, 0, 5)
+        worldCenters, worldRadii = NumpyUtils.TransformSpheres(matrices, np.array([[0, 0, 1], [0, 0, 0]]), np.ones(2))
+        self.assertTrue(np.allclose(worldCenters, [[0, 0, 2], [0, 0, 5]]))
+        self.assertTrue(np.allclose(worldRadii, [3, 3]))
+
+    def test_octahedral(self):
+        directions = NumpyUtils.Normalize(np.random.default_rng(0).normal(size = (1000, 3)))
+        directions[:3] = np.eye(3) * -1
+        encoded = NumpyUtils.OctEncode(directions)
+        decoded = NumpyUtils.OctDecode(encoded)
+        error = np.degrees(np.arccos(np.clip(np.sum(decoded * directions, axis = 1), -1, 1)))
+        print("Octahedral int16 max error : %.4f degrees" % error.max())
+        self.assertEqual(encoded.dtype, np.int16)
+        self.assertLess(error.max(), 0.01)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
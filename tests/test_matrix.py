@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 
 from sea3d.math.quaternion import Quaternion
 from sea3d.math.vector3 import Vector3
@@ -25,5 +26,11 @@ class TestMatrix(unittest.TestCase):
         print("\nRotation of ((-1, 1, 0), -30°) :")
         print(Matrix4.Quaternion(Quaternion.AxisAngle(Vector3(-1, 1, 0), -30)))
 
+        print("\nAffine inverse of a TRS matrix :")
+        M = Matrix4.Translate(Vector3(1, 2, 3)) @ Matrix4.Quaternion(Quaternion.AxisAngle(Vector3(0, 1, 0), 45)) @ Matrix4.Scale(Vector3(2, 1, 0.5))
+        print(Matrix4.AffineInverse(M))
+        self.assertTrue(np.allclose(Matrix4.AffineInverse(M), np.linalg.inv(M), atol = 1e-6))
+        self.assertTrue(np.allclose(Matrix4.AffineInverse(np.stack((M, M))) @ M, np.identity(4), atol = 1e-6))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
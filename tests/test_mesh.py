@@ -0,0 +1,173 @@
+import unittest
+import numpy as np
+
+from sea3d.core import Mesh, Scene, SceneObject, Material, Layers
+from sea3d.core.components import Renderer
+from sea3d.math import NumpyUtils, Matrix4, Vector3, Quaternion
+
+def ComputeTangentsPerTriangle(mesh:Mesh, uvChannel:int = 0):
+    """ Reference implementation, one linear system per triangle """
+    tangents = np.zeros(mesh.normals.shape)
+    for tri in mesh.indexes:
+        E = mesh.vertices[tri][1:] - mesh.vertices[tri][0]
+        dUV = mesh.uvs[uvChannel][tri][1:] - mesh.uvs[uvChannel][tri][0]
+        try:
+            T = np.linalg.solve(dUV, E)[0]
+        except np.linalg.LinAlgError:
+            T = np.array([1, 0, 0])
+        tangents[tri] += T
+    return NumpyUtils.Normalize(tangents)
+
+class TestMesh(unittest.TestCase):
+
+    def test_tangents(self):
+        mesh = Mesh.Plane((10, 10), (8, 8))
+        # Bend the plane and add noise to the uvs, so the tangents are not all the same
+        rng = np.random.default_rng(0)
+        mesh.vertices[:, 1] = np.sin(mesh.vertices[:, 0])
+        mesh.uvs[0] += rng.random(mesh.uvs[0].shape, np.float32) * 0.01
+        # Degenerate uvs on the first triangle
+        mesh.uvs[0][mesh.indexes[0]] = 0.5
+
+        expected = ComputeTangentsPerTriangle(mesh)
+        mesh.ComputeTangents()
+        print("Tangents :")
+        print(mesh.tangents[:4])
+        self.assertTrue(np.allclose(mesh.tangents, expected, atol = 1e-6))
+
+    def test_combine(self):
+        quad = Mesh.Quad()
+        matrices = [Matrix4.Translate(Vector3(i, 0, 2)) @ Matrix4.Quaternion(Quaternion.AxisAngle(Vector3(0, 1, 0), 30 * i))
+                    for i in range(4)]
+
+        # Reference : pairwise merging of transformed copies
+        expected = Mesh.Transform(quad, matrices[0])
+        for matrix in matrices[1:]:
+            expected = Mesh.Combine(expected, Mesh.Transform(quad, matrix))
+
+        combined = Mesh.CombineMany([(quad, matrix) for matrix in matrices])
+        replicated = Mesh.Replicate(quad, np.stack(matrices))
+        print("Replicated indexes :")
+        print(replicated.indexes)
+
+        for mesh in (combined, replicated):
+            self.assertTrue(np.allclose(mesh.vertices, expected.vertices, atol = 1e-5))
+            self.assertTrue(np.allclose(mesh.normals, expected.normals, atol = 1e-5))
+            self.assertTrue(np.allclose(mesh.uvs[0], expected.uvs[0]))
+            self.assertTrue(np.array_equal(mesh.indexes, expected.indexes))
+
+        # Meshes without tangents
+        bare = Mesh(quad.vertices, quad.normals, quad.uvs, quad.indexes)
+        transformed = Mesh.Transform(bare, matrices[1], np.float32)
+        self.assertEqual(transformed.vertices.dtype, np.float32)
+        self.assertIsNone(transformed.tangents)
+
+    def test_optimize_indices(self):
+        mesh = Mesh.Plane((10, 10), (30, 30))
+        # Shuffled triangles have almost no vertex cache locality
+        rng = np.random.default_rng(0)
+        mesh.indexes = mesh.indexes[rng.permutation(len(mesh.indexes))]
+        triangles = np.sort(mesh.vertices[mesh.indexes].reshape(len(mesh.indexes), -1), axis = 0)
+
+        stats = mesh.OptimizeIndices(overdraw = True, verbose = True)
+        self.assertLess(stats["acmr"][1], stats["acmr"][0])
+        self.assertLess(stats["acmr"][1], 1.0)
+
+        # Same triangles, the vertices are now sorted by first use
+        optimized = np.sort(mesh.vertices[mesh.indexes].reshape(len(mesh.indexes), -1), axis = 0)
+        self.assertTrue(np.allclose(optimized, triangles))
+        self.assertTrue(np.array_equal(np.unique(mesh.indexes.ravel(), return_index = True)[1],
+                                       np.sort(np.unique(mesh.indexes.ravel(), return_index = True)[1])))
+
+    def test_lods(self):
+        mesh = Mesh.Plane((10, 10), (20, 20))
+        mesh.vertices[:, 1] = 0.5 * np.sin(mesh.vertices[:, 0] * 0.5)
+        count = mesh.BuildLODs((0.5, 0.25), maxError = 0.1)
+        print("LOD triangles :", [len(mesh.GetLODIndexes(lod)) for lod in range(count)], "errors :", mesh.lodErrors)
+
+        self.assertGreater(count, 1)
+        for lod in range(1, count):
+            self.assertLess(len(mesh.GetLODIndexes(lod)), len(mesh.GetLODIndexes(lod - 1)))
+            self.assertLessEqual(mesh.lodErrors[lod - 1], 0.1)
+
+        # LODs survive the cache records
+        copy = Mesh.FromArrays(mesh.ToArrays())
+        self.assertEqual(copy.GetLODCount(), count)
+
+    def test_weld(self):
+        plane = Mesh.Plane((10, 10), (8, 8))
+        # One vertex per triangle corner, as imported by assimp, plus an unused vertex
+        corners = np.asarray(plane.indexes).ravel()
+        attributes = [np.concatenate((data[corners], data[:1])) for data in (plane.vertices, plane.normals, plane.tangents, plane.uvs[0])]
+        mesh = Mesh(attributes[0], attributes[1], [attributes[3]], np.arange(len(corners)).reshape(-1, 3), attributes[2])
+        mesh.vertices[-1] = 100
+        mesh.vertices[1] += 1e-5
+
+        stats = mesh.Weld(verbose = True)
+        self.assertEqual(stats["unreferenced"], 1)
+        self.assertEqual(stats["vertices"][1], len(plane.vertices) + 1)
+        self.assertTrue(np.allclose(mesh.vertices[mesh.indexes], plane.vertices[plane.indexes], atol = 1e-4))
+
+        stats = mesh.Weld(1e-3)
+        self.assertEqual(stats["vertices"][1], len(plane.vertices))
+
+    def test_raycast(self):
+        mesh = Mesh.Plane((10, 10), (30, 30))
+        mesh.vertices[:, 1] = 0.5 * np.sin(mesh.vertices[:, 0])
+        bvh = mesh.GetBVH()
+        print("BVH :", bvh.GetNodeCount(), "nodes, depth", bvh.GetDepth())
+
+        rng = np.random.default_rng(0)
+        origins = np.stack((rng.uniform(-6, 6, 100), np.full(100, 3.0), rng.uniform(-6, 6, 100)), axis = 1)
+        directions = np.stack((rng.normal(0, 0.2, 100), -np.ones(100), rng.normal(0, 0.2, 100)), axis = 1)
+        distances, triangles, _, _ = bvh.RaycastMany(origins, directions)
+
+        # Brute force reference
+        corners = mesh.vertices[mesh.indexes.reshape(-1, 3)]
+        e1, e2 = corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]
+        for origin, direction, distance in zip(origins, directions, distances):
+            p = np.cross(direction, e2)
+            det = np.sum(e1 * p, axis = 1)
+            s = origin - corners[:, 0]
+            q = np.cross(s, e1)
+            u, v, t = np.sum(s * p, axis = 1) / det, q @ direction / det, np.sum(e2 * q, axis = 1) / det
+            hit = (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+            self.assertAlmostEqual(distance, t[hit].min() if np.any(hit) else np.inf)
+
+        # Scene queries go through the object transform and layers
+        scene = Scene("Raycast")
+        plane = SceneObject("Plane")
+        plane.transform.SetPosition(Vector3(0, -2, 0))
+        plane.transform.SetScale(Vector3(2, 1, 2))
+        plane.AddComponent(Renderer(mesh, Material("Test", "std", "std")))
+        scene.AddObject(plane)
+        hit = scene.Raycast((1, 10, 1), (0, -1, 0))
+        print(hit)
+        self.assertIs(hit.object, plane)
+        self.assertAlmostEqual(hit.distance, 12 - 0.5 * np.sin(0.5), places = 2)
+        self.assertGreater(hit.normal[1], 0)
+        self.assertIsNone(scene.Raycast((1, 10, 1), (0, 1, 0)))
+        self.assertIsNone(scene.Raycast((1, 10, 1), (0, -1, 0), Layers.WATER))
+        self.assertEqual(len(scene.RaycastMany(origins, directions)), 100)
+
+    def test_clusters(self):
+        mesh = Mesh.Plane((10, 10), (20, 20))
+        # The cones follow the winding culled by GL, not the vertex normals
+        mesh.normals = -np.asarray(mesh.normals)
+        triangles = np.sort(np.sort(np.asarray(mesh.indexes).reshape(-1, 3), axis = 1), axis = 0)
+        count = mesh.BuildClusters(64)
+        sizes = np.diff(mesh.clusterOffsets)
+        print("Clusters :", count, "sizes", sizes)
+        self.assertTrue(np.all(sizes <= 64))
+        self.assertTrue(np.array_equal(np.sort(np.sort(mesh.indexes.reshape(-1, 3), axis = 1), axis = 0), triangles))
+
+        # The spheres bound their triangles, the cones of a flat plane point up and are thin
+        for cluster in range(count):
+            corners = mesh.vertices[mesh.indexes[mesh.clusterOffsets[cluster]:mesh.clusterOffsets[cluster + 1]].ravel()]
+            center, radius = mesh.clusterSpheres[cluster, :3], mesh.clusterSpheres[cluster, 3]
+            self.assertLessEqual(np.linalg.norm(corners - center, axis = 1).max(), radius + 1e-6)
+        self.assertTrue(np.allclose(mesh.clusterCones, [0, 1, 0, 0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+
+from sea3d.core import Mesh, Scene, SceneObject, Material
+from sea3d.core.components import Renderer
+from sea3d.math import Vector3
+from sea3d.opengl import GLRenderPipeline, GLDrawItem
+
+class TestRenderPipeline(unittest.TestCase):
+
+    def test_batch_lods(self):
+        pipeline = GLRenderPipeline(Scene("Test"), None, 16, 16)
+        # No GL context, every material supports instancing and the matrices are kept
+        pipeline.PrepareInstancing = lambda material, defines = (): True
+        uploads = []
+        pipeline.instanceBuffer.Upload = uploads.append
+
+        mesh = Mesh.Quad()
+        material = Material("Fish", "standard", "standard")
+        template = Renderer(mesh, material)
+        items = []
+        # A school across LOD thresholds, the draw list order alternates LODs
+        for i, lod in enumerate([0, 1, 0, 2, 1, 0, 2]):
+            fish = SceneObject("Fish%d" % i)
+            fish.transform.SetPosition(Vector3(i, 0, 0))
+            renderer = template.Copy()
+            renderer.lod = lod
+            fish.AddComponent(renderer)
+            items.append(GLDrawItem(0, renderer, None))
+
+        batches = pipeline.BatchInstances(items)
+        print("Batches :", [(batchItems[0].renderer.lod, len(batchItems), instance) for batchItems, instance in batches])
+        self.assertEqual([(batchItems[0].renderer.lod, len(batchItems), instance) for batchItems, instance in batches],
+                         [(0, 3, 0), (1, 2, 3), (2, 2, 5)])
+        # The instance matrices follow the batches
+        order = [item for batchItems, _ in batches for item in batchItems]
+        self.assertTrue(np.allclose(uploads[0][:, 0, 3], [items.index(item) for item in order]))
+
+    def test_key_ids(self):
+        pipeline = GLRenderPipeline(Scene("Test"), None, 16, 16)
+        pipeline.materialBatch.AddMaterial = lambda material, defines = (): None
+        material = Material("Fish", "standard", "standard")
+        renderers = [Renderer(Mesh.Quad(), material) for _ in range(3)]
+        for i, renderer in enumerate(renderers):
+            SceneObject("Fish%d" % i).AddComponent(renderer)
+            pipeline.OnComponentAdded(renderer)
+        ids = [pipeline.vertexArrayIDs.ids[renderer.mesh] for renderer in renderers]
+
+        # Despawned meshes are not kept alive, their ids are reused
+        pipeline.OnComponentRemoved(renderers[1])
+        self.assertNotIn(renderers[1].mesh, pipeline.vertexArrayIDs.ids)
+        spawned = Renderer(Mesh.Quad(), material)
+        SceneObject("Spawned").AddComponent(spawned)
+        pipeline.OnComponentAdded(spawned)
+        print("Vertex array ids :", ids, "->", pipeline.vertexArrayIDs.ids[spawned.mesh])
+        self.assertEqual(pipeline.vertexArrayIDs.ids[spawned.mesh], ids[1])
+        self.assertEqual(len(pipeline.vertexArrayIDs), 3)
+        self.assertEqual(pipeline.programIDs.references[pipeline.drawItems[spawned].states[0]], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
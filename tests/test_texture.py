@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from sea3d.core import Texture, TextureCompression, ResidencyManager, ResidencyPolicy, BlockCompression
+from sea3d.opengl import GLTextureAtlas, GLTextureArray
+
+class TestTexture(unittest.TestCase):
+
+    def test_mip_chain(self):
+        checker = np.zeros((4, 6, 4), np.uint8)
+        checker[::2, ::2] = 255
+        checker[1::2, 1::2] = 255
+        levels = Texture.BuildMipChain(checker)
+        print("Mip sizes :", [level.shape for level in levels])
+        self.assertEqual([level.shape[:2] for level in levels], [(4, 6), (2, 3), (1, 1)])
+
+        # Half black, half white is 50% in linear space, alpha is linear
+        print("Gamma correct average :", levels[1][0, 0], "linear average :", Texture.BuildMipChain(checker, linear = True)[1][0, 0])
+        self.assertTrue(np.array_equal(levels[1][0, 0], [186, 186, 186, 128]))
+        self.assertTrue(np.array_equal(Texture.BuildMipChain(checker, linear = True)[1][0, 0], [128, 128, 128, 128]))
+
+    def test_cache(self):
+        file = "assets/textures/pbr/default/normal.png"
+        if not os.path.exists(file):
+            self.skipTest("missing " + file)
+        directory = Texture.Cache.directory
+        Texture.Cache.directory = tempfile.mkdtemp()
+        try:
+            cold = Texture.DecodeLevels(file, "RGBA", True, True)
+            warm = Texture.DecodeLevels(file, "RGBA", True, True)
+            Texture.ReportLoading()
+            self.assertIsInstance(warm[0], np.memmap)
+            self.assertEqual(len(cold), len(warm))
+            for coldLevel, warmLevel in zip(cold, warm):
+                self.assertTrue(np.array_equal(coldLevel, warmLevel))
+        finally:
+            shutil.rmtree(Texture.Cache.directory, ignore_errors = True)
+            Texture.Cache.directory = directory
+
+    def test_residency(self):
+        evicted = []
+        residency = ResidencyManager("Test", 100, evicted.append)
+        for name in "abc":
+            residency.Add(name, 40)
+        # Everything was used this frame
+        residency.Trim()
+        self.assertEqual(evicted, [])
+
+        residency.Touch("a")
+        residency.Trim()
+        residency.Report()
+        self.assertEqual(evicted, ["b"])
+        self.assertEqual(residency.usedBytes, 80)
+        self.assertFalse(residency.Touch("b"))
+        self.assertEqual((residency.hits, residency.misses, residency.evictions), (1, 1, 1))
+
+    def test_residency_policy(self):
+        location = "pbr/default/normal.png"
+        if not os.path.exists("assets/textures/" + location):
+            self.skipTest("missing " + location)
+        directory = Texture.Cache.directory
+        Texture.Cache.directory = tempfile.mkdtemp()
+        try:
+            data, mips, _, _ = Texture.LoadLevels(location)
+            texture = Texture(location, data, mips)
+            texture.fromFile = True
+            texture.residencyPolicy = ResidencyPolicy.DROP_AFTER_UPLOAD
+            texture.ApplyResidencyPolicy()
+            print("Host bytes after the upload :", texture.GetHostSize())
+            self.assertEqual(texture.GetHostSize(), 0)
+            # Read again from the cache
+            self.assertTrue(np.array_equal(texture.data, data))
+
+            texture.Pin()
+            texture.ApplyResidencyPolicy()
+            self.assertGreater(texture.GetHostSize(), 0)
+        finally:
+            Texture.Residency.Remove(texture)
+            Texture.Residency.Pin(texture, False)
+            shutil.rmtree(Texture.Cache.directory, ignore_errors = True)
+            Texture.Cache.directory = directory
+
+    def test_array_packing(self):
+        atlas = GLTextureAtlas()
+        atlas.packArrays = True
+        textures = [Texture(name, np.zeros((8, 8, 4), np.uint8)) for name in "abc"]
+        textures.append(Texture("d", np.zeros((4, 8, 4), np.uint8)))
+        keys = [atlas.GetArrayKey(texture) for texture in textures]
+        print("Array keys :", [key[0:3] for key in keys])
+        self.assertEqual(keys[0], keys[2])
+        self.assertNotEqual(keys[0], keys[3])
+
+        array = GLTextureArray(keys[0])
+        self.assertTrue(array.Add(textures[0:2]))
+        self.assertFalse(array.Add([]))
+        # Freed layers are reused before growing
+        array.Remove(textures[0])
+        self.assertFalse(array.Add(textures[2:3]))
+        self.assertEqual(array.layers, [textures[2], textures[1]])
+        self.assertTrue(array.Add(textures[0:1]))
+        self.assertEqual(len(array.layers), 4)
+        # The free layer is charged too, GPU generated mips are a third of level 0
+        self.assertEqual(array.GetSize(), 4 * (8 * 8 * 4 * 4 // 3))
+
+    def test_block_compression(self):
+        # Smooth gradients with odd sizes, the last blocks are padded
+        y, x = np.mgrid[0:37, 0:42]
+        data = np.stack((x * 6, y * 6, (x + y) * 3, 255 - y * 6), axis = -1).clip(0, 255).astype(np.uint8)
+        for compression, minimum in (("BC1", 35), ("BC3", 35), ("BC5", 45)):
+            blocks = BlockCompression.Encode(data, compression)
+            decoded = BlockCompression.Decode(blocks, compression, 37, 42)
+            channels = BlockCompression.Channels[compression]
+            psnr = BlockCompression.PSNR(data[..., :channels], decoded[..., :channels])
+            print("%s : %s blocks, %.2f dB PSNR, %.1f:1" % (compression, blocks.shape, psnr, data.nbytes / blocks.nbytes))
+            self.assertEqual(blocks.shape, (10, 11, BlockCompression.BlockBytes[compression]))
+            self.assertGreater(psnr, minimum)
+
+        # A solid red block : color0 = 0xF800, all indices 0
+        red = np.zeros((4, 4, 4), np.uint8)
+        red[..., 0] = red[..., 3] = 255
+        self.assertEqual(BlockCompression.Encode(red, "BC1").ravel().tolist(), [0x00, 0xF8, 0x00, 0xF8, 0, 0, 0, 0])
+        self.assertTrue(np.array_equal(BlockCompression.Decode(BlockCompression.Encode(red, "BC3"), "BC3", 4, 4), red))
+
+    def test_compressed_cache(self):
+        file = "assets/textures/pbr/default/normal.png"
+        if not os.path.exists(file):
+            self.skipTest("missing " + file)
+        directory = Texture.Cache.directory
+        Texture.Cache.directory = tempfile.mkdtemp()
+        try:
+            levels = Texture.DecodeLevels(file, "RGBA", True, True)
+            cold = Texture.CompressLevels(file, levels, TextureCompression.BC5, True)
+            warm = Texture.CompressLevels(file, levels, TextureCompression.BC5, True)
+            Texture.ReportCompression()
+            self.assertEqual(len(cold), len(levels))
+            self.assertIsInstance(warm[0], np.memmap)
+            for coldLevel, warmLevel in zip(cold, warm):
+                self.assertTrue(np.array_equal(coldLevel, warmLevel))
+            self.assertEqual(Texture.CompressionStatistics[file][0], "BC5")
+        finally:
+            shutil.rmtree(Texture.Cache.directory, ignore_errors = True)
+            Texture.Cache.directory = directory
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,8 @@ import numpy as np
 
 from sea3d.math.quaternion import Quaternion
 from sea3d.math.vector3 import Vector3
-from sea3d.core.components.transform import Transform
+from sea3d.math.matrix4 import Matrix4
+from sea3d.core.transform import Transform
 
 class TestTransform(unittest.TestCase):
 
@@ -20,5 +21,18 @@ class TestTransform(unittest.TestCase):
 
         print(t12.GetTRSMatrix() @ np.array([0, 0, 0, 1]))
 
+        # Matrices are cached until the transform or one of its parents changes
+        version = t12._version
+        t12.GetTRSMatrix()
+        self.assertEqual(t12._version, version)
+        t0.Translate(Vector3(0, 2, 0))
+        t12.GetTRSMatrix()
+        self.assertNotEqual(t12._version, version)
+
+        inverse = t12.GetInverseTRSMatrix()
+        print(inverse)
+        self.assertTrue(np.allclose(inverse, np.linalg.inv(t12.GetTRSMatrix()), atol = 1e-5))
+        self.assertIs(t12.GetInverseTRSMatrix(), inverse)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file